@@ -12,6 +12,13 @@ import httpx
 from decimal import Decimal, ROUND_HALF_UP
 
 from app.core.config import settings
+from app.core.http_client import http_clients
+from app.services.image_pool import image_pool
+from app.services.ai_upstream import ai_upstreams
+from app.services.result_cache import ResultCacheService
+from app.services.generation_queue import GenerationJobService
+from app.services.artwork_timing import ArtworkTimingService
+from app.services.artwork_reaper import ArtworkReaperService
 from app.db.session import get_db
 from app.models.admin import Admin
 from app.models.user import User
@@ -523,6 +530,24 @@ async def update_artwork_status(
     return artwork
 
 
+@router.post("/artworks/{artwork_id}/reprocess", response_model=ArtworkSchema)
+async def reprocess_artwork(
+    artwork_id: int,
+    db: Session = Depends(get_db),
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    重新生成作品（不扣除用户积分，任务进入批量通道）
+    """
+    success, result = ArtworkService.reprocess(db, artwork_id)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "重新生成作品失败")
+        )
+    return result["artwork"]
+
+
 @router.delete("/artworks/{artwork_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_artwork(
     artwork_id: int,
@@ -744,6 +769,106 @@ async def get_style_usage_stats(
     return result
 
 
+@router.get("/stats/http-pools", response_model=Dict[str, Any])
+async def get_http_pool_stats(
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取各上游HTTP连接池的使用情况（当前进程）
+    """
+    return http_clients.stats()
+
+
+@router.get("/stats/image-pool", response_model=Dict[str, Any])
+async def get_image_pool_stats(
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取图片处理进程池的使用情况（当前进程）
+    """
+    return image_pool.stats()
+
+
+@router.get("/stats/ai-upstreams", response_model=Dict[str, Any])
+async def get_ai_upstream_stats(
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取各AI上游的健康状态（当前进程）
+    """
+    return ai_upstreams.stats()
+
+
+@router.get("/stats/api-keys", response_model=Dict[str, Any])
+async def get_api_key_stats(
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取各AI上游API Key的令牌桶余量和限流次数（当前进程，Key已脱敏）
+    """
+    return ai_upstreams.key_stats()
+
+
+@router.get("/stats/hedging", response_model=Dict[str, Any])
+async def get_hedging_stats(
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取对冲请求的触发率和胜出率（当前进程）
+    """
+    return ai_upstreams.hedge_stats()
+
+
+@router.get("/stats/generation-lanes", response_model=Dict[str, Any])
+async def get_generation_lane_stats(
+    db: Session = Depends(get_db),
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取各调度通道的排队数和等待时长（领取统计为当前进程）
+    """
+    return GenerationJobService.lane_stats(db)
+
+
+@router.get("/stats/artwork-timings", response_model=Dict[str, Any])
+async def get_artwork_timing_stats(
+    group_by: str = Query("style", description="分组方式: style-按风格, upstream-按AI上游"),
+    hours: int = Query(24, ge=1, le=24 * 30, description="统计最近多少小时内创建的作品"),
+    db: Session = Depends(get_db),
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取作品生成各阶段耗时的分位数（P50/P90/P99）
+    """
+    if group_by not in ("style", "upstream"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="group_by只能是style或upstream"
+        )
+    return ArtworkTimingService.percentiles(db, group_by=group_by, hours=hours)
+
+
+@router.get("/stats/artwork-reaper", response_model=Dict[str, int])
+async def get_artwork_reaper_stats(
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取卡住作品清理任务的统计（当前进程）
+    """
+    return ArtworkReaperService.stats()
+
+
+@router.get("/stats/result-cache", response_model=Dict[str, Any])
+async def get_result_cache_stats(
+    db: Session = Depends(get_db),
+    current_admin: Admin = Depends(AdminService.get_current_admin),
+) -> Any:
+    """
+    获取生成结果缓存的命中统计（当前进程）和缓存记录数
+    """
+    return ResultCacheService.stats(db)
+
+
 # 分类管理
 @router.get("/categories", response_model=List[CategorySchema])
 async def read_categories(
@@ -1464,9 +1589,9 @@ async def admin_refund_order(
             "refundReason": "管理员发起退款"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(refund_url, json=refund_data)
-            result = response.json()
+        client = http_clients.get("payment")
+        response = await client.post(refund_url, json=refund_data)
+        result = response.json()
         
         if response.status_code != 200 or result.get("code") != 200:
             raise HTTPException(
@@ -1,25 +1,58 @@
+import asyncio
+import json
 import logging
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.core.config import settings
+from app.db.session import get_db, SessionLocal
+from app.db.async_session import get_async_db
 from app.models.user import User
 from app.models.artwork import Artwork as ArtworkModel
 from app.models.like import Like
 from app.schemas.artwork import (
-    Artwork, CreateArtworkRequest, ArtworkUpdate, ArtworkListParams, ArtworkStatus,
-    PublishArtworkRequest
+    Artwork, CreateArtworkRequest, CreateArtworkBatchRequest, ArtworkUpdate, ArtworkListParams, ArtworkStatus,
+    PublishArtworkRequest, SourceUploadRequest, SourceUploadResponse
 )
-from app.services.artwork import ArtworkService
-from app.core.deps import get_current_active_user, get_optional_current_user
+from app.services.artwork import ArtworkService, AsyncArtworkService
+from app.services.like import AsyncLikeService
+from app.services.file_storage import FileStorageService
+from app.services.progress_events import progress_broker, TERMINAL_EVENTS
+from app.core.deps import get_current_active_user, get_current_active_user_async, get_optional_current_user_async
+from utils.multipart_stream import iter_multipart_file
 
 logger = logging.getLogger(__name__)
 
+# multipart请求体中除文件内容外的字段和分隔符允许的字节数
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
 router = APIRouter()
 
 
+@router.post("/upload-url", response_model=SourceUploadResponse)
+async def create_source_upload_url(
+    request: SourceUploadRequest = Body(default_factory=SourceUploadRequest),
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    """
+    申请原图直传URL
+
+    客户端将图片直接PUT到对象存储（需携带返回的headers），再以 source_object_key 调用创建作品接口，
+    图片不经过API服务器中转
+    """
+    success, result = FileStorageService.create_upload_url(current_user.id, request.content_type)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "生成上传地址失败")
+        )
+    return result
+
+
 @router.post("", response_model=Artwork)
 async def create_artwork(
     request: CreateArtworkRequest,
@@ -34,10 +67,18 @@ async def create_artwork(
         user_id=current_user.id,
         style_id=request.style_id,
         image_base64=request.image_base64,
-        image_url=request.image_url
+        image_url=request.image_url,
+        source_object_key=request.source_object_key
     )
     
     if not success:
+        # 超出并发限制时快速拒绝，并告知客户端建议的重试时间
+        if "retry_after" in result:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=result.get("error", "请求过于频繁"),
+                headers={"Retry-After": str(result["retry_after"])}
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=result.get("error", "创建作品失败")
@@ -46,6 +87,95 @@ async def create_artwork(
     return result["artwork"]
 
 
+@router.post("/batch", response_model=List[Artwork])
+async def create_artwork_batch(
+    request: CreateArtworkBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    """
+    用同一张原图按多个风格批量创建作品
+    
+    原图只上传一次，积分一次性扣除，任一风格校验失败时不创建任何作品
+    """
+    success, result = await ArtworkService.create_batch(
+        db=db,
+        user_id=current_user.id,
+        style_ids=request.style_ids,
+        image_base64=request.image_base64,
+        image_url=request.image_url,
+        source_object_key=request.source_object_key
+    )
+    
+    if not success:
+        if "retry_after" in result:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=result.get("error", "请求过于频繁"),
+                headers={"Retry-After": str(result["retry_after"])}
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "创建作品失败")
+        )
+    
+    return result["artworks"]
+
+
+@router.post("/upload", response_model=List[Artwork])
+async def create_artwork_from_upload(
+    request: Request,
+    style_ids: List[int] = Query(..., description="风格ID，可传多个（同一张原图批量生成）"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    """
+    上传原图并创建作品
+    
+    请求体为图片二进制（Content-Type: image/*）或 multipart/form-data（文件字段 file），
+    边接收边上传到存储，不在内存中缓存整张图片；超过 MAX_UPLOAD_SIZE 时立即拒绝
+    """
+    content_type = request.headers.get("content-type", "")
+    is_multipart = content_type.startswith("multipart/form-data")
+    if not is_multipart and not content_type.startswith("image/") and content_type != "application/octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="请求体须为图片或multipart/form-data"
+        )
+    
+    # 根据Content-Length提前拒绝过大的图片，不读取请求体
+    max_size = settings.get_int("MAX_UPLOAD_SIZE", 5 * 1024 * 1024)
+    content_length = request.headers.get("content-length", "")
+    allowed_length = max_size + (MULTIPART_OVERHEAD_BYTES if is_multipart else 0)
+    if content_length.isdigit() and int(content_length) > allowed_length:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"图片大小不能超过 {max_size // (1024 * 1024)}MB"
+        )
+    
+    chunks = iter_multipart_file(request.stream(), content_type) if is_multipart else request.stream()
+    success, result = await ArtworkService.create_from_stream(
+        db=db,
+        user_id=current_user.id,
+        style_ids=style_ids,
+        chunks=chunks
+    )
+    
+    if not success:
+        if "retry_after" in result:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=result.get("error", "请求过于频繁"),
+                headers={"Retry-After": str(result["retry_after"])}
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "创建作品失败")
+        )
+    
+    return result["artworks"]
+
+
 @router.get("", response_model=List[Artwork])
 async def list_artworks(
     skip: int = 0,
@@ -55,8 +185,8 @@ async def list_artworks(
     style_id: Optional[int] = Query(None, description="风格ID筛选"),
     order_by: str = Query("created_at", description="排序字段: created_at, likes_count, views_count"),
     order_desc: bool = Query(True, description="是否降序排序"),
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_current_active_user_async)
 ) -> Any:
     """
     获取作品列表，只返回当前用户自己的作品
@@ -76,19 +206,17 @@ async def list_artworks(
         order_desc=order_desc
     )
     
-    artworks_db = ArtworkService.get_all(db=db, params=params)
+    artworks_db = await AsyncArtworkService.get_all(db=db, params=params)
     
     # 处理点赞状态
     artworks_response = []
     liked_artwork_ids = set()
     if current_user: # 检查用户是否登录
-        artwork_ids = [art.id for art in artworks_db]
-        if artwork_ids:
-            likes = db.query(Like.artwork_id).filter(
-                Like.user_id == current_user.id, 
-                Like.artwork_id.in_(artwork_ids)
-            ).all()
-            liked_artwork_ids = {like[0] for like in likes}
+        liked_artwork_ids = await AsyncLikeService.liked_artwork_ids(
+            db=db,
+            user_id=current_user.id,
+            artwork_ids=[art.id for art in artworks_db]
+        )
 
     for artwork_db in artworks_db:
         artwork_data = Artwork.from_orm(artwork_db).dict() # 使用 from_orm 转换为 Pydantic 模型再转字典
@@ -105,8 +233,8 @@ async def list_gallery_artworks(
     style_id: Optional[int] = Query(None, description="风格ID筛选"),
     order_by: str = Query("created_at", description="排序字段: created_at, likes_count, views_count"),
     order_desc: bool = Query(True, description="是否降序排序"),
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_optional_current_user_async)
 ) -> Any:
     """
     获取公开画廊的作品
@@ -122,19 +250,17 @@ async def list_gallery_artworks(
         order_desc=order_desc
     )
     
-    artworks_db = ArtworkService.get_all(db=db, params=params)
+    artworks_db = await AsyncArtworkService.get_all(db=db, params=params)
     
     # 处理点赞状态
     artworks_response = []
     liked_artwork_ids = set()
     if current_user: # 检查用户是否登录
-        artwork_ids = [art.id for art in artworks_db]
-        if artwork_ids:
-            likes = db.query(Like.artwork_id).filter(
-                Like.user_id == current_user.id, 
-                Like.artwork_id.in_(artwork_ids)
-            ).all()
-            liked_artwork_ids = {like[0] for like in likes}
+        liked_artwork_ids = await AsyncLikeService.liked_artwork_ids(
+            db=db,
+            user_id=current_user.id,
+            artwork_ids=[art.id for art in artworks_db]
+        )
 
     for artwork_db in artworks_db:
         artwork_data = Artwork.from_orm(artwork_db).dict() # 使用 from_orm 转换为 Pydantic 模型再转字典
@@ -158,8 +284,8 @@ async def list_user_public_artworks(
     style_id: Optional[int] = Query(None, description="风格ID筛选"),
     order_by: str = Query("created_at", description="排序字段: created_at, likes_count, views_count"),
     order_desc: bool = Query(True, description="是否降序排序"),
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_current_active_user_async)
 ) -> Any:
     """
     获取指定用户的公开作品
@@ -176,19 +302,17 @@ async def list_user_public_artworks(
         order_desc=order_desc
     )
     
-    artworks_db = ArtworkService.get_all(db=db, params=params)
+    artworks_db = await AsyncArtworkService.get_all(db=db, params=params)
     
     # 处理点赞状态
     artworks_response = []
     liked_artwork_ids = set()
     if current_user: # 检查用户是否登录
-        artwork_ids = [art.id for art in artworks_db]
-        if artwork_ids:
-            likes = db.query(Like.artwork_id).filter(
-                Like.user_id == current_user.id, 
-                Like.artwork_id.in_(artwork_ids)
-            ).all()
-            liked_artwork_ids = {like[0] for like in likes}
+        liked_artwork_ids = await AsyncLikeService.liked_artwork_ids(
+            db=db,
+            user_id=current_user.id,
+            artwork_ids=[art.id for art in artworks_db]
+        )
 
     for artwork_db in artworks_db:
         artwork_data = Artwork.from_orm(artwork_db).dict() # 使用 from_orm 转换为 Pydantic 模型再转字典
@@ -201,13 +325,13 @@ async def list_user_public_artworks(
 @router.get("/{artwork_id}", response_model=Artwork)
 async def get_artwork(
     artwork_id: int,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_current_active_user_async)
 ) -> Any:
     """
     获取特定作品
     """
-    artwork_db = ArtworkService.get_by_id(db=db, artwork_id=artwork_id)
+    artwork_db = await AsyncArtworkService.get_by_id(db=db, artwork_id=artwork_id)
     if not artwork_db:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -223,22 +347,22 @@ async def get_artwork(
             detail="无权访问此作品"
         )
     
+    # 使用 Pydantic 模型转换（查看次数的提交会结束事务，先转换）
+    artwork_response = Artwork.from_orm(artwork_db)
+    
     # 增加查看次数（如果是公开作品且不是作者本人查看）
     if artwork_db.is_public and not is_owner:
-        ArtworkService.increment_view_count(db=db, artwork_id=artwork_id)
+        views_count = await AsyncArtworkService.increment_view_count(db=db, artwork_id=artwork_id)
+        if views_count is not None:
+            artwork_response.views_count = views_count
     
     # 处理点赞状态
-    is_liked = False
     if current_user:
-        like = db.query(Like).filter(
-            Like.user_id == current_user.id,
-            Like.artwork_id == artwork_id
-        ).first()
-        is_liked = like is not None
-
-    # 使用 Pydantic 模型转换并设置点赞状态
-    artwork_response = Artwork.from_orm(artwork_db)
-    artwork_response.is_liked_by_current_user = is_liked
+        artwork_response.is_liked_by_current_user = await AsyncLikeService.check_user_liked(
+            db=db,
+            user_id=current_user.id,
+            artwork_id=artwork_id
+        )
     
     return artwork_response
 
@@ -329,6 +453,24 @@ async def delete_artwork(
     # 状态码为204的路由不应返回任何内容
 
 
+@router.post("/{artwork_id}/cancel", response_model=Artwork)
+async def cancel_artwork(
+    artwork_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    """
+    取消生成中的作品，作品标记为失败并退还积分
+    """
+    success, result = ArtworkService.cancel(db=db, artwork_id=artwork_id, user_id=current_user.id)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND if result["error"] == "作品不存在" else status.HTTP_400_BAD_REQUEST,
+            detail=result["error"]
+        )
+    return result["artwork"]
+
+
 @router.get("/{artwork_id}/progress")
 async def get_artwork_progress(
     artwork_id: int,
@@ -365,16 +507,135 @@ async def get_artwork_progress(
     return result
 
 
+def _format_sse(event_id: str, event: str, data: Dict[str, Any]) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _load_progress_snapshot(artwork_id: int) -> Dict[str, Any]:
+    """从数据库读取作品进度快照（在线程池中执行，使用独立的短会话）"""
+    db = SessionLocal()
+    try:
+        return ArtworkService.get_artwork_progress(db=db, artwork_id=artwork_id)
+    finally:
+        db.close()
+
+
+def _snapshot_event_name(snapshot: Dict[str, Any]) -> str:
+    if not snapshot.get("success"):
+        return "error"
+    if snapshot["status"] in TERMINAL_EVENTS:
+        return snapshot["status"]
+    return "progress"
+
+
+async def _progress_event_stream(request: Request, artwork_id: int, resume_token: Optional[str]):
+    """
+    作品进度的SSE事件流：先发送快照（或补发续传令牌之后的事件），再推送实时事件，收到终态后结束
+    """
+    keepalive = settings.get_float("PROGRESS_STREAM_KEEPALIVE", 15.0)
+    max_seconds = settings.get_float("PROGRESS_STREAM_MAX_SECONDS", 900.0)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    queue, replay = progress_broker.subscribe(artwork_id, resume_token)
+    try:
+        if replay is None:
+            token = progress_broker.current_token(artwork_id)
+            snapshot = await loop.run_in_executor(None, _load_progress_snapshot, artwork_id)
+            event = _snapshot_event_name(snapshot)
+            yield _format_sse(token, event, snapshot)
+            if event in TERMINAL_EVENTS or event == "error":
+                return
+            last_progress = snapshot.get("progress")
+        else:
+            last_progress = None
+            for token, event, payload in replay:
+                yield _format_sse(token, event, payload)
+                if event in TERMINAL_EVENTS:
+                    return
+                last_progress = payload.get("progress", last_progress)
+
+        received = False
+        while loop.time() - started < max_seconds:
+            if await request.is_disconnected():
+                return
+            try:
+                token, event, payload = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                # 生成任务可能在其他进程中执行，一个心跳周期内没有本地事件时回查数据库
+                if not received:
+                    snapshot = await loop.run_in_executor(None, _load_progress_snapshot, artwork_id)
+                    event = _snapshot_event_name(snapshot)
+                    if event != "progress" or snapshot.get("progress") != last_progress:
+                        last_progress = snapshot.get("progress")
+                        yield _format_sse(progress_broker.current_token(artwork_id), event, snapshot)
+                        if event in TERMINAL_EVENTS or event == "error":
+                            return
+                received = False
+                yield ": keepalive\n\n"
+                continue
+
+            received = True
+            last_progress = payload.get("progress", last_progress)
+            yield _format_sse(token, event, payload)
+            if event in TERMINAL_EVENTS:
+                return
+    finally:
+        progress_broker.unsubscribe(artwork_id, queue)
+
+
+@router.get("/{artwork_id}/progress/stream")
+async def stream_artwork_progress(
+    artwork_id: int,
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="断线续传令牌，优先使用 Last-Event-ID 请求头"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    """
+    以SSE推送作品处理进度
+
+    事件类型：progress / queued / generating / completed / failed；
+    每个事件的 id 为续传令牌，断线重连时通过 Last-Event-ID 请求头或 last_event_id 参数携带
+    """
+    owner_id = db.query(ArtworkModel.user_id).filter(
+        ArtworkModel.id == artwork_id,
+        ArtworkModel.is_deleted == False
+    ).scalar()
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="作品不存在"
+        )
+
+    # 检查权限：只能由作者查看进度
+    if owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权查看此作品进度"
+        )
+
+    # 推送期间不占用数据库连接
+    db.close()
+
+    resume_token = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        _progress_event_stream(request, artwork_id, resume_token),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/{artwork_id}/view", status_code=status.HTTP_200_OK)
 async def increment_artwork_view(
     artwork_id: int,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_current_active_user_async)
 ) -> Any:
     """
     增加作品的访问次数
     """
-    artwork_db = ArtworkService.get_by_id(db=db, artwork_id=artwork_id)
+    artwork_db = await AsyncArtworkService.get_by_id(db=db, artwork_id=artwork_id)
     if not artwork_db:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -390,9 +651,10 @@ async def increment_artwork_view(
         )
     
     # 增加查看次数（如果不是作者本人查看）
+    views_count = artwork_db.views_count
     if not is_owner:
-        updated_artwork = ArtworkService.increment_view_count(db=db, artwork_id=artwork_id)
-        if not updated_artwork:
+        views_count = await AsyncArtworkService.increment_view_count(db=db, artwork_id=artwork_id)
+        if views_count is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="更新访问次数失败"
@@ -400,4 +662,4 @@ async def increment_artwork_view(
     else:
         logger.info("作者本人查看作品，不增加访问次数")
     
-    return {"success": True, "views_count": artwork_db.views_count + (0 if is_owner else 1)} 
\ No newline at end of file
+    return {"success": True, "views_count": views_count} 
\ No newline at end of file
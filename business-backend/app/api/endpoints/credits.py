@@ -2,25 +2,27 @@ from typing import Any, List, Dict
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.models.user import User
 from app.schemas.credit import CreditRecord, AdRewardRequest, UpdateCreditsRequest
-from app.services.credit import CreditService
-from app.core.deps import get_current_active_user
+from app.services.credit import CreditService, AsyncCreditService
+from app.core.deps import get_current_active_user, get_current_active_user_async
 
 router = APIRouter()
 
 
 @router.get("/balance", response_model=Dict[str, int])
 async def get_credits_balance(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, int]:
     """
     获取用户积分余额
     """
-    balance = CreditService.get_user_credit_balance(db=db, user_id=current_user.id)
+    balance = await AsyncCreditService.get_user_credit_balance(db=db, user_id=current_user.id)
     if balance is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -34,13 +36,13 @@ async def get_credits_balance(
 async def get_credit_records(
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> List[CreditRecord]:
     """
     获取用户积分记录
     """
-    records = CreditService.get_user_credit_records(
+    records = await AsyncCreditService.get_user_credit_records(
         db=db, 
         user_id=current_user.id,
         skip=skip,
@@ -53,13 +55,13 @@ async def get_credit_records(
 @router.post("/ad-reward", response_model=Dict[str, Any])
 async def reward_from_ad(
     request: AdRewardRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, Any]:
     """
     从广告获取积分奖励
     """
-    success, result = CreditService.ad_reward(
+    success, result = await AsyncCreditService.ad_reward(
         db=db,
         user_id=current_user.id,
         ad_type=request.ad_type
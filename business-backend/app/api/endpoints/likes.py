@@ -1,13 +1,13 @@
 from typing import Any, List, Dict
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.models.user import User
 from app.schemas.like import Like
-from app.services.like import LikeService
-from app.core.deps import get_current_active_user
+from app.services.like import AsyncLikeService
+from app.core.deps import get_current_active_user_async
 
 router = APIRouter()
 
@@ -15,13 +15,13 @@ router = APIRouter()
 @router.post("/{artwork_id}")
 async def like_artwork(
     artwork_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, Any]:
     """
     点赞作品
     """
-    success, result = LikeService.like_artwork(
+    success, result = await AsyncLikeService.like_artwork(
         db=db, 
         user_id=current_user.id, 
         artwork_id=artwork_id
@@ -39,13 +39,13 @@ async def like_artwork(
 @router.delete("/{artwork_id}")
 async def unlike_artwork(
     artwork_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, Any]:
     """
     取消点赞作品
     """
-    success, result = LikeService.unlike_artwork(
+    success, result = await AsyncLikeService.unlike_artwork(
         db=db, 
         user_id=current_user.id, 
         artwork_id=artwork_id
@@ -63,13 +63,13 @@ async def unlike_artwork(
 @router.get("/check/{artwork_id}")
 async def check_user_liked(
     artwork_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, bool]:
     """
     检查用户是否已点赞作品
     """
-    liked = LikeService.check_user_liked(
+    liked = await AsyncLikeService.check_user_liked(
         db=db, 
         user_id=current_user.id, 
         artwork_id=artwork_id
@@ -2,13 +2,15 @@ from typing import Any, List, Dict, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Header
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.models.user import User
 from app.models.order import Order as OrderModel
 from app.schemas.order import CreatePaymentRequest, Order, OrderDetail, PaymentCallbackRequest
-from app.services.order import OrderService
-from app.core.deps import get_current_active_user, get_current_admin_user
+from app.services.order import OrderService, AsyncOrderService
+from app.core.deps import get_current_active_user, get_current_active_user_async, get_current_admin_user
 from app.tasks import add_order_to_check_queue
 from app.core.config import settings
 
@@ -18,13 +20,13 @@ router = APIRouter()
 @router.post("/create", response_model=Dict[str, Any])
 async def create_order(
     request: CreatePaymentRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, Any]:
     """
     创建订单
     """
-    success, result = OrderService.create_order(
+    success, result = await AsyncOrderService.create_order(
         db=db,
         user_id=current_user.id,
         product_id=request.product_id
@@ -51,14 +53,14 @@ async def create_order(
 async def pay_order(
     order_id: int,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, Any]:
     """
     支付订单
     """
     # 查询订单
-    order_detail = OrderService.get_order_detail(db=db, order_id=order_id, user_id=current_user.id)
+    order_detail = await AsyncOrderService.get_order_detail(db=db, order_id=order_id, user_id=current_user.id)
     if not order_detail:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -127,13 +129,13 @@ async def payment_callback(
 async def get_orders(
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> List[Order]:
     """
     获取用户订单列表
     """
-    orders = OrderService.get_user_orders(
+    orders = await AsyncOrderService.get_user_orders(
         db=db,
         user_id=current_user.id,
         skip=skip,
@@ -146,13 +148,13 @@ async def get_orders(
 @router.get("/{order_id}", response_model=Dict[str, Any])
 async def get_order_detail(
     order_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ) -> Dict[str, Any]:
     """
     获取订单详情
     """
-    order_detail = OrderService.get_order_detail(
+    order_detail = await AsyncOrderService.get_order_detail(
         db=db,
         order_id=order_id,
         user_id=current_user.id
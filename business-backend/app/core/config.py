@@ -27,6 +27,15 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "xxxxxxxxxxx")
     DB_NAME: str = os.getenv("DB_NAME", "ai_style_gallery")
     DATABASE_URI: Optional[str] = None
+    # 连接池配置（创建引擎时读取，只支持环境变量）
+    # 同步引擎（生成任务、后台任务和其余接口）与异步引擎（热点接口）的连接池相互独立，
+    # 每个进程最多占用 DB_POOL_SIZE + DB_MAX_OVERFLOW + ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW 个连接（默认20），
+    # 乘以进程数后不能超过MySQL的 max_connections
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))  # 同步连接池保持的连接数
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "5"))  # 同步连接池满时允许额外创建的连接数
+    ASYNC_DB_POOL_SIZE: int = int(os.getenv("ASYNC_DB_POOL_SIZE", "5"))  # 异步连接池保持的连接数
+    ASYNC_DB_MAX_OVERFLOW: int = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "5"))  # 异步连接池满时允许额外创建的连接数
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "10"))  # 等待空闲连接的最长秒数，超时抛出异常（两个连接池共用）
 
     @field_validator("DATABASE_URI", mode="before")
     def assemble_db_uri(cls, v: Optional[str], info: ValidationInfo) -> str:
@@ -53,6 +62,14 @@ class Settings(BaseSettings):
     COS_BUCKET: str = os.getenv("COS_BUCKET", "xxxxxxxxxxx")
     COS_DOMAIN: str = os.getenv("COS_DOMAIN", "xxxxxxxxxxx")
     COS_UPLOAD_DIR: str = os.getenv("COS_UPLOAD_DIR", "xxxx")
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "cos")  # 文件存储后端：cos-腾讯云COS，memory-进程内存（仅用于本地压测，只支持环境变量）
+
+    @field_validator("STORAGE_BACKEND")
+    def check_storage_backend(cls, v: str) -> str:
+        v = v.lower()
+        if v not in ("cos", "memory"):
+            raise ValueError(f"不支持的存储后端: {v}")
+        return v
     
     # OpenAI配置 (用于图像风格转换)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "xxxxxxxxxxx")
@@ -61,6 +78,66 @@ class Settings(BaseSettings):
     OPENAI_IMAGE_MODEL: str = os.getenv("OPENAI_IMAGE_MODEL", "xxxxxxxxxxx")
     OPENAI_TIMEOUT: int = os.getenv("OPENAI_TIMEOUT", 600)
     
+    # AI上游池配置，JSON数组，每项包含 name、url、api_key，可选 weight、max_concurrency、model；为空时使用 OPENAI_API_URL
+    AI_UPSTREAMS: str = os.getenv("AI_UPSTREAMS", "")
+    AI_FIRST_TOKEN_TIMEOUT: float = 60.0  # 上游首字节（含响应头）超时秒数，超时视为上游失败
+    AI_UPSTREAM_WINDOW: int = 20  # 统计上游成功率的最近请求数
+    AI_UPSTREAM_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断
+    AI_UPSTREAM_COOLDOWN: float = 30.0  # 熔断冷却秒数（连续熔断时翻倍，最多10倍）
+    AI_UPSTREAM_ACQUIRE_TIMEOUT: float = 30.0  # 所有上游并发或API Key额度已满时最长等待秒数
+    GENERATION_HEDGE_TIER: str = "off"  # 对冲请求的用户范围：off-仅按风格开关，paid-付费用户，all-所有用户
+    GENERATION_HEDGE_DELAY: float = 20.0  # 主上游多少秒没有进度时发起对冲请求
+    
+    # API Key池配置，OPENAI_API_KEYS 为JSON数组（字符串或包含 key、rpm、burst、max_concurrency 的对象）或逗号分隔的字符串，
+    # 为空时使用 OPENAI_API_KEY；AI_UPSTREAMS 中的上游通过 api_keys 配置各自的Key
+    OPENAI_API_KEYS: str = os.getenv("OPENAI_API_KEYS", "")
+    API_KEY_RPM: int = 0  # 每个Key默认每分钟请求数，0表示不限制
+    API_KEY_BURST: int = 0  # 每个Key令牌桶容量，0表示与rpm相同
+    API_KEY_COOLDOWN: float = 60.0  # Key收到429且没有Retry-After时的冷却秒数
+    
+    # 生成任务队列配置
+    GENERATION_WORKER_CONCURRENCY: int = 4  # 每个进程同时执行的生成任务数
+    GENERATION_JOB_MAX_ATTEMPTS: int = 3  # 单个任务最大执行次数
+    GENERATION_RETRY_BASE_DELAY: float = 10.0  # 重试退避基础秒数
+    GENERATION_JOB_LEASE_SECONDS: int = 900  # 任务租约时长，超时视为worker失联
+    GENERATION_POLL_INTERVAL: float = 2.0  # 空闲worker轮询任务表的间隔秒数
+    GENERATION_CANCEL_POLL_INTERVAL: float = 2.0  # 执行中的任务检查用户是否已取消的间隔秒数
+    GENERATION_MAX_ACTIVE_JOBS: int = 200  # 全局最多排队+执行中的任务数，0表示不限制
+    GENERATION_MAX_ACTIVE_JOBS_PER_USER: int = 2  # 单个用户最多排队+执行中的任务数，0表示不限制
+    GENERATION_AVG_JOB_SECONDS: float = 60.0  # 无历史数据时估算的单任务耗时
+    GENERATION_PAID_LANE_DAYS: int = 30  # 最近多少天内有已支付订单的用户进入付费通道，0表示不限时间
+    GENERATION_LANE_WEIGHT_PAID: int = 6  # 付费通道权重
+    GENERATION_LANE_WEIGHT_NORMAL: int = 3  # 普通通道权重
+    GENERATION_LANE_WEIGHT_BULK: int = 1  # 批量/重新生成通道权重
+    GENERATION_LANE_MAX_WAIT: float = 120.0  # 任务等待超过该秒数时其通道优先领取，0表示关闭饥饿保护
+    ARTWORK_STUCK_SECONDS: int = 1800  # 处理中的作品超过该秒数没有任何更新视为卡住，由清理任务处理
+    ARTWORK_REAPER_INTERVAL: int = 60  # 清理卡住作品的间隔秒数
+    ARTWORK_REAPER_BATCH_SIZE: int = 100  # 每轮最多处理的卡住作品数
+    ARTWORK_BATCH_MAX_STYLES: int = 6  # 同一张原图批量生成时最多选择的风格数
+    RESULT_CACHE_ENABLED: bool = False  # 是否启用生成结果缓存（还需在风格上开启）
+    RESULT_CACHE_TTL_HOURS: int = 72  # 结果缓存默认有效小时数
+    RESULT_CACHE_PURGE_INTERVAL: int = 3600  # 清理过期结果缓存的间隔秒数
+    IMAGE_POOL_WORKERS: int = 2  # 图片处理进程数
+    IMAGE_POOL_MAX_PENDING: int = 32  # 图片处理最多同时提交的任务数（执行中+排队中）
+    IMAGE_POOL_QUEUE_TIMEOUT: float = 30.0  # 图片处理排队等待的最长秒数
+    WATERMARK_ENABLED: bool = False  # 是否给生成结果添加水印
+    WATERMARK_QUALITY: int = 75  # 添加水印后重新编码JPEG/WebP的质量（1-100，75与Pillow默认一致）
+    IMAGE_VARIANTS_ENABLED: bool = True  # 作品完成时是否生成缩略图和中等尺寸的派生图（WebP和JPEG）
+    IMAGE_THUMBNAIL_SIZE: int = 360  # 缩略图最长边像素
+    IMAGE_MEDIUM_SIZE: int = 1080  # 中等尺寸图最长边像素
+    IMAGE_VARIANT_QUALITY: int = 80  # 派生图的编码质量（1-100）
+    IMAGE_PROBE_BYTES: int = 64 * 1024  # 读取原图尺寸时请求的文件头字节数
+    COS_MULTIPART_PART_SIZE: int = 5 * 1024 * 1024  # 流式上传到COS的分片大小（字节），不小于1MB
+    PROGRESS_FLUSH_INTERVAL: float = 2.0  # 生成进度合并写入数据库的间隔秒数
+    PROGRESS_FLUSH_BATCH_SIZE: int = 200  # 单条UPDATE最多写入的作品数
+    PROGRESS_EVENT_BUFFER_SIZE: int = 50  # 每个作品保留的最近进度事件数（用于断线续传）
+    PROGRESS_EVENT_RETENTION_SECONDS: float = 300.0  # 无订阅者的作品事件保留秒数
+    PROGRESS_STREAM_KEEPALIVE: float = 15.0  # 进度推送的心跳间隔秒数
+    PROGRESS_STREAM_MAX_SECONDS: float = 900.0  # 单个进度推送连接的最长持续秒数
+    
+    # 出站HTTP连接池配置
+    HTTP2_ENABLED: bool = False  # 是否启用HTTP/2（需安装h2）
+    
     # 积分配置
     DEFAULT_CREDITS: int = 20  # 新用户默认积分
     AD_REWARD_CREDITS: int = 10  # 广告奖励积分
@@ -68,6 +145,7 @@ class Settings(BaseSettings):
     
     # 图片上传配置
     MAX_UPLOAD_SIZE: int = 5 * 1024 * 1024  # 5MB
+    DIRECT_UPLOAD_EXPIRES: int = 600  # 原图直传URL的有效秒数
     
     # 广告平台配置
     AD_PLATFORM: str = "微信广告"
@@ -289,6 +367,30 @@ class DynamicSettings:
     def DATABASE_URI(self) -> str:
         return self._base_settings.DATABASE_URI
 
+    @property
+    def DB_POOL_SIZE(self) -> int:
+        return self._base_settings.DB_POOL_SIZE
+
+    @property
+    def DB_MAX_OVERFLOW(self) -> int:
+        return self._base_settings.DB_MAX_OVERFLOW
+
+    @property
+    def ASYNC_DB_POOL_SIZE(self) -> int:
+        return self._base_settings.ASYNC_DB_POOL_SIZE
+
+    @property
+    def ASYNC_DB_MAX_OVERFLOW(self) -> int:
+        return self._base_settings.ASYNC_DB_MAX_OVERFLOW
+
+    @property
+    def DB_POOL_TIMEOUT(self) -> int:
+        return self._base_settings.DB_POOL_TIMEOUT
+
+    @property
+    def STORAGE_BACKEND(self) -> str:
+        return self._base_settings.STORAGE_BACKEND
+
 
 # 创建设置实例
 settings = DynamicSettings()
\ No newline at end of file
@@ -5,8 +5,10 @@ from jwt import PyJWTError
 import jwt
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.models.user import User
 from app.models.admin import Admin
 from app.core.config import settings
@@ -86,6 +88,75 @@ def get_current_active_user(current_user: User = Depends(get_current_user)) -> U
     return current_user 
 
 
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+) -> User:
+    """
+    获取当前用户（异步会话，供使用 get_async_db 的路由使用）
+    """
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        token_data = TokenPayload(**payload)
+    except (PyJWTError, ValidationError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # 从数据库获取用户
+    user = await db.get(User, token_data.sub) if token_data.sub is not None else None
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    
+    # 检查用户是否被封禁
+    if user.is_blocked:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="用户已被封禁"
+        )
+    
+    return user
+
+
+async def get_optional_current_user_async(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+) -> Optional[User]:
+    """
+    获取当前用户（异步会话，可选，未认证时返回None）
+    """
+    if not token:
+        return None
+        
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        token_data = TokenPayload(**payload)
+    except (PyJWTError, ValidationError):
+        return None
+    
+    # 从数据库获取用户
+    user = await db.get(User, token_data.sub) if token_data.sub is not None else None
+    if not user or user.is_blocked:
+        return None
+    
+    return user
+
+
+async def get_current_active_user_async(current_user: User = Depends(get_current_user_async)) -> User:
+    """
+    获取当前活跃用户（异步会话，未被封禁）
+    """
+    if current_user.is_blocked:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="用户已被封禁"
+        )
+    return current_user
+
+
 async def get_current_admin_user(
     current_user: User = Depends(get_current_active_user),
 ) -> User:
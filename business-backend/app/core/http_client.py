@@ -0,0 +1,177 @@
+import importlib.util
+import logging
+import time
+from typing import Any, Dict
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# 各上游的默认连接池配置，可通过系统配置 HTTP_{NAME}_TIMEOUT / HTTP_{NAME}_CONNECT_TIMEOUT /
+# HTTP_{NAME}_MAX_CONNECTIONS / HTTP_{NAME}_MAX_KEEPALIVE 覆盖（NAME为大写的上游名）
+UPSTREAM_DEFAULTS: Dict[str, Dict[str, float]] = {
+    # AI图像生成服务，SSE流可能持续数分钟
+    "ai": {"timeout": 600.0, "connect_timeout": 10.0, "max_connections": 100, "max_keepalive": 20},
+    # 图片下载（COS原图、AI生成结果图）
+    "storage": {"timeout": 60.0, "connect_timeout": 10.0, "max_connections": 50, "max_keepalive": 20},
+    # Java支付网关
+    "payment": {"timeout": 10.0, "connect_timeout": 5.0, "max_connections": 20, "max_keepalive": 10},
+    # 微信开放接口
+    "wechat": {"timeout": 10.0, "connect_timeout": 5.0, "max_connections": 20, "max_keepalive": 10},
+}
+
+
+class _MeteredByteStream(httpx.AsyncByteStream):
+    """包装响应流，在响应关闭时归还在途请求计数"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, stats: Dict[str, Any]):
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stats["in_flight"] -= 1
+        await self._stream.aclose()
+
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    """带请求计数的传输层，用于统计连接池使用情况"""
+
+    def __init__(self, stats: Dict[str, Any], **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        start = time.monotonic()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self._stats["errors"] += 1
+            self._stats["in_flight"] -= 1
+            raise
+        self._stats["total_header_ms"] += (time.monotonic() - start) * 1000
+        response.stream = _MeteredByteStream(response.stream, self._stats)
+        return response
+
+    def pool_stats(self) -> Dict[str, int]:
+        connections = list(self._pool.connections)
+        return {
+            "connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+        }
+
+
+class HttpClientRegistry:
+    """
+    应用级共享的httpx客户端注册表，每个上游一个长连接池
+    在应用启动时创建，关闭时释放
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, _MeteredTransport] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _http2_enabled() -> bool:
+        """是否启用HTTP/2，需要安装h2依赖（pip install httpx[http2]）"""
+        if not settings.get_bool("HTTP2_ENABLED", False):
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("已配置HTTP2_ENABLED，但未安装h2依赖，使用HTTP/1.1")
+            return False
+        return True
+
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        defaults = UPSTREAM_DEFAULTS.get(name, UPSTREAM_DEFAULTS["storage"])
+        prefix = f"HTTP_{name.upper()}"
+        timeout = settings.get_float(f"{prefix}_TIMEOUT", defaults["timeout"])
+        connect_timeout = settings.get_float(f"{prefix}_CONNECT_TIMEOUT", defaults["connect_timeout"])
+        max_connections = settings.get_int(f"{prefix}_MAX_CONNECTIONS", int(defaults["max_connections"]))
+        max_keepalive = settings.get_int(f"{prefix}_MAX_KEEPALIVE", int(defaults["max_keepalive"]))
+
+        stats = self._stats.setdefault(name, {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "total_header_ms": 0.0,
+        })
+        transport = _MeteredTransport(
+            stats,
+            http2=self._http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=30.0,
+            ),
+        )
+        self._transports[name] = transport
+
+        logger.info(f"创建HTTP连接池 {name}: 超时 {timeout}s, 最大连接数 {max_connections}, 长连接数 {max_keepalive}")
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+
+    async def startup(self):
+        """应用启动时创建所有上游的客户端"""
+        for name in UPSTREAM_DEFAULTS:
+            if name not in self._clients:
+                self._clients[name] = self._create_client(name)
+
+    async def shutdown(self):
+        """应用关闭时释放所有连接"""
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"关闭HTTP连接池 {name} 失败: {str(e)}")
+        self._clients.clear()
+        self._transports.clear()
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        获取指定上游的共享客户端，未启动时（如脚本中调用）按需创建
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create_client(name)
+            self._clients[name] = client
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各连接池的使用情况
+        """
+        result = {}
+        for name, stats in self._stats.items():
+            responses = stats["requests"] - stats["errors"]
+            item = {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "in_flight": stats["in_flight"],
+                "avg_header_ms": round(stats["total_header_ms"] / responses, 2) if responses > 0 else 0.0,
+            }
+            transport = self._transports.get(name)
+            if transport is not None:
+                try:
+                    item.update(transport.pool_stats())
+                except Exception as e:
+                    logger.debug(f"读取连接池 {name} 状态失败: {str(e)}")
+            result[name] = item
+        return result
+
+
+# 创建单例实例
+http_clients = HttpClientRegistry()
@@ -0,0 +1,45 @@
+from typing import AsyncGenerator
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "asyncmy",
+    "sqlite": "aiosqlite",  # 本地压测
+}
+
+
+def async_database_uri(uri: str) -> str:
+    """
+    将 DATABASE_URI 的驱动替换为对应的异步驱动，如 mysql+pymysql:// -> mysql+asyncmy://
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"不支持异步访问的数据库: {backend}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+# 创建异步引擎，供请求处理函数使用，查询期间不阻塞事件循环
+# 连接池与同步引擎（后台任务、生成任务使用）相互独立，容量单独配置，两者之和为每个进程的连接上限
+async_engine = create_async_engine(
+    async_database_uri(settings.DATABASE_URI),
+    pool_pre_ping=True,
+    pool_recycle=3600,  # 连接池回收时间
+    pool_size=settings.ASYNC_DB_POOL_SIZE,
+    max_overflow=settings.ASYNC_DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    echo=False,  # 生产环境设为False
+)
+
+# 提交后不使对象过期：异步会话中访问过期属性会触发隐式查询而报错
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+# 依赖项函数，用于在路由中获取异步数据库会话
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
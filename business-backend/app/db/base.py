@@ -8,4 +8,7 @@ from app.models.credit_record import CreditRecord
 from app.models.system_config import SystemConfig
 from app.models.admin import Admin
 from app.models.product import Product
-from app.models.order import Order 
\ No newline at end of file
+from app.models.order import Order
+from app.models.generation_job import GenerationJob
+from app.models.result_cache import ResultCache
+from app.models.artwork_timing import ArtworkTiming
\ No newline at end of file
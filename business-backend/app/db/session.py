@@ -5,10 +5,14 @@ from sqlalchemy.orm import sessionmaker, Session
 from app.core.config import settings
 
 # 创建SQLAlchemy引擎
+# 生成任务只在读写数据时短暂占用连接，连接池大小按API并发和worker数量配置即可
 engine = create_engine(
     settings.DATABASE_URI,
     pool_pre_ping=True,
     pool_recycle=3600,  # 连接池回收时间
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
     echo=False,  # 生产环境设为False
 )
 
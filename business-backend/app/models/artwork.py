@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, func, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, func, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 import enum
@@ -19,7 +19,14 @@ class Artwork(BaseModel):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     style_id = Column(Integer, ForeignKey("styles.id", ondelete="RESTRICT"), nullable=False)
     source_image_url = Column(Text, nullable=False)
+    source_width = Column(Integer, nullable=True, comment="原图宽度（像素）")
+    source_height = Column(Integer, nullable=True, comment="原图高度（像素）")
+    source_hash = Column(String(32), nullable=True, comment="原图内容MD5（用于结果缓存）")
     result_image_url = Column(Text, nullable=True)
+    thumbnail_url = Column(Text, nullable=True, comment="缩略图URL（JPEG）")
+    thumbnail_webp_url = Column(Text, nullable=True, comment="缩略图URL（WebP）")
+    medium_url = Column(Text, nullable=True, comment="中等尺寸图URL（JPEG）")
+    medium_webp_url = Column(Text, nullable=True, comment="中等尺寸图URL（WebP）")
     status = Column(SQLEnum("processing", "completed", "failed", name="artwork_status"), 
                     nullable=False, default="processing")
     is_public = Column(Boolean, nullable=False, default=False)
@@ -28,12 +35,18 @@ class Artwork(BaseModel):
     views_count = Column(Integer, nullable=False, default=0)
     error_message = Column(Text, nullable=True)
     progress = Column(Integer, nullable=False, default=0)
+    refunded_at = Column(DateTime, nullable=True, comment="退还积分的时间，为空表示未退还")
 
     # 关系
     user = relationship("User", back_populates="artworks")
     style = relationship("Style", back_populates="artworks")
     likes = relationship("Like", back_populates="artwork", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # 查找长时间没有进展的处理中作品
+        Index("idx_status_updated_at", "status", "updated_at"),
+    )
+
     @hybrid_property
     def style_name(self):
         return self.style.name if self.style else None
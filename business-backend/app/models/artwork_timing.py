@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+
+from app.models.base_model import BaseModel
+
+
+class ArtworkTiming(BaseModel):
+    __tablename__ = "artwork_timings"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    artwork_id = Column(Integer, ForeignKey("artworks.id", ondelete="CASCADE"), nullable=False, unique=True, comment="作品ID")
+    style_id = Column(Integer, nullable=False, comment="风格ID")
+    upstream = Column(String(50), nullable=True, comment="返回结果的AI上游")
+    status = Column(String(20), nullable=True, comment="记录时的作品状态，cached表示复用了缓存结果")
+    attempts = Column(Integer, nullable=False, default=0, comment="生成任务执行次数")
+    source_upload_ms = Column(Integer, nullable=True, comment="原图上传耗时（毫秒）")
+    queue_wait_ms = Column(Integer, nullable=True, comment="从入队到首次被领取的耗时（毫秒）")
+    upstream_connect_ms = Column(Integer, nullable=True, comment="AI上游返回响应头的耗时（毫秒）")
+    first_token_ms = Column(Integer, nullable=True, comment="AI上游返回首行数据的耗时（毫秒）")
+    stream_ms = Column(Integer, nullable=True, comment="首行数据到流结束的耗时（毫秒）")
+    result_download_ms = Column(Integer, nullable=True, comment="结果图下载耗时（毫秒），流式转存时只含响应头和文件头")
+    watermark_ms = Column(Integer, nullable=True, comment="添加水印耗时（毫秒）")
+    result_upload_ms = Column(Integer, nullable=True, comment="结果图上传耗时（毫秒），流式转存时包含剩余的下载")
+    total_ms = Column(Integer, nullable=True, comment="从创建作品到结束的总耗时（毫秒）")
+
+    __table_args__ = (
+        Index("idx_timing_created_at", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<ArtworkTiming(artwork_id={self.artwork_id}, status={self.status}, total_ms={self.total_ms})>"
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Index, Enum as SQLEnum, func
+from sqlalchemy.orm import relationship
+import enum
+
+from app.models.base_model import BaseModel
+
+
+class GenerationJobStatus(str, enum.Enum):
+    PENDING = "pending"        # 等待领取
+    RUNNING = "running"        # 执行中
+    COMPLETED = "completed"    # 已完成
+    FAILED = "failed"          # 已失败（重试次数耗尽或作品处理失败）
+
+
+class GenerationLane(str, enum.Enum):
+    PAID = "paid"              # 付费用户（近期有已支付订单）
+    NORMAL = "normal"          # 普通用户
+    BULK = "bulk"              # 批量/管理员重新生成
+
+
+class GenerationJob(BaseModel):
+    __tablename__ = "generation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    artwork_id = Column(Integer, ForeignKey("artworks.id", ondelete="CASCADE"), nullable=False, unique=True, comment="作品ID")
+    user_id = Column(Integer, nullable=False, comment="用户ID（冗余字段，用于按用户统计并发）")
+    status = Column(SQLEnum("pending", "running", "completed", "failed", name="generation_job_status"),
+                    nullable=False, default="pending", comment="任务状态")
+    lane = Column(String(20), nullable=False, default="normal", comment="调度通道：paid-付费，normal-普通，bulk-批量/重新生成")
+    aspect_ratio = Column(String(20), nullable=True, comment="原图宽高比")
+    attempts = Column(Integer, nullable=False, default=0, comment="已执行次数")
+    max_attempts = Column(Integer, nullable=False, default=3, comment="最大执行次数")
+    available_at = Column(DateTime, nullable=False, default=func.now(), comment="最早可领取时间（用于退避重试）")
+    locked_by = Column(String(100), nullable=True, comment="领取任务的worker标识")
+    locked_at = Column(DateTime, nullable=True, comment="租约起点（领取时设置，执行中的worker定期续期）")
+    started_at = Column(DateTime, nullable=True, comment="本次执行的开始时间（用于统计任务耗时）")
+    finished_at = Column(DateTime, nullable=True, comment="结束时间")
+    last_error = Column(Text, nullable=True, comment="最近一次错误信息")
+    cancel_requested = Column(Boolean, nullable=False, default=False, comment="用户是否已取消（执行中的worker轮询该字段停止生成）")
+
+    __table_args__ = (
+        Index("idx_status_available_at", "status", "available_at"),
+        Index("idx_user_id_status", "user_id", "status"),
+        Index("idx_status_lane_available_at", "status", "lane", "available_at"),
+    )
+
+    # 关系
+    artwork = relationship("Artwork")
+
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, artwork_id={self.artwork_id}, status={self.status}, attempts={self.attempts})>"
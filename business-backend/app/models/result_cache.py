@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Index, UniqueConstraint
+
+from app.models.base_model import BaseModel
+
+
+class ResultCache(BaseModel):
+    __tablename__ = "result_cache"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    source_hash = Column(String(32), nullable=False, comment="原图内容MD5")
+    style_id = Column(Integer, ForeignKey("styles.id", ondelete="CASCADE"), nullable=False, comment="风格ID")
+    style_version = Column(String(32), nullable=False, comment="风格版本（提示词和参考图的摘要）")
+    result_image_url = Column(Text, nullable=False, comment="结果图URL")
+    artwork_id = Column(Integer, nullable=True, comment="生成该结果的作品ID")
+    hit_count = Column(Integer, nullable=False, default=0, comment="命中次数")
+
+    __table_args__ = (
+        UniqueConstraint("source_hash", "style_id", "style_version", name="uk_source_style_version"),
+        Index("idx_created_at", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<ResultCache(id={self.id}, source_hash={self.source_hash}, style_id={self.style_id})>"
@@ -18,6 +18,9 @@ class Style(BaseModel):
     credits_cost = Column(Integer, nullable=False, default=10)
     is_active = Column(Boolean, default=True)
     sort_order = Column(Integer, nullable=False, default=0)
+    cache_enabled = Column(Boolean, nullable=False, default=False, comment="是否复用相同原图的生成结果")
+    cache_ttl_hours = Column(Integer, nullable=True, comment="结果缓存有效小时数，为空时使用全局配置")
+    hedge_enabled = Column(Boolean, nullable=False, default=False, comment="是否对该风格的任务启用对冲请求")
 
     # 关系
     artworks = relationship("Artwork", back_populates="style")
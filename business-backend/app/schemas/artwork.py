@@ -1,4 +1,4 @@
-from typing import Optional, Literal
+from typing import Dict, List, Optional, Literal
 from pydantic import BaseModel, validator, model_validator
 from datetime import datetime
 from enum import Enum
@@ -35,7 +35,13 @@ class Artwork(ArtworkBase):
     id: int
     user_id: int
     style_name: Optional[str] = None
+    source_width: Optional[int] = None
+    source_height: Optional[int] = None
     result_image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None  # 缩略图（JPEG），列表页优先使用
+    thumbnail_webp_url: Optional[str] = None  # 缩略图（WebP）
+    medium_url: Optional[str] = None  # 中等尺寸图（JPEG），详情页预览使用
+    medium_webp_url: Optional[str] = None  # 中等尺寸图（WebP）
     status: ArtworkStatus
     public_scope: Optional[str] = None
     likes_count: int
@@ -54,14 +60,46 @@ class CreateArtworkRequest(BaseModel):
     style_id: int
     image_base64: Optional[str] = None  # Base64编码的图片数据，可选
     image_url: Optional[str] = None  # 图片URL，可选
+    source_object_key: Optional[str] = None  # 通过直传URL上传的原图对象键，可选
 
     @model_validator(mode='after')
     def validate_image_source(self) -> 'CreateArtworkRequest':
-        if not self.image_base64 and not self.image_url:
-            raise ValueError('必须提供image_base64或image_url之一')
+        if not self.image_base64 and not self.image_url and not self.source_object_key:
+            raise ValueError('必须提供image_base64、image_url或source_object_key之一')
         return self
 
 
+# 同一张原图批量生成多个风格的请求
+class CreateArtworkBatchRequest(BaseModel):
+    style_ids: List[int]
+    image_base64: Optional[str] = None  # Base64编码的图片数据，可选
+    image_url: Optional[str] = None  # 图片URL，可选
+    source_object_key: Optional[str] = None  # 通过直传URL上传的原图对象键，可选
+
+    @model_validator(mode='after')
+    def validate_image_source(self) -> 'CreateArtworkBatchRequest':
+        if not self.style_ids:
+            raise ValueError('至少选择一个风格')
+        if not self.image_base64 and not self.image_url and not self.source_object_key:
+            raise ValueError('必须提供image_base64、image_url或source_object_key之一')
+        return self
+
+
+# 申请原图直传URL的请求
+class SourceUploadRequest(BaseModel):
+    content_type: Literal['image/jpeg', 'image/png', 'image/webp'] = 'image/jpeg'
+
+
+# 原图直传URL：客户端使用 method 和 headers 将图片上传到 upload_url，再用 object_key 创建作品
+class SourceUploadResponse(BaseModel):
+    object_key: str
+    upload_url: str
+    method: str
+    headers: Dict[str, str]
+    expires_in: int
+    max_size: int
+
+
 # 发布/取消发布作品请求
 class PublishArtworkRequest(BaseModel):
     is_public: bool
@@ -15,6 +15,9 @@ class StyleBase(BaseModel):
     prompt: Optional[str] = None
     credits_cost: int = 10
     sort_order: int = 0
+    cache_enabled: bool = False
+    cache_ttl_hours: Optional[int] = None
+    hedge_enabled: bool = False
 
 
 # 创建风格时的数据模型
@@ -33,6 +36,9 @@ class StyleUpdate(BaseModel):
     credits_cost: Optional[int] = None
     is_active: Optional[bool] = None
     sort_order: Optional[int] = None
+    cache_enabled: Optional[bool] = None
+    cache_ttl_hours: Optional[int] = None
+    hedge_enabled: Optional[bool] = None
 
 
 # 返回给API的风格模型
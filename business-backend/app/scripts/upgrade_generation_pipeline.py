@@ -0,0 +1,119 @@
+"""
+生成流水线相关的数据库升级脚本
+创建新增的表，并为已存在的表补充新增的列和索引，可重复执行
+
+运行方式：
+python -m app.scripts.upgrade_generation_pipeline
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+from app.db.session import engine
+from app.db.base import Base
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 需要补充的列：(表名, 列名, 添加列及回填数据的SQL)
+COLUMN_MIGRATIONS = [
+    ("generation_jobs", "user_id", [
+        "ALTER TABLE `generation_jobs` ADD COLUMN `user_id` bigint NOT NULL DEFAULT 0 COMMENT '用户ID（冗余字段，用于按用户统计并发）' AFTER `artwork_id`",
+        "UPDATE `generation_jobs` j JOIN `artworks` a ON a.id = j.artwork_id SET j.user_id = a.user_id WHERE j.user_id = 0",
+    ]),
+    ("generation_jobs", "lane", [
+        "ALTER TABLE `generation_jobs` ADD COLUMN `lane` varchar(20) NOT NULL DEFAULT 'normal' COMMENT '调度通道：paid-付费，normal-普通，bulk-批量/重新生成' AFTER `status`",
+    ]),
+    ("generation_jobs", "cancel_requested", [
+        "ALTER TABLE `generation_jobs` ADD COLUMN `cancel_requested` tinyint(1) NOT NULL DEFAULT '0' COMMENT '用户是否已取消（执行中的worker轮询该字段停止生成）' AFTER `last_error`",
+    ]),
+    ("generation_jobs", "started_at", [
+        "ALTER TABLE `generation_jobs` ADD COLUMN `started_at` datetime DEFAULT NULL COMMENT '本次执行的开始时间（用于统计任务耗时）' AFTER `locked_at`",
+        # 引入租约续期之前 locked_at 即为开始时间
+        "UPDATE `generation_jobs` SET `started_at` = `locked_at` WHERE `started_at` IS NULL AND `locked_at` IS NOT NULL",
+    ]),
+    ("artworks", "source_width", [
+        "ALTER TABLE `artworks` ADD COLUMN `source_width` int DEFAULT NULL COMMENT '原图宽度（像素）' AFTER `source_image_url`",
+    ]),
+    ("artworks", "source_height", [
+        "ALTER TABLE `artworks` ADD COLUMN `source_height` int DEFAULT NULL COMMENT '原图高度（像素）' AFTER `source_width`",
+    ]),
+    ("artworks", "source_hash", [
+        "ALTER TABLE `artworks` ADD COLUMN `source_hash` varchar(32) DEFAULT NULL COMMENT '原图内容MD5（用于结果缓存）' AFTER `source_height`",
+    ]),
+    ("artworks", "thumbnail_url", [
+        "ALTER TABLE `artworks` ADD COLUMN `thumbnail_url` text DEFAULT NULL COMMENT '缩略图URL（JPEG）' AFTER `result_image_url`",
+    ]),
+    ("artworks", "thumbnail_webp_url", [
+        "ALTER TABLE `artworks` ADD COLUMN `thumbnail_webp_url` text DEFAULT NULL COMMENT '缩略图URL（WebP）' AFTER `thumbnail_url`",
+    ]),
+    ("artworks", "medium_url", [
+        "ALTER TABLE `artworks` ADD COLUMN `medium_url` text DEFAULT NULL COMMENT '中等尺寸图URL（JPEG）' AFTER `thumbnail_webp_url`",
+    ]),
+    ("artworks", "medium_webp_url", [
+        "ALTER TABLE `artworks` ADD COLUMN `medium_webp_url` text DEFAULT NULL COMMENT '中等尺寸图URL（WebP）' AFTER `medium_url`",
+    ]),
+    ("artworks", "refunded_at", [
+        "ALTER TABLE `artworks` ADD COLUMN `refunded_at` datetime DEFAULT NULL COMMENT '退还积分的时间，为空表示未退还' AFTER `progress`",
+        # 已有的失败作品在引入该字段之前都已退还过积分
+        "UPDATE `artworks` SET `refunded_at` = `updated_at` WHERE `status` = 'failed' AND `refunded_at` IS NULL",
+    ]),
+    ("styles", "cache_enabled", [
+        "ALTER TABLE `styles` ADD COLUMN `cache_enabled` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否复用相同原图的生成结果' AFTER `sort_order`",
+    ]),
+    ("styles", "cache_ttl_hours", [
+        "ALTER TABLE `styles` ADD COLUMN `cache_ttl_hours` int DEFAULT NULL COMMENT '结果缓存有效小时数，为空时使用全局配置' AFTER `cache_enabled`",
+    ]),
+    ("styles", "hedge_enabled", [
+        "ALTER TABLE `styles` ADD COLUMN `hedge_enabled` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否对该风格的任务启用对冲请求' AFTER `cache_ttl_hours`",
+    ]),
+]
+
+# 需要补充的索引：(表名, 索引名, 创建索引的SQL)
+INDEX_MIGRATIONS = [
+    ("generation_jobs", "idx_user_id_status",
+     "CREATE INDEX `idx_user_id_status` ON `generation_jobs` (`user_id`, `status`)"),
+    ("generation_jobs", "idx_status_lane_available_at",
+     "CREATE INDEX `idx_status_lane_available_at` ON `generation_jobs` (`status`, `lane`, `available_at`)"),
+    ("artworks", "idx_status_updated_at",
+     "CREATE INDEX `idx_status_updated_at` ON `artworks` (`status`, `updated_at`)"),
+]
+
+
+def upgrade_database():
+    """创建缺失的表并补充缺失的列和索引"""
+    # 创建新增的表（已存在的表不受影响）
+    Base.metadata.create_all(bind=engine)
+    logger.info("新增表检查完成")
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table_name, column_name, statements in COLUMN_MIGRATIONS:
+            columns = {column["name"] for column in inspector.get_columns(table_name)}
+            if column_name in columns:
+                logger.info(f"表 `{table_name}` 已有 {column_name} 列")
+                continue
+            logger.info(f"添加 {column_name} 列到 `{table_name}`")
+            for statement in statements:
+                conn.execute(text(statement))
+
+        for table_name, index_name, statement in INDEX_MIGRATIONS:
+            indexes = {index["name"] for index in inspector.get_indexes(table_name)}
+            if index_name in indexes:
+                logger.info(f"表 `{table_name}` 已有索引 {index_name}")
+                continue
+            logger.info(f"为 `{table_name}` 创建索引 {index_name}")
+            conn.execute(text(statement))
+
+    logger.info("数据库升级完成！")
+
+
+if __name__ == "__main__":
+    try:
+        upgrade_database()
+    except Exception as e:
+        logger.error(f"执行升级脚本失败: {str(e)}")
+        import sys
+        sys.exit(1)
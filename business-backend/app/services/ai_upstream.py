@@ -0,0 +1,403 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+import httpx
+
+from app.core.config import settings
+from app.services.api_key_pool import ApiKey, ApiKeyPool, parse_api_keys
+
+logger = logging.getLogger(__name__)
+
+
+class AIUpstreamUnavailableError(Exception):
+    """所有AI上游都处于熔断状态，或在等待时间内没有空闲的并发额度或可用的API Key"""
+    pass
+
+
+class UpstreamRequestError(Exception):
+    """向上游发起的生成请求失败，retryable表示换个时间或上游重试可能成功"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class FirstTokenTimeoutError(httpx.TimeoutException):
+    """上游在 AI_FIRST_TOKEN_TIMEOUT 秒内没有返回任何数据"""
+    pass
+
+
+class CircuitState:
+    CLOSED = "closed"        # 正常
+    OPEN = "open"            # 熔断中，跳过该上游
+    HALF_OPEN = "half_open"  # 冷却结束，放行一个试探请求
+
+
+class AIUpstream:
+    """
+    单个AI上游（中转服务）及其健康状态
+
+    最近 AI_UPSTREAM_WINDOW 次请求的成功率和首字节耗时（EWMA）用于路由打分；
+    连续失败 AI_UPSTREAM_FAILURE_THRESHOLD 次后熔断，冷却 AI_UPSTREAM_COOLDOWN 秒（连续熔断时翻倍）后放行一个试探请求，
+    试探成功即恢复。请求使用的API Key由上游自己的 ApiKeyPool 分配。
+    """
+
+    def __init__(self, name: str, url: str, api_keys: List[Dict[str, Any]], weight: float = 1.0,
+                 max_concurrency: int = 0, model: Optional[str] = None):
+        self.name = name
+        self.keys = ApiKeyPool()
+        self.configure(url, api_keys, weight, max_concurrency, model)
+
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.outcomes: Deque[bool] = deque(maxlen=max(settings.get_int("AI_UPSTREAM_WINDOW", 20), 1))
+        self.ttft_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.state = CircuitState.CLOSED
+        self.open_until = 0.0
+        self.trips = 0
+
+    def configure(self, url: str, api_keys: List[Dict[str, Any]], weight: float, max_concurrency: int, model: Optional[str]):
+        """配置变更时更新连接参数，保留健康状态"""
+        self.url = url.rstrip("/")
+        self.keys.configure(api_keys)
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.model = model
+
+    @property
+    def success_rate(self) -> float:
+        # 加一平滑，新上游按0.5起步而不是直接判为不可用
+        return (sum(self.outcomes) + 1) / (len(self.outcomes) + 2)
+
+    def has_capacity(self) -> bool:
+        """并发未达上限且有立即可用的API Key"""
+        if self.max_concurrency > 0 and self.in_flight >= self.max_concurrency:
+            return False
+        return self.keys.wait_seconds() == 0
+
+    def is_available(self, now: float) -> bool:
+        """熔断状态是否允许发起新请求（不考虑并发额度）"""
+        if self.state == CircuitState.OPEN:
+            if now < self.open_until:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            logger.info(f"AI上游 {self.name} 熔断冷却结束，放行试探请求")
+        if self.state == CircuitState.HALF_OPEN:
+            return self.in_flight == 0
+        return True
+
+    def score(self) -> float:
+        """路由打分：权重 × 成功率，首字节越慢、负载越高得分越低"""
+        score = self.weight * self.success_rate
+        if self.ttft_ewma is not None:
+            score /= 1 + self.ttft_ewma / 10
+        if self.max_concurrency > 0:
+            score *= 1 - self.in_flight / (self.max_concurrency + 1)
+        return score
+
+    def record(self, success: bool, ttft: Optional[float]):
+        self.requests += 1
+        self.outcomes.append(success)
+        if ttft is not None:
+            self.ttft_ewma = ttft if self.ttft_ewma is None else self.ttft_ewma * 0.8 + ttft * 0.2
+
+        if success:
+            if self.state != CircuitState.CLOSED:
+                logger.info(f"AI上游 {self.name} 试探请求成功，恢复正常")
+            self.state = CircuitState.CLOSED
+            self.consecutive_failures = 0
+            self.trips = 0
+            return
+
+        self.failures += 1
+        self.consecutive_failures += 1
+        threshold = max(settings.get_int("AI_UPSTREAM_FAILURE_THRESHOLD", 3), 1)
+        if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= threshold:
+            self.trips += 1
+            base_cooldown = settings.get_float("AI_UPSTREAM_COOLDOWN", 30.0)
+            cooldown = min(base_cooldown * 2 ** (self.trips - 1), base_cooldown * 10)
+            self.state = CircuitState.OPEN
+            self.open_until = time.monotonic() + cooldown
+            logger.warning(f"AI上游 {self.name} 连续失败 {self.consecutive_failures} 次，熔断 {cooldown:.0f} 秒")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "keys": len(self.keys),
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "state": self.state,
+            "open_seconds_left": round(max(self.open_until - time.monotonic(), 0.0), 1) if self.state == CircuitState.OPEN else 0.0,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "window_success_rate": round(sum(self.outcomes) / len(self.outcomes), 4) if self.outcomes else None,
+            "avg_first_token_ms": round(self.ttft_ewma * 1000, 1) if self.ttft_ewma is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "score": round(self.score(), 4),
+        }
+
+
+class UpstreamLease:
+    """一次生成请求占用的上游，记录首字节时间和请求结果，归还时计入上游健康状态"""
+
+    def __init__(self, upstream: AIUpstream, api_key: ApiKey):
+        self.upstream = upstream
+        self.api_key = api_key
+        self.started_at = time.monotonic()
+        self.connected_seconds: Optional[float] = None
+        self.first_token_seconds: Optional[float] = None
+        self.success: Optional[bool] = None
+        self.rate_limited_seconds: Optional[float] = None
+
+    def mark_connected(self):
+        if self.connected_seconds is None:
+            self.connected_seconds = time.monotonic() - self.started_at
+
+    def mark_first_token(self):
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.monotonic() - self.started_at
+
+    def succeed(self):
+        self.success = True
+
+    def fail(self):
+        self.success = False
+
+    def rate_limited(self, retry_after: Optional[str] = None):
+        """
+        当前API Key被上游限流（HTTP 429），归还时冷却该Key；限流不计入上游健康状态
+
+        Args:
+            retry_after: 响应头 Retry-After 的值（秒），无效时使用 API_KEY_COOLDOWN
+        """
+        cooldown = settings.get_float("API_KEY_COOLDOWN", 60.0)
+        try:
+            if retry_after:
+                cooldown = max(float(retry_after), 1.0)
+        except ValueError:
+            pass
+        self.rate_limited_seconds = cooldown
+
+
+class AIUpstreamPool:
+    """
+    AI上游池
+
+    上游列表来自系统配置 AI_UPSTREAMS（JSON数组），每项包含：
+    name、url、api_key 或 api_keys（格式见 parse_api_keys），可选 weight（默认1）、max_concurrency（默认0不限制）、
+    model（覆盖 OPENAI_IMAGE_MODEL）。
+    未配置时使用 OPENAI_API_URL 作为唯一上游，API Key取自 OPENAI_API_KEYS，未配置时使用 OPENAI_API_KEY。
+    每个任务路由到当前得分最高的可用上游。
+    """
+
+    def __init__(self):
+        self._upstreams: Dict[str, AIUpstream] = {}
+        self._raw_config: Optional[str] = None
+        self._released: Optional[asyncio.Condition] = None
+        # 对冲请求统计：符合条件的任务数、实际发起对冲数、无其他上游可用而跳过数、各方胜出数
+        self._hedge_stats: Dict[str, int] = {
+            "eligible": 0, "hedged": 0, "skipped": 0, "primary_wins": 0, "hedge_wins": 0, "no_winner": 0,
+        }
+
+    def _load_config(self) -> List[Dict[str, Any]]:
+        raw = settings.get("AI_UPSTREAMS", "") or ""
+        if raw.strip():
+            try:
+                items = json.loads(raw)
+                if isinstance(items, list) and items:
+                    return items
+                logger.error("AI_UPSTREAMS 应为非空的JSON数组，使用 OPENAI_API_URL")
+            except json.JSONDecodeError as e:
+                logger.error(f"AI_UPSTREAMS 不是有效的JSON，使用 OPENAI_API_URL: {str(e)}")
+        return [{
+            "name": "default",
+            "url": settings.OPENAI_API_URL,
+            "api_keys": settings.get("OPENAI_API_KEYS", "") or settings.OPENAI_API_KEY,
+        }]
+
+    def _refresh(self):
+        """系统配置变化时重建上游列表，同名上游保留健康状态"""
+        # 未配置上游池时还需跟随 OPENAI_API_URL / OPENAI_API_KEYS 的变化，令牌桶的默认参数变化时也需要更新
+        raw = "|".join(str(value) for value in (
+            settings.get("AI_UPSTREAMS", ""),
+            settings.OPENAI_API_URL,
+            settings.OPENAI_API_KEY,
+            settings.get("OPENAI_API_KEYS", ""),
+            settings.get("API_KEY_RPM", ""),
+            settings.get("API_KEY_BURST", ""),
+        ))
+        if raw == self._raw_config and self._upstreams:
+            return
+        self._raw_config = raw
+
+        upstreams: Dict[str, AIUpstream] = {}
+        for index, item in enumerate(self._load_config()):
+            name = str(item.get("name") or f"upstream-{index + 1}")
+            params = dict(
+                url=item.get("url", ""),
+                api_keys=parse_api_keys(item.get("api_keys") or item.get("api_key")),
+                weight=float(item.get("weight", 1.0)),
+                max_concurrency=int(item.get("max_concurrency", 0)),
+                model=item.get("model"),
+            )
+            upstream = self._upstreams.get(name)
+            if upstream is None:
+                upstream = AIUpstream(name, **params)
+            else:
+                upstream.configure(**params)
+            if not len(upstream.keys):
+                logger.warning(f"AI上游 {name} 没有配置API Key，不会被使用")
+            upstreams[name] = upstream
+        self._upstreams = upstreams
+        logger.info(f"加载AI上游: {', '.join(upstreams)}")
+
+    def _select(self, exclude: Optional[Set[str]] = None) -> Optional[AIUpstream]:
+        """
+        选出得分最高且有并发额度和可用API Key的上游
+
+        Raises:
+            AIUpstreamUnavailableError: 所有上游都处于熔断状态
+        """
+        now = time.monotonic()
+        available = [
+            upstream for upstream in self._upstreams.values()
+            if upstream.name not in (exclude or ()) and upstream.is_available(now)
+        ]
+        if not available:
+            raise AIUpstreamUnavailableError("所有AI上游均处于熔断状态")
+        candidates = [upstream for upstream in available if upstream.has_capacity()]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda upstream: upstream.score())
+
+    @asynccontextmanager
+    async def acquire(self, exclude: Optional[Set[str]] = None, timeout: Optional[float] = None) -> AsyncIterator[UpstreamLease]:
+        """
+        占用一个上游，退出时归还并记录结果（未标记结果的请求不计入健康状态）
+
+        所有上游的并发额度或API Key都已用完时，最多等待 timeout 秒（默认 AI_UPSTREAM_ACQUIRE_TIMEOUT）
+
+        Args:
+            exclude: 不参与选择的上游名称
+
+        Raises:
+            AIUpstreamUnavailableError: 全部熔断或等待超时
+        """
+        self._refresh()
+        if self._released is None:
+            self._released = asyncio.Condition()
+
+        if timeout is None:
+            timeout = settings.get_float("AI_UPSTREAM_ACQUIRE_TIMEOUT", 30.0)
+        deadline = time.monotonic() + timeout
+        async with self._released:
+            upstream = self._select(exclude)
+            while upstream is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AIUpstreamUnavailableError(f"AI上游并发或API Key额度已满，等待超过 {timeout} 秒")
+                # 等待其他请求释放，或最早的令牌补充、Key冷却结束
+                key_wait = min(upstream.keys.wait_seconds() for upstream in self._upstreams.values())
+                try:
+                    await asyncio.wait_for(self._released.wait(), timeout=min(remaining, max(key_wait, 0.05)))
+                except asyncio.TimeoutError:
+                    pass
+                upstream = self._select(exclude)
+            upstream.in_flight += 1
+            api_key = upstream.keys.take()
+
+        lease = UpstreamLease(upstream, api_key)
+        try:
+            yield lease
+        finally:
+            upstream.in_flight -= 1
+            api_key.release()
+            if lease.rate_limited_seconds is not None:
+                api_key.cool_down(lease.rate_limited_seconds)
+            elif lease.success is False:
+                api_key.errors += 1
+            if lease.success is not None:
+                upstream.record(lease.success, lease.first_token_seconds)
+            async with self._released:
+                self._released.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各上游的健康状态（当前进程）"""
+        self._refresh()
+        return {name: upstream.stats() for name, upstream in self._upstreams.items()}
+
+    def record_hedge(self, name: str):
+        self._hedge_stats[name] += 1
+
+    def hedge_stats(self) -> Dict[str, Any]:
+        """对冲请求的触发率和胜出率（当前进程）"""
+        stats = self._hedge_stats
+        return {
+            **stats,
+            "hedge_rate": round(stats["hedged"] / stats["eligible"], 4) if stats["eligible"] else 0.0,
+            "hedge_win_rate": round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0,
+        }
+
+    def key_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """各上游API Key的令牌桶和限流计数（当前进程）"""
+        self._refresh()
+        return {name: upstream.keys.stats() for name, upstream in self._upstreams.items()}
+
+
+@asynccontextmanager
+async def open_stream(client: httpx.AsyncClient, request: httpx.Request, lease: UpstreamLease) -> AsyncIterator[httpx.Response]:
+    """
+    发送流式请求，等待响应头的时间计入首字节超时
+
+    Raises:
+        FirstTokenTimeoutError: 首字节超时
+    """
+    timeout = settings.get_float("AI_FIRST_TOKEN_TIMEOUT", 60.0)
+    try:
+        response = await asyncio.wait_for(client.send(request, stream=True), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise FirstTokenTimeoutError(f"AI上游 {lease.upstream.name} 超过 {timeout} 秒未返回响应")
+    lease.mark_connected()
+    try:
+        yield response
+    finally:
+        await response.aclose()
+
+
+async def iter_lines_with_first_token_timeout(response: httpx.Response, lease: UpstreamLease) -> AsyncIterator[str]:
+    """
+    逐行读取SSE响应，收到第一行非空数据前最多等待 AI_FIRST_TOKEN_TIMEOUT 秒（从发起请求开始计算）
+
+    Raises:
+        FirstTokenTimeoutError: 首字节超时
+    """
+    timeout = settings.get_float("AI_FIRST_TOKEN_TIMEOUT", 60.0)
+    lines = response.aiter_lines()
+    while lease.first_token_seconds is None:
+        remaining = timeout - (time.monotonic() - lease.started_at)
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            line = await asyncio.wait_for(lines.__anext__(), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise FirstTokenTimeoutError(f"AI上游 {lease.upstream.name} 超过 {timeout} 秒未返回数据")
+        except StopAsyncIteration:
+            return
+        if line.strip():
+            lease.mark_first_token()
+        yield line
+
+    async for line in lines:
+        yield line
+
+
+# 创建单例实例
+ai_upstreams = AIUpstreamPool()
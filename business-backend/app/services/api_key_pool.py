@@ -0,0 +1,181 @@
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_api_keys(value: Any) -> List[Dict[str, Any]]:
+    """
+    解析API Key配置
+
+    支持JSON数组（元素为字符串，或包含 key、可选 rpm / burst / max_concurrency 的对象），
+    也支持以逗号或换行分隔的字符串
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("["):
+            try:
+                value = json.loads(text)
+            except json.JSONDecodeError as e:
+                logger.error(f"API Key配置不是有效的JSON: {str(e)}")
+                return []
+        else:
+            value = [item.strip() for item in text.replace("\n", ",").split(",")]
+    if not isinstance(value, list):
+        value = [value]
+
+    entries = []
+    for item in value:
+        if isinstance(item, str):
+            item = {"key": item}
+        if isinstance(item, dict) and item.get("key"):
+            entries.append(item)
+    return entries
+
+
+class ApiKey:
+    """
+    单个API Key的令牌桶和冷却状态
+
+    令牌按 rpm/60 每秒匀速补充，桶容量为 burst；收到429后冷却一段时间不再使用
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.rpm = 0
+        self.burst = 0
+        self.max_concurrency = 0
+        self.tokens = 0.0
+        self.refilled_at = time.monotonic()
+        self.cooldown_until = 0.0
+
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def configure(self, rpm: int, burst: int, max_concurrency: int):
+        first = self.rpm == 0 and self.burst == 0
+        self.rpm = rpm
+        self.burst = max(burst, 1) if rpm > 0 else 0
+        self.max_concurrency = max_concurrency
+        if first or self.tokens > self.burst:
+            self.tokens = float(self.burst)
+
+    @property
+    def masked(self) -> str:
+        """脱敏后的Key，用于日志和管理接口"""
+        if len(self.key) <= 10:
+            return self.key[:2] + "***"
+        return f"{self.key[:6]}...{self.key[-4:]}"
+
+    def _refill(self, now: float):
+        if self.rpm > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rpm / 60)
+        self.refilled_at = now
+
+    def wait_seconds(self, now: float) -> float:
+        """距离可以使用还需等待的秒数，0表示立即可用（不考虑并发上限）"""
+        if now < self.cooldown_until:
+            return self.cooldown_until - now
+        if self.rpm <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * 60 / self.rpm
+
+    def is_available(self, now: float) -> bool:
+        if self.max_concurrency > 0 and self.in_flight >= self.max_concurrency:
+            return False
+        return self.wait_seconds(now) == 0
+
+    def take(self):
+        if self.rpm > 0:
+            self.tokens -= 1
+        self.in_flight += 1
+        self.requests += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+    def cool_down(self, seconds: float):
+        self.rate_limited += 1
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+        logger.warning(f"API Key {self.masked} 被限流，冷却 {seconds:.0f} 秒")
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        cooling = now < self.cooldown_until
+        if not cooling:
+            self._refill(now)
+        return {
+            "key": self.masked,
+            "rpm": self.rpm,
+            "tokens": round(self.tokens, 2) if self.rpm > 0 else None,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "cooldown_seconds_left": round(self.cooldown_until - now, 1) if cooling else 0.0,
+        }
+
+
+class ApiKeyPool:
+    """
+    一个上游的API Key池
+
+    每次请求选择当前可用（未冷却、令牌桶有余量、未达并发上限）且在途请求最少的Key，
+    增加Key只需修改系统配置，无需重启
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, ApiKey] = {}
+
+    def configure(self, entries: List[Dict[str, Any]]):
+        """按配置更新Key列表，已存在的Key保留令牌桶和计数"""
+        default_rpm = settings.get_int("API_KEY_RPM", 0)
+        keys: Dict[str, ApiKey] = {}
+        for entry in entries:
+            key = str(entry["key"])
+            api_key = self._keys.get(key) or ApiKey(key)
+            rpm = int(entry.get("rpm", default_rpm))
+            api_key.configure(
+                rpm=rpm,
+                burst=int(entry.get("burst", settings.get_int("API_KEY_BURST", 0) or rpm)),
+                max_concurrency=int(entry.get("max_concurrency", 0)),
+            )
+            keys[key] = api_key
+        self._keys = keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def wait_seconds(self) -> float:
+        """最早可用的Key还需等待的秒数，0表示有Key立即可用"""
+        now = time.monotonic()
+        if any(api_key.is_available(now) for api_key in self._keys.values()):
+            return 0.0
+        waits = [api_key.wait_seconds(now) for api_key in self._keys.values()]
+        # 只受并发上限限制时等待其他请求释放
+        return min([wait for wait in waits if wait > 0] or [float("inf")])
+
+    def take(self) -> Optional[ApiKey]:
+        """取出在途请求最少的可用Key，没有可用Key时返回None"""
+        now = time.monotonic()
+        candidates = [api_key for api_key in self._keys.values() if api_key.is_available(now)]
+        if not candidates:
+            return None
+        api_key = min(candidates, key=lambda item: (item.in_flight, -item.tokens))
+        api_key.take()
+        return api_key
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [api_key.stats(now) for api_key in self._keys.values()]
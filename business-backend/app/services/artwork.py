@@ -1,10 +1,13 @@
-from typing import List, Optional, Dict, Any, Tuple, Union
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple, Union, Callable
+from contextlib import AsyncExitStack
 from datetime import datetime
 import logging
 import asyncio
 import base64
+import hashlib
 import io
 import random
+import time
 from fastapi import HTTPException
 import json
 import httpx
@@ -13,8 +16,8 @@ from PIL import Image, ImageDraw, ImageFont
 import re
 
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc, asc, or_, and_
-import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, asc, or_, and_, select, update
 
 from app.models.artwork import Artwork, ArtworkStatus
 from app.models.user import User
@@ -22,13 +25,43 @@ from app.models.style import Style
 from app.schemas.artwork import ArtworkCreate, ArtworkUpdate, ArtworkListParams, PublishArtworkRequest
 from app.services.file_storage import FileStorageService
 from app.services.credit import CreditService
+from app.services.user import UserService
+from app.services.generation_stream_parser import GenerationStreamParser, StreamEventType
+from app.services.progress_sink import progress_sink
+from app.services.progress_events import progress_broker
+from app.services.image_pool import image_pool, DEFAULT_WATERMARK_PATH
+from app.services.result_cache import ResultCacheService
+from app.services.artwork_timing import ArtworkTimingService, elapsed_ms
+from app.services.ai_upstream import (
+    ai_upstreams, open_stream, iter_lines_with_first_token_timeout,
+    UpstreamLease, AIUpstreamUnavailableError, FirstTokenTimeoutError, UpstreamRequestError
+)
 from app.services.cos_service import cos_service  # 导入COS服务单例
 from app.core.config import settings
-from app.db.utils import get_base_query, soft_delete
+from app.core.http_client import http_clients
+from utils.image_probe import (
+    SNIFF_BYTES, PROBE_BYTES, sniff_image_format, image_file_info, parse_image_size, fetch_image_size
+)
+from app.db.utils import get_base_query, filter_deleted, soft_delete
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# 结果图派生图对应的作品字段：(尺寸名称, 格式) -> 字段名
+VARIANT_COLUMNS = {
+    ("thumbnail", "jpeg"): "thumbnail_url",
+    ("thumbnail", "webp"): "thumbnail_webp_url",
+    ("medium", "jpeg"): "medium_url",
+    ("medium", "webp"): "medium_webp_url",
+}
+
+
+class RetryableGenerationError(Exception):
+    """
+    可重试的生成错误（如上游连接失败、超时），由任务队列按退避策略重新排队
+    """
+    pass
+
 
 class ArtworkService:
     @staticmethod
@@ -37,143 +70,414 @@ class ArtworkService:
         user_id: int, 
         style_id: int, 
         image_base64: Optional[str] = None,
-        image_url: Optional[str] = None
+        image_url: Optional[str] = None,
+        source_object_key: Optional[str] = None
     ) -> Tuple[bool, Dict[str, Any]]:
         """
         创建新作品
         """
-        # 检查用户和风格
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return False, {"error": "用户不存在"}
-        
-        style = db.query(Style).filter(Style.id == style_id).first()
-        if not style:
-            return False, {"error": "风格不存在"}
-        
-        if not style.is_active:
-            return False, {"error": "该风格已禁用"}
+        success, result = await ArtworkService.create_batch(
+            db, user_id, [style_id], image_base64, image_url, source_object_key
+        )
+        if not success:
+            return False, result
+        return True, {"artwork": result["artworks"][0]}
+    
+    @staticmethod
+    async def create_batch(
+        db: Session, 
+        user_id: int, 
+        style_ids: List[int], 
+        image_base64: Optional[str] = None,
+        image_url: Optional[str] = None,
+        source_object_key: Optional[str] = None,
+        streamed_source: Optional[Dict[str, Any]] = None
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        用同一张原图按多个风格批量创建作品
         
-        # 检查用户积分
-        credits_cost = style.credits_cost
-        if user.credits < credits_cost:
-            return False, {"error": "积分不足"}
+        原图只上传和解析一次，所有作品、生成任务和积分扣除在同一事务中提交。
+        source_object_key 为客户端通过直传URL上传的原图对象键，只校验元数据，不经过API服务器中转。
+        streamed_source 为 create_from_stream 已流式上传的原图（创建失败时由调用方删除）。
+        """
+        success, result = ArtworkService._check_styles(db, user_id, style_ids)
+        if not success:
+            return False, result
+        styles = result["styles"]
         
-        # 获取原始图片宽高比
-        aspect_ratio = None
-        if image_base64:
+        # 获取原始图片尺寸（URL来源只读取文件头）
+        image_size = None
+        image_bytes = None
+        source_hash = None
+        if source_object_key and not image_base64 and not streamed_source:
+            success, result = await ArtworkService._verify_direct_upload(user_id, source_object_key)
+            if not success:
+                return False, result
+            image_url = FileStorageService.object_url(source_object_key)
+            # 简单上传的ETag即内容MD5，可直接用于结果缓存
+            source_hash = result.get("md5")
+        if streamed_source:
+            source_hash = streamed_source["md5"]
+            image_size = parse_image_size(streamed_source["header"])
+        elif image_base64:
+            # 解码前按长度估算大小，超限的图片不再解码（兼容旧客户端，新客户端应使用流式上传或直传）
+            max_size = settings.get_int("MAX_UPLOAD_SIZE", 5 * 1024 * 1024)
+            if len(image_base64) * 3 // 4 > max_size + 64:
+                return False, {"error": f"图片大小不能超过 {max_size // (1024 * 1024)}MB"}
             try:
                 if "," in image_base64:
                     image_base64 = image_base64.split(",")[1]     
                 image_bytes = base64.b64decode(image_base64)
-                img = Image.open(io.BytesIO(image_bytes))
-                aspect_ratio = f"{img.width}:{img.height}"
+                if len(image_bytes) > max_size:
+                    return False, {"error": f"图片大小不能超过 {max_size // (1024 * 1024)}MB"}
+                # 原图内容MD5，用于结果缓存
+                source_hash = hashlib.md5(image_bytes).hexdigest()
+                # 文件头无法解析时交给图片进程池
+                image_size = parse_image_size(image_bytes[:PROBE_BYTES]) or await image_pool.image_size(image_bytes)
             except Exception as e:
                 logger.error(f"解析image_base64获取宽高比失败: {e}")
+            if image_bytes is None:
+                return False, {"error": "图片数据无效"}
         elif image_url:
             try:
-                async with httpx.AsyncClient() as client:
-                    presigned_source_url = cos_service.generate_presigned_url(image_url, expires=600)
-                    response = await client.get(presigned_source_url, timeout=60.0)
-                    response.raise_for_status()
-                    image_bytes = await response.aread()
-                    img = Image.open(io.BytesIO(image_bytes))
-                    aspect_ratio = f"{img.width}:{img.height}"
+                client = http_clients.get("storage")
+                presigned_source_url = cos_service.generate_presigned_url(image_url, expires=600)
+                image_size = await fetch_image_size(
+                    client,
+                    presigned_source_url,
+                    probe_bytes=settings.get_int("IMAGE_PROBE_BYTES", PROBE_BYTES)
+                )
             except Exception as e:
-                logger.error(f"下载image_url获取宽高比失败: {e}")
+                logger.error(f"读取image_url获取宽高比失败: {e}")
+        aspect_ratio = f"{image_size[0]}:{image_size[1]}" if image_size else None
         
-        # 设置来源图片URL
-        source_image_url = image_url
+        # 查找可复用的生成结果，命中时不再排队生成
+        cached_results = {style.id: ResultCacheService.lookup(db, source_hash, style) for style in styles}
+        pending_count = sum(1 for cached_result in cached_results.values() if not cached_result)
+        
+        from app.services.generation_queue import GenerationJobService, generation_worker_pool
+        if pending_count:
+            # 准入控制：在上传图片和扣除积分之前检查并发限制
+            admitted, admission_result = GenerationJobService.check_admission(db, user_id, count=pending_count)
+            if not admitted:
+                return False, admission_result
+            lane = GenerationJobService.lane_for_user(db, user_id)
+        
+        # 设置来源图片URL（同时提供base64时以base64为准）
+        source_image_url = image_url if image_bytes is None else None
+        uploaded_source = False
+        source_upload_ms = None
+        if streamed_source:
+            source_image_url = streamed_source["url"]
+            source_upload_ms = streamed_source.get("upload_ms")
+        
+        # 命中缓存时复用生成该结果的作品的原图（内容相同）
+        if image_bytes is not None:
+            for cached_result in cached_results.values():
+                if not cached_result or not cached_result.artwork_id:
+                    continue
+                cached_artwork = db.query(Artwork).filter(Artwork.id == cached_result.artwork_id).first()
+                if cached_artwork and cached_artwork.source_hash == source_hash:
+                    source_image_url = cached_artwork.source_image_url
+                    break
         
         # 如果提供了base64图片数据，则上传原图
-        if image_base64:
-            success, result = await FileStorageService.upload_base64_image(
-                image_base64, 
+        if image_bytes is not None and source_image_url is None:
+            upload_started_at = time.monotonic()
+            success, result = await FileStorageService.upload_bytes(
+                image_bytes, 
                 folder="source_images"
             )
+            source_upload_ms = elapsed_ms(upload_started_at, time.monotonic())
             
             if not success:
                 return False, {"error": f"上传图片失败: {result}"}
             
             source_image_url = result
+            uploaded_source = True
         
         # 如果没有source_image_url，则返回错误
         if not source_image_url:
             return False, {"error": "必须提供有效的图片来源（base64或URL）"}
         
         try:
-            # 创建作品记录
-            db_artwork = Artwork(
-                user_id=user_id,
-                style_id=style_id,
-                source_image_url=source_image_url,
-                status=ArtworkStatus.PROCESSING.value,
-                is_public=False
-            )
-            db.add(db_artwork)
-            db.flush()  # 获取ID但不提交
-            
-            # 扣除积分
-            success, credit_result = CreditService.update_credits(
-                db=db,
-                user_id=user_id,
-                amount=-credits_cost,
-                type="create",
-                description=f"创建作品《{style.name}》风格",
-                related_id=db_artwork.id
-            )
-            
-            if not success:
-                # 回滚并返回错误
-                db.rollback()
-                # 如果上传了新图片，则删除
-                if image_base64:
-                    await FileStorageService.delete_file(source_image_url)
-                return False, {"error": credit_result["error"]}
+            artworks = []
+            for style in styles:
+                cached_result = cached_results[style.id]
+                # 创建作品记录
+                db_artwork = Artwork(
+                    user_id=user_id,
+                    style_id=style.id,
+                    source_image_url=source_image_url,
+                    source_width=image_size[0] if image_size else None,
+                    source_height=image_size[1] if image_size else None,
+                    source_hash=source_hash,
+                    status=ArtworkStatus.PROCESSING.value,
+                    is_public=False
+                )
+                if cached_result:
+                    db_artwork.status = ArtworkStatus.COMPLETED.value
+                    db_artwork.result_image_url = cached_result.result_image_url
+                    db_artwork.progress = 100
+                    # 派生图与缓存的结果图属于同一作品时一并复用
+                    cached_artwork = db.query(Artwork).filter(Artwork.id == cached_result.artwork_id).first()
+                    if cached_artwork and cached_artwork.result_image_url == cached_result.result_image_url:
+                        for column in VARIANT_COLUMNS.values():
+                            setattr(db_artwork, column, getattr(cached_artwork, column))
+                db.add(db_artwork)
+                db.flush()  # 获取ID但不提交
+                ArtworkTimingService.create_record(
+                    db, db_artwork.id, style.id, source_upload_ms, cached=bool(cached_result)
+                )
+                
+                if cached_result:
+                    logger.info(f"Artwork {db_artwork.id}: 复用作品 {cached_result.artwork_id} 的生成结果")
+                else:
+                    # 创建生成任务，与作品和积分扣除在同一事务中提交
+                    GenerationJobService.enqueue(db, db_artwork.id, user_id, aspect_ratio, lane=lane)
+                
+                # 扣除积分（暂不提交）
+                success, credit_result = CreditService.update_credits(
+                    db=db,
+                    user_id=user_id,
+                    amount=-style.credits_cost,
+                    type="create",
+                    description=f"创建作品《{style.name}》风格",
+                    related_id=db_artwork.id,
+                    commit=False
+                )
+                
+                if not success:
+                    # 回滚并返回错误
+                    db.rollback()
+                    # 如果上传了新图片，则删除
+                    if uploaded_source:
+                        await FileStorageService.delete_file(source_image_url)
+                    return False, {"error": credit_result["error"]}
+                
+                artworks.append(db_artwork)
             
             # 提交事务
             db.commit()
-            db.refresh(db_artwork)
+            for db_artwork in artworks:
+                db.refresh(db_artwork)
             
-            # 异步处理图片风格转换
-            asyncio.create_task(
-                ArtworkService.process_artwork_style(db_artwork.id, aspect_ratio)
-            )
+            # 唤醒空闲worker处理图片风格转换
+            for _ in range(pending_count):
+                generation_worker_pool.notify()
             
-            return True, {"artwork": db_artwork}
+            return True, {"artworks": artworks}
             
         except Exception as e:
             db.rollback()
             # 如果上传了新图片，则删除
-            if image_base64:
+            if uploaded_source:
                 await FileStorageService.delete_file(source_image_url)
             logger.error(f"创建作品时发生错误: {str(e)}")
             return False, {"error": f"创建作品失败: {str(e)}"}
     
     @staticmethod
-    async def process_artwork_style(artwork_id: int, aspect_ratio: Optional[str] = None):
+    def _check_styles(db: Session, user_id: int, style_ids: List[int]) -> Tuple[bool, Dict[str, Any]]:
         """
-        处理作品的风格转换（异步）
+        校验批量创建的风格和用户积分
+
+        Returns:
+            成功状态和 {"styles": 去重后按顺序排列的风格}，或错误信息
         """
-        # 创建独立的数据库会话
-        from app.db.session import SessionLocal
-        db = SessionLocal()
+        # 去重并保持顺序
+        style_ids = list(dict.fromkeys(style_ids))
+        max_styles = settings.get_int("ARTWORK_BATCH_MAX_STYLES", 6)
+        if not style_ids:
+            return False, {"error": "至少选择一个风格"}
+        if len(style_ids) > max_styles:
+            return False, {"error": f"一次最多选择 {max_styles} 个风格"}
         
-        try:
-            artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-            if not artwork or artwork.status != ArtworkStatus.PROCESSING.value:
-                return
-            
-            style = db.query(Style).filter(Style.id == artwork.style_id).first()
+        # 检查用户和风格
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return False, {"error": "用户不存在"}
+        
+        styles_by_id = {style.id: style for style in db.query(Style).filter(Style.id.in_(style_ids)).all()}
+        styles = []
+        for style_id in style_ids:
+            style = styles_by_id.get(style_id)
             if not style:
-                # 更新作品状态为失败
-                artwork.status = ArtworkStatus.FAILED.value
-                artwork.error_message = "找不到对应的风格"
-                db.commit()
-                return
-            
+                return False, {"error": "风格不存在"}
+            if not style.is_active:
+                return False, {"error": f"风格《{style.name}》已禁用" if len(style_ids) > 1 else "该风格已禁用"}
+            styles.append(style)
+        
+        # 检查用户积分
+        credits_cost = sum(style.credits_cost for style in styles)
+        if user.credits < credits_cost:
+            return False, {"error": "积分不足"}
+        return True, {"styles": styles}
+    
+    @staticmethod
+    async def create_from_stream(
+        db: Session,
+        user_id: int,
+        style_ids: List[int],
+        chunks: AsyncIterator[bytes]
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        用流式上传的原图创建作品
+        
+        先完成风格、积分和并发限制的检查，再把请求体边读边上传到存储，
+        超过 MAX_UPLOAD_SIZE 时立即中止；原图MD5在上传过程中计算。
+        """
+        success, result = ArtworkService._check_styles(db, user_id, style_ids)
+        if not success:
+            return False, result
+        
+        from app.services.generation_queue import GenerationJobService
+        # 命中结果缓存的风格要在上传后才能确定，这里按全部需要生成估算
+        admitted, admission_result = GenerationJobService.check_admission(db, user_id, count=len(result["styles"]))
+        if not admitted:
+            return False, admission_result
+        # 上传期间不占用数据库连接
+        db.rollback()
+        
+        upload_started_at = time.monotonic()
+        max_size = settings.get_int("MAX_UPLOAD_SIZE", 5 * 1024 * 1024)
+        success, streamed_source = await FileStorageService.upload_limited_stream(chunks, max_size, folder="source_images")
+        if not success:
+            return False, streamed_source
+        streamed_source["upload_ms"] = elapsed_ms(upload_started_at, time.monotonic())
+        
+        success, result = await ArtworkService.create_batch(db, user_id, style_ids, streamed_source=streamed_source)
+        if not success:
+            await FileStorageService.delete_file(streamed_source["url"])
+        return success, result
+    
+    @staticmethod
+    async def _verify_direct_upload(user_id: int, object_key: str) -> Tuple[bool, Dict[str, Any]]:
+        """
+        校验客户端直传的原图：对象键属于该用户的直传目录，对象存在且大小、类型符合要求
+        """
+        if not object_key.startswith(FileStorageService.direct_upload_prefix(user_id)) or ".." in object_key:
+            return False, {"error": "无效的图片对象"}
+        success, result = await FileStorageService.head_object(object_key)
+        if not success:
+            return False, {"error": f"读取上传的图片失败: {result['error']}"}
+        max_size = settings.get_int("MAX_UPLOAD_SIZE", 5 * 1024 * 1024)
+        if result["size"] <= 0 or result["size"] > max_size:
+            return False, {"error": f"图片大小不能超过 {max_size // (1024 * 1024)}MB"}
+        if not (result.get("content_type") or "").startswith("image/"):
+            return False, {"error": "上传的文件不是图片"}
+        return True, result
+
+    @staticmethod
+    def reprocess(db: Session, artwork_id: int) -> Tuple[bool, Dict[str, Any]]:
+        """
+        管理员重新生成作品：不扣除积分，任务进入批量通道，不挤占用户的生成任务
+
+        重新生成失败时不退还积分：作品创建时的扣费已经对应过一次生成（成功或已退还），
+        预先设置 refunded_at 使 CreditService.refund_artwork 跳过此作品
+        """
+        from app.services.generation_queue import GenerationJobService, generation_worker_pool, ACTIVE_JOB_STATUSES
+        from app.models.generation_job import GenerationJob, GenerationLane
+        
+        artwork = db.query(Artwork).filter(Artwork.id == artwork_id, Artwork.is_deleted == False).first()
+        if not artwork:
+            return False, {"error": "作品不存在"}
+        
+        job = db.query(GenerationJob).filter(GenerationJob.artwork_id == artwork_id).first()
+        if job and job.status in ACTIVE_JOB_STATUSES:
+            return False, {"error": "作品正在生成中"}
+        
+        aspect_ratio = None
+        if artwork.source_width and artwork.source_height:
+            aspect_ratio = f"{artwork.source_width}:{artwork.source_height}"
+        
+        try:
+            artwork.status = ArtworkStatus.PROCESSING.value
+            artwork.error_message = None
+            artwork.progress = 0
+            if artwork.refunded_at is None:
+                artwork.refunded_at = datetime.now()
+            for column in VARIANT_COLUMNS.values():
+                setattr(artwork, column, None)
+            GenerationJobService.requeue(db, artwork.id, artwork.user_id, aspect_ratio, lane=GenerationLane.BULK.value)
+            db.commit()
+            db.refresh(artwork)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"重新生成作品 {artwork_id} 失败: {str(e)}")
+            return False, {"error": f"重新生成作品失败: {str(e)}"}
+        
+        generation_worker_pool.notify()
+        return True, {"artwork": artwork}
+
+    @staticmethod
+    def cancel(db: Session, artwork_id: int, user_id: int) -> Tuple[bool, Dict[str, Any]]:
+        """
+        用户取消生成中的作品：立即标记失败并退还积分，结束生成任务释放并发名额，
+        再通知执行该任务的worker关闭上游的流（其他进程中的worker通过轮询任务的 cancel_requested 得知）
+        """
+        from app.services.generation_queue import GenerationJobService, generation_worker_pool
+
+        artwork = db.query(Artwork).filter(Artwork.id == artwork_id, Artwork.is_deleted == False).first()
+        if not artwork or artwork.user_id != user_id:
+            return False, {"error": "作品不存在"}
+        if artwork.status != ArtworkStatus.PROCESSING.value:
+            return False, {"error": "作品已生成结束，无法取消"}
+
+        try:
+            GenerationJobService.request_cancel(db, artwork_id)
+            # 与worker写入完成状态的条件更新互斥，只有一方生效
+            if not ArtworkService._mark_failed(db, artwork_id, "已取消生成", should_refund=True):
+                db.rollback()
+                return False, {"error": "作品已生成结束，无法取消"}
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"取消作品 {artwork_id} 失败: {str(e)}")
+            return False, {"error": f"取消作品失败: {str(e)}"}
+
+        logger.info(f"用户 {user_id} 取消了作品 {artwork_id} 的生成")
+        generation_worker_pool.cancel_local(artwork_id)
+        ArtworkService.publish_final_state(db, artwork_id)
+        db.refresh(artwork)
+        return True, {"artwork": artwork}
+    
+    @staticmethod
+    async def process_artwork_style(artwork_id: int, aspect_ratio: Optional[str] = None, allow_retry: bool = False):
+        """
+        处理作品的风格转换（由生成任务worker调用）
+
+        allow_retry为True时，上游连接失败或超时会抛出RetryableGenerationError交由任务队列重试，
+        而不是直接将作品标记为失败
+
+        生成可能持续数分钟，数据库会话只在读取输入和写入进度、结果时短暂打开，
+        等待上游和转存图片期间不占用连接池中的连接
+        """
+        from app.db.session import SessionLocal
+
+        try:
+            # 读取生成所需的输入后立即归还连接
+            db = SessionLocal()
+            try:
+                artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
+                if not artwork or artwork.status != ArtworkStatus.PROCESSING.value:
+                    return
+
+                style = db.query(Style).filter(Style.id == artwork.style_id).first()
+                if not style:
+                    # 更新作品状态为失败
+                    artwork.status = ArtworkStatus.FAILED.value
+                    artwork.error_message = "找不到对应的风格"
+                    db.commit()
+                    return
+
+                source_image_url = artwork.source_image_url
+                source_hash = artwork.source_hash
+                hedge = ArtworkService.should_hedge(db, artwork.user_id, style)
+            finally:
+                # 会话关闭后风格对象已加载的字段仍可读取，写入结果缓存时继续使用
+                db.close()
+
             # 获取原图URL和风格参考图URL
-            source_image_url = artwork.source_image_url
             style_reference_image_url = getattr(style, 'reference_image_url', None)
             
             # 为这些URL生成预签名URL（有效期10分钟）
@@ -189,158 +493,209 @@ class ArtworkService:
                 logger.info(f"Artwork {artwork_id}: 参考图原始URL: {style_reference_image_url}")
                 logger.info(f"Artwork {artwork_id}: 参考图预签名URL: {presigned_reference_url}")
             
-            # 调用生成函数，使用预签名URL
+            # 调用生成函数，使用预签名URL；完成或失败状态由生成函数各自在短事务中写入
             success, final_message = await ArtworkService._generate_styled_image_with_progress(
-                db=db,
                 artwork_id=artwork_id,
                 source_image_url=presigned_source_url,  # 使用预签名URL
                 style_name=style.name,
                 style_description=style.prompt,
                 style_reference_image_url=presigned_reference_url,  # 使用预签名参考图URL
-                aspect_ratio=aspect_ratio  # 传递宽高比
+                aspect_ratio=aspect_ratio,  # 传递宽高比
+                allow_retry=allow_retry,
+                hedge=hedge
             )
             
             if success:
-                # 更新作品信息
-                artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                if artwork:
-                    artwork.result_image_url = final_message
-                    artwork.status = ArtworkStatus.COMPLETED.value
-                    db.commit()
-            else:
-                # 处理失败，不再需要在这里退还积分，handle_failure 已经处理
-                artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                if not artwork:
-                    return
-                
-                # 更新作品状态为失败 (状态已由 handle_failure 设置，这里可以保留以防万一)
-                artwork.status = ArtworkStatus.FAILED.value
-                artwork.error_message = final_message  # 错误信息
-                db.commit()
+                db = SessionLocal()
+                try:
+                    ResultCacheService.store(db, source_hash, style, final_message, artwork_id)
+                finally:
+                    db.close()
         
+        except RetryableGenerationError:
+            raise
         except Exception as e:
             logger.error(f"处理作品风格时发生错误: {str(e)}")
+            db = SessionLocal()
             try:
-                # 尝试更新作品状态为失败
-                artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                if artwork and artwork.status == ArtworkStatus.PROCESSING.value:
-                    artwork.status = ArtworkStatus.FAILED.value
-                    artwork.error_message = f"处理过程中发生错误: {str(e)}"
-                    
-                    # 退还积分
-                    user = db.query(User).filter(User.id == artwork.user_id).first()
-                    style = db.query(Style).filter(Style.id == artwork.style_id).first()
-                    if user and style:
-                        credits_cost = style.credits_cost
-                        try:
-                            CreditService.update_credits(
-                                db=db,
-                                user_id=user.id,
-                                amount=credits_cost,  # 退还积分
-                                type="other",
-                                description=f"作品ID {artwork.id} 风格转换失败退还积分",
-                                related_id=artwork.id
-                            )
-                            logger.info(f"Refunded {credits_cost} credits to user {user.id} for failed artwork {artwork_id}")
-                        except Exception as refund_e:
-                             logger.error(f"Failed to refund credits for artwork {artwork_id}: {refund_e}")
-                             # Don't overwrite original error message if refund fails
-                             if not artwork.error_message:
-                                 artwork.error_message = f"{final_message} (积分退还失败: {refund_e})"
-
-
-                try:
+                # 尝试更新作品状态为失败并退还积分
+                if ArtworkService._mark_failed(db, artwork_id, f"处理过程中发生错误: {str(e)}", should_refund=True):
                     db.commit()
-                except Exception as commit_e:
-                     logger.error(f"Error committing failure status for artwork {artwork_id}: {commit_e}")
-                     db.rollback() # Rollback on commit error
-
             except Exception as inner_e:
+                db.rollback()
                 logger.error(f"更新失败状态时发生错误: {str(inner_e)}")
+            finally:
+                db.close()
         finally:
-            db.close()
+            progress_sink.discard(artwork_id)
+            db = SessionLocal()
+            try:
+                ArtworkTimingService.save(db, artwork_id)
+                ArtworkService.publish_final_state(db, artwork_id)
+            finally:
+                db.close()
     
     @staticmethod
     async def _generate_styled_image_with_progress(
-        db: Session,
         artwork_id: int,
         source_image_url: str,
         style_name: str,
         style_description: Optional[str] = None,
         style_reference_image_url: Optional[str] = None,
-        aspect_ratio: Optional[str] = None
+        aspect_ratio: Optional[str] = None,
+        allow_retry: bool = False,
+        hedge: bool = False
     ) -> Tuple[bool, str]:
         """
         调用AI服务生成风格化图片，使用健壮的SSE流处理逻辑，并实时更新进度。
+        hedge为True时主上游迟迟没有进度会向另一个上游发起对冲请求。
         """
-        artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-        if not artwork:
-            logger.error(f"Artwork ID {artwork_id} not found for progress update.")
-            return False, "作品记录未找到"
+        from app.db.session import SessionLocal
 
         # --- Helper function for failure handling ---
         async def handle_failure(error_message: str, should_refund: bool = True):
             logger.error(f"Artwork {artwork_id} failed: {error_message}")
-            artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first() # Re-fetch in case session changed
-            if artwork and artwork.status == ArtworkStatus.PROCESSING.value:
-                artwork.status = ArtworkStatus.FAILED.value
-                artwork.error_message = error_message
-
-                if should_refund:
-                    user = db.query(User).filter(User.id == artwork.user_id).first()
-                    style = db.query(Style).filter(Style.id == artwork.style_id).first()
-                    if user and style:
-                        credits_cost = style.credits_cost
-                        try:
-                            CreditService.update_credits(
-                                db=db,
-                                user_id=user.id,
-                                amount=credits_cost,  # 退还积分
-                                type="refund",
-                                description=f"作品ID {artwork_id} 风格转换失败退还积分",
-                                related_id=artwork.id
-                            )
-                            logger.info(f"Refunded {credits_cost} credits to user {user.id} for failed artwork {artwork_id}")
-                        except Exception as refund_e:
-                             logger.error(f"Failed to refund credits for artwork {artwork_id}: {refund_e}")
-                             # Don't overwrite original error message if refund fails
-                             if not artwork.error_message:
-                                 artwork.error_message = f"{error_message} (积分退还失败: {refund_e})"
+            db = SessionLocal()
+            try:
+                if ArtworkService._mark_failed(db, artwork_id, error_message, should_refund):
+                    db.commit()
+            except Exception as commit_e:
+                 logger.error(f"Error committing failure status for artwork {artwork_id}: {commit_e}")
+                 db.rollback() # Rollback on commit error
+            finally:
+                db.close()
 
+            return False, error_message
+
+        # 进度先写入内存并推送给订阅者，由 progress_sink 合并批量落库，到达100%时立即写入
+        async def report_progress(progress: int):
+            progress_sink.report(artwork_id, progress)
+            progress_broker.publish(artwork_id, "progress", {"status": ArtworkStatus.PROCESSING.value, "progress": progress})
+            if progress >= 100:
+                await progress_sink.flush_artwork(artwork_id)
+
+        request_args = (source_image_url, style_description, style_reference_image_url, aspect_ratio)
+        try:
+            if hedge:
+                parser = await ArtworkService._request_with_hedging(artwork_id, report_progress, request_args)
+            else:
+                parser = GenerationStreamParser()
+                async with ai_upstreams.acquire() as lease:
+                    await ArtworkService._request_generation_stream(artwork_id, lease, parser, report_progress, *request_args)
+        except AIUpstreamUnavailableError as e:
+            if allow_retry:
+                raise RetryableGenerationError(str(e))
+            return await handle_failure(str(e))
+        except UpstreamRequestError as e:
+            # 限流、服务端错误和网络错误交由任务队列重试
+            if allow_retry and e.retryable:
+                raise RetryableGenerationError(str(e))
+            return await handle_failure(str(e))
+
+        return await ArtworkService._finish_generation(artwork_id, parser, handle_failure)
+
+    @staticmethod
+    def should_hedge(db: Session, user_id: int, style: Style) -> bool:
+        """
+        是否对该任务启用对冲请求：风格开启了对冲，或用户属于 GENERATION_HEDGE_TIER 指定的范围
+        （off-不启用，paid-有过付费订单的用户，all-所有用户）
+        """
+        if style.hedge_enabled:
+            return True
+        tier = (settings.get("GENERATION_HEDGE_TIER", "off") or "off").lower()
+        if tier == "all":
+            return True
+        if tier == "paid":
+            return UserService.is_paid_user(db, user_id)
+        return False
+
+    @staticmethod
+    async def _request_with_hedging(artwork_id: int, report_progress, request_args: tuple) -> GenerationStreamParser:
+        """
+        对冲请求：主上游在 GENERATION_HEDGE_DELAY 秒内没有返回任何进度时，向另一个上游再发一次相同的请求，
+        先拿到结果URL的一方胜出，另一方的流被取消。两个请求属于同一作品，积分只扣一次。
+        """
+        hedge_delay = settings.get_float("GENERATION_HEDGE_DELAY", 20.0)
+        progressed = asyncio.Event()
+        tasks: Dict[asyncio.Task, GenerationStreamParser] = {}
+
+        def start(lease: UpstreamLease, on_event=None) -> asyncio.Task:
+            parser = GenerationStreamParser()
+            task = asyncio.create_task(ArtworkService._request_generation_stream(
+                artwork_id, lease, parser, report_progress, *request_args, on_event=on_event
+            ))
+            tasks[task] = parser
+            return task
+
+        ai_upstreams.record_hedge("eligible")
+        async with AsyncExitStack() as leases:
+            primary_lease = await leases.enter_async_context(ai_upstreams.acquire())
+            primary = start(primary_lease, progressed.set)
+            try:
+                waiter = asyncio.create_task(progressed.wait())
+                await asyncio.wait({primary, waiter}, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if primary.done() or progressed.is_set():
+                    await primary
+                    return tasks[primary]
 
                 try:
-                    db.commit()
-                except Exception as commit_e:
-                     logger.error(f"Error committing failure status for artwork {artwork_id}: {commit_e}")
-                     db.rollback() # Rollback on commit error
+                    # 不等待并发额度，没有其他可用上游时不对冲
+                    hedge_lease = await leases.enter_async_context(
+                        ai_upstreams.acquire(exclude={primary_lease.upstream.name}, timeout=0)
+                    )
+                except AIUpstreamUnavailableError:
+                    ai_upstreams.record_hedge("skipped")
+                    await primary
+                    return tasks[primary]
+
+                logger.info(f"Artwork {artwork_id}: {primary_lease.upstream.name} 在 {hedge_delay} 秒内没有进度，对冲请求 {hedge_lease.upstream.name}")
+                ai_upstreams.record_hedge("hedged")
+                hedge = start(hedge_lease)
+
+                pending = {primary, hedge}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if not task.exception() and tasks[task].result_url:
+                            ai_upstreams.record_hedge("hedge_wins" if task is hedge else "primary_wins")
+                            return tasks[task]
+
+                # 双方都没有结果：优先使用主请求的结论
+                ai_upstreams.record_hedge("no_winner")
+                for task in (primary, hedge):
+                    if not task.exception():
+                        return tasks[task]
+                raise primary.exception()
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
-            return False, error_message
+    @staticmethod
+    async def _request_generation_stream(
+        artwork_id: int,
+        lease: UpstreamLease,
+        parser: GenerationStreamParser,
+        report_progress,
+        source_image_url: str,
+        style_description: Optional[str],
+        style_reference_image_url: Optional[str],
+        aspect_ratio: Optional[str],
+        on_event: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        向选中的AI上游发起生成请求，并将SSE流交给parser解析，请求结果计入上游的健康状态
 
-        # --- Regex patterns and Keywords (from hehe.py) ---
-        progress_percent_pattern = re.compile(r"进度：\s*(\d{1,3}(?:\.\d+)?)\s*%")
-        url_pattern = re.compile(r"(?:点击)?下载\s*(https?://\S+?)\s*|!\[.*?\]\((https?://\S+?)\)")
-        failure_pattern = re.compile(r">\s*生成失败\s*❌\s*(?:\n?>\s*失败原因：\s*(.*))?", re.MULTILINE)
-        json_block_pattern = re.compile(r"```json\n.*?\n```", re.DOTALL)
-
-        progress_keywords = ["进度", "🏃‍"]
-        generating_keywords = ["生成中", "⚡", "绘制中"]
-        queued_keywords = ["排队中", "🕐", "队列中"]
-        completion_keywords = ["生成完成", "✅", "绘制成功"]
-        error_keywords = ["错误", "异常", "failed", "error", "unable", "cannot", "失败"]
-
-        # --- State variables ---
-        full_response_content = ""
-        last_reported_progress = artwork.progress or 0 # Initialize with current progress
-        url_yielded = False
-        error_yielded = False
-        stream_done = False
-        potential_error_fragments = []
-        final_image_url = None
-        final_result_url_internal = None # For internal storage URL
+        Raises:
+            UpstreamRequestError: 请求失败或响应无法解析
+        """
+        upstream = lease.upstream
 
         try:
             # 准备API请求
-            api_url = f"{settings.OPENAI_API_URL}/chat/completions"
+            api_url = f"{upstream.url}/chat/completions"
             prompt = style_description
             # 如果存在宽高比，则在提示词末尾添加比例信息
             if aspect_ratio:
@@ -363,7 +718,7 @@ class ArtworkService:
 
 
             payload = {
-                "model": settings.OPENAI_IMAGE_MODEL, # Use model from settings
+                "model": upstream.model or settings.OPENAI_IMAGE_MODEL, # 上游未指定模型时使用全局配置
                 "messages": [
                     # {"role": "system", "content": "你是一个有用的助手，擅长图像风格转换。"}, # Optional system prompt
                     {
@@ -376,242 +731,205 @@ class ArtworkService:
 
             print("载荷", json.dumps(payload, indent=4, ensure_ascii=False))
             headers = {
-                "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
+                "Authorization": f"Bearer {lease.api_key.key}",
                 "Content-Type": "application/json",
                 "Accept": "text/event-stream" # Ensure correct Accept header
             }
 
-            # 使用 get_float 获取配置，并提供默认值
-            async with httpx.AsyncClient(timeout=settings.get_float("OPENAI_TIMEOUT", 600.0)) as client:
-                async with client.stream("POST", api_url, json=payload, headers=headers) as response:
-                    logger.info(f"Artwork {artwork_id}: Connection established (Status: {response.status_code})")
-                    if response.status_code != 200:
-                        error_body = await response.aread()
-                        error_msg = f"AI服务API请求失败: HTTP {response.status_code} - {error_body.decode('utf-8', errors='ignore')}"
-                        return await handle_failure(error_msg)
-
-                    async for line in response.aiter_lines():
-                        if error_yielded: continue # Stop processing if a definitive error occurred
-
-                        if line:
-                            decoded_line = line # httpx handles decoding by default
-                            # logger.debug(f"Artwork {artwork_id} Raw line: {decoded_line}") # Very verbose debug
-
-                            if decoded_line.startswith('data: '):
-                                json_str = decoded_line[len('data: '):].strip()
-
-                                if json_str == '[DONE]':
-                                    logger.info(f"Artwork {artwork_id}: Stream finished ([DONE] received).")
-                                    logger.info(f"Artwork {artwork_id}: decoded_line content: {decoded_line}")
-                                    stream_done = True
-                                    break
-
-                                try:
-                                    chunk = json.loads(json_str)
-                                    delta = chunk.get('choices', [{}])[0].get('delta', {})
-                                    content = delta.get('content')
-
-                                    if content:
-                                        full_response_content += content
-                                        # logger.debug(f"Artwork {artwork_id} Accumulated: '{full_response_content}'")
-
-                                        # --- Create a version of content excluding JSON blocks for status checks ---
-                                        content_for_status_check = json_block_pattern.sub("", full_response_content)
-
-                                        # --- Check for Specific Failure Pattern (Highest Priority) ---
-                                        if not error_yielded:
-                                            failure_match = failure_pattern.search(full_response_content)
-                                            if failure_match:
-                                                reason = failure_match.group(1)
-                                                error_message = "生成失败 ❌"
-                                                if reason:
-                                                    error_message += f" 原因：{reason.strip()}"
-                                                logger.warning(f"Artwork {artwork_id}: Specific failure detected: {error_message}")
-                                                _, final_msg = await handle_failure(error_message) # Set state to failed
-                                                error_yielded = True
-                                                last_reported_progress = "生成失败" # Update display state
-                                                continue # Move to next chunk
-
-                                        # --- Check Progress (if not failed) ---
-                                        if not error_yielded:
-                                            current_progress_value = None
-                                            progress_type = None
-                                            progress_message = None
-
-                                            # Check Percentage
-                                            if any(kw in content_for_status_check for kw in progress_keywords):
-                                                matches = list(progress_percent_pattern.finditer(content_for_status_check))
-                                                if matches:
-                                                    try:
-                                                        latest_percentage_float = float(matches[-1].group(1))
-                                                        current_progress_value = min(int(latest_percentage_float), 100)
-                                                        progress_type = 'percentage'
-                                                    except (ValueError, IndexError): pass
-
-                                            # Check Generating
-                                            if current_progress_value is None and any(kw in content_for_status_check for kw in generating_keywords):
-                                                progress_message = '生成中...'
-                                                progress_type = 'message'
-
-                                            # Check Queued
-                                            if current_progress_value is None and any(kw in content_for_status_check for kw in queued_keywords):
-                                                progress_message = '排队中...'
-                                                progress_type = 'message'
-
-                                            # Check Completion
-                                            if any(kw in content_for_status_check for kw in completion_keywords):
-                                                if last_reported_progress != '生成完成':
-                                                    progress_message = '生成完成'
-                                                    progress_type = 'message'
-                                                if last_reported_progress != 100: # Also ensure 100%
-                                                     # Yield 100% progress immediately
-                                                     artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                                                     if artwork and artwork.status == ArtworkStatus.PROCESSING.value:
-                                                         artwork.progress = 100
-                                                         try:
-                                                             db.commit()
-                                                             logger.info(f"Artwork {artwork_id}: Progress updated to 100% (Completion Keyword)")
-                                                             last_reported_progress = 100
-                                                         except Exception as commit_e:
-                                                             logger.error(f"Artwork {artwork_id}: Error committing 100% progress: {commit_e}")
-                                                             db.rollback()
-
-
-                                            # Update DB if progress changed
-                                            progress_to_report = None
-                                            if progress_type == 'percentage' and current_progress_value is not None and current_progress_value != last_reported_progress:
-                                                 progress_to_report = current_progress_value
-                                            elif progress_type == 'message' and progress_message is not None and progress_message != last_reported_progress:
-                                                 # For message-based progress, we still store a percentage if possible,
-                                                 # but use the message for comparison. We don't store the message itself.
-                                                 if progress_message == '生成完成':
-                                                     progress_to_report = 100 # Completion implies 100%
-                                                 # elif progress_message == '生成中...': # Assign intermediate percentages if needed
-                                                 #     progress_to_report = 50 # Example
-                                                 # elif progress_message == '排队中...':
-                                                 #     progress_to_report = 10 # Example
-                                                 else:
-                                                      # If it's just a message like "Generating...", try to keep the last numeric progress
-                                                      if isinstance(last_reported_progress, int):
-                                                          pass # Keep last numeric progress
-                                                      else: # Or set a default if none exists
-                                                          progress_to_report = artwork.progress if artwork.progress else 1 # Minimal progress
-
-
-                                            if progress_to_report is not None and progress_to_report > (artwork.progress or 0):
-                                                artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                                                if artwork and artwork.status == ArtworkStatus.PROCESSING.value:
-                                                    artwork.progress = progress_to_report
-                                                    try:
-                                                        db.commit()
-                                                        logger.info(f"Artwork {artwork_id}: Progress updated to {progress_to_report}%")
-                                                        last_reported_progress = progress_to_report if progress_type == 'percentage' else progress_message
-                                                    except Exception as commit_e:
-                                                        logger.error(f"Artwork {artwork_id}: Error committing progress {progress_to_report}%: {commit_e}")
-                                                        db.rollback()
-
-
-                                        # --- Check for Result URL (if not failed and not found yet) ---
-                                        if not url_yielded and not error_yielded:
-                                            url_match = url_pattern.search(full_response_content)
-                                            if url_match:
-                                                potential_url = url_match.group(1) or url_match.group(2)
-                                                if potential_url:
-                                                    logger.info(f"Artwork {artwork_id}: Result URL found: {potential_url}")
-                                                    final_image_url = potential_url # Store the found URL
-                                                    url_yielded = True
-                                                    # Ensure 100% progress is shown when URL appears
-                                                    if last_reported_progress != 100 and last_reported_progress != '生成完成':
-                                                         artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                                                         if artwork and artwork.status == ArtworkStatus.PROCESSING.value and artwork.progress < 100:
-                                                             artwork.progress = 100
-                                                             try:
-                                                                 db.commit()
-                                                                 logger.info(f"Artwork {artwork_id}: Progress set to 100% (URL found)")
-                                                                 last_reported_progress = 100
-                                                             except Exception as commit_e:
-                                                                 logger.error(f"Artwork {artwork_id}: Error committing 100% progress (URL found): {commit_e}")
-                                                                 db.rollback()
-
-
-                                        # --- Basic Error Keyword Check (Fallback) ---
-                                        if not error_yielded and not url_yielded: # Only check if no definite outcome yet
-                                            content_lower = content.lower()
-                                            # Check keywords AND avoid checking inside potential JSON fragments
-                                            if not content.strip().startswith(("{",'"')) and not content.strip().endswith(("}",'"')) and any(keyword in content_lower for keyword in error_keywords):
-                                                 # Avoid flagging progress/completion/URL markdown
-                                                 if not content.startswith(('>', '✅', '[', '![', '🏃‍', '🕐', '⚡')) and len(content) < 150: # Increased length limit slightly
-                                                    logger.warning(f"Artwork {artwork_id}: Potential fallback error text detected: {content.strip()}")
-                                                    potential_error_fragments.append(content.strip())
-
-
-                                except json.JSONDecodeError:
-                                    if not error_yielded:
-                                        logger.warning(f"Artwork {artwork_id}: Could not decode JSON: {json_str}")
-                                        _, final_msg = await handle_failure('Stream decode error: Invalid JSON received.')
-                                        error_yielded = True
-                                except Exception as e:
-                                     if not error_yielded:
-                                        logger.error(f"Artwork {artwork_id}: Error processing chunk content: {e}", exc_info=True)
-                                        _, final_msg = await handle_failure(f'处理流数据块时出错: {e}')
-                                        error_yielded = True
+            # 使用共享的AI连接池，超时使用 get_float 获取配置，并提供默认值；
+            # 首字节（含响应头）超过 AI_FIRST_TOKEN_TIMEOUT 秒视为上游失败
+            client = http_clients.get("ai")
+            request = client.build_request(
+                "POST",
+                api_url,
+                json=payload,
+                headers=headers,
+                timeout=httpx.Timeout(
+                    settings.get_float("OPENAI_TIMEOUT", 600.0),
+                    connect=settings.get_float("HTTP_AI_CONNECT_TIMEOUT", 10.0)
+                )
+            )
+            async with open_stream(client, request, lease) as response:
+                logger.info(f"Artwork {artwork_id}: Connection established via {upstream.name} (Status: {response.status_code})")
+                if response.status_code != 200:
+                    if response.status_code == 429:
+                        # 限流针对的是API Key，冷却该Key而不计入上游健康状态
+                        lease.rate_limited(response.headers.get("Retry-After"))
+                    else:
+                        lease.fail()
+                    error_body = await response.aread()
+                    error_msg = f"AI服务API请求失败: HTTP {response.status_code} - {error_body.decode('utf-8', errors='ignore')}"
+                    raise UpstreamRequestError(error_msg, retryable=response.status_code == 429 or response.status_code >= 500)
+
+                async for line in iter_lines_with_first_token_timeout(response, lease):
+                    events = parser.feed_sse_line(line)
+                    if events and on_event:
+                        on_event()
+                    for event in events:
+                        if event.type == StreamEventType.PROGRESS:
+                            await report_progress(event.value)
+                        elif event.type in (StreamEventType.QUEUED, StreamEventType.GENERATING):
+                            progress_broker.publish(artwork_id, event.type.value, {"status": ArtworkStatus.PROCESSING.value})
+                        elif event.type == StreamEventType.RESULT_URL:
+                            logger.info(f"Artwork {artwork_id}: Result URL found: {event.value}")
+
+                    if parser.done:
+                        logger.info(f"Artwork {artwork_id}: Stream finished ([DONE] received).")
+                        break
+                    if parser.failed:
+                        break
 
             # --- Final Check after stream ends ---
-            logger.info(f"Artwork {artwork_id}: Performing final check. Stream Done: {stream_done}, Error Yielded: {error_yielded}, URL Yielded: {url_yielded}")
+            if not parser.done:
+                for event in parser.finish():
+                    if event.type == StreamEventType.PROGRESS:
+                        await report_progress(event.value)
+            logger.info(f"Artwork {artwork_id}: Performing final check. Stream Done: {parser.done}, Failed: {parser.failed}, URL Found: {parser.result_url is not None}")
+
+            # 上游返回了结果或明确的失败原因即视为上游正常，流中断且没有任何结论时计为上游失败
+            if parser.result_url or parser.failed:
+                lease.succeed()
+            else:
+                lease.fail()
+
+            # 对冲请求中被取消的一方不会执行到这里，记录的是最终采用的请求
+            stream_seconds = time.monotonic() - lease.started_at - (lease.first_token_seconds or 0.0)
+            ArtworkTimingService.record(
+                artwork_id,
+                upstream=upstream.name,
+                upstream_connect_ms=int(lease.connected_seconds * 1000) if lease.connected_seconds is not None else None,
+                first_token_ms=int(lease.first_token_seconds * 1000) if lease.first_token_seconds is not None else None,
+                stream_ms=int(stream_seconds * 1000) if lease.first_token_seconds is not None else None,
+            )
+
+        except httpx.TimeoutException as e:
+            lease.fail()
+            raise UpstreamRequestError(str(e) if isinstance(e, FirstTokenTimeoutError) else "API 请求超时", retryable=True)
+        except httpx.RequestError as e:
+            # Network errors, DNS errors etc.
+            lease.fail()
+            raise UpstreamRequestError(f"API 请求失败: {e}", retryable=True)
 
+    @staticmethod
+    async def _finish_generation(artwork_id: int, parser: GenerationStreamParser, handle_failure) -> Tuple[bool, str]:
+        """
+        根据上游的结论更新作品：转存结果图片并标记完成，或按失败处理
+        转存图片期间不占用数据库连接，只在检查和写入状态时使用短事务
+        """
+        from app.db.session import SessionLocal
+
+        final_result_url_internal = None # For internal storage URL
+
+        try:
             # Refresh artwork state before final checks
-            artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-            if not artwork:
+            db = SessionLocal()
+            try:
+                artwork_state = db.query(Artwork.status, Artwork.error_message).filter(Artwork.id == artwork_id).first()
+            finally:
+                db.close()
+            if not artwork_state:
                 return False, "作品记录在最终检查时丢失" # Should not happen normally
 
             # If already failed, return the stored message
-            if artwork.status == ArtworkStatus.FAILED.value:
+            if artwork_state.status == ArtworkStatus.FAILED.value:
                 logger.info(f"Artwork {artwork_id}: Final check confirms failure state.")
-                return False, artwork.error_message or "处理失败"
+                return False, artwork_state.error_message or "处理失败"
 
-            # Check URL one last time if not already found (search full content)
-            if not url_yielded and not error_yielded:
-                url_match = url_pattern.search(full_response_content)
-                if url_match:
-                    potential_url = url_match.group(1) or url_match.group(2)
-                    if potential_url:
-                        logger.info(f"Artwork {artwork_id}: Result URL found in final check: {potential_url}")
-                        final_image_url = potential_url
-                        url_yielded = True
+            # --- Check for Specific Failure reported by upstream ---
+            if parser.failed:
+                logger.warning(f"Artwork {artwork_id}: Specific failure detected: {parser.failure_message}")
+                return await handle_failure(parser.failure_message)
 
+            final_image_url = parser.result_url
 
             # --- Process Final State ---
-            if url_yielded and final_image_url:
+            if final_image_url:
                 logger.info(f"Artwork {artwork_id}: Proceeding with final image URL: {final_image_url}")
 
-                # Download the generated image with retries
-                download_success = False
+                # 流式下载结果图片并直接上传到内部存储，只校验文件头，内存中最多缓存一个上传分片
+                upload_success = False
+                cos_result = ""
                 download_error = ""
-                image_base64 = None
+                variants_enabled = settings.get_bool("IMAGE_VARIANTS_ENABLED", True)
+                result_bytes = None  # 生成派生图使用的结果图（水印后）
                 max_retries = 3 # Reduced retries for faster failure
                 retry_delay = 2 # Base delay
 
                 for attempt in range(max_retries):
                     try:
-                        async with httpx.AsyncClient() as img_client:
-                            img_response = await img_client.get(final_image_url, timeout=60.0) # Increased download timeout
+                        download_started_at = time.monotonic()
+                        img_client = http_clients.get("storage")
+                        async with img_client.stream("GET", final_image_url) as img_response:
                             img_response.raise_for_status() # Raise HTTP errors
-                            image_bytes = await img_response.aread()
-                            # Optional: Verify image data (e.g., using Pillow)
-                            try:
-                                Image.open(io.BytesIO(image_bytes)).verify()
-                                # 添加水印 (在上传到COS之前)
-                                # image_base64 = await ArtworkService.add_watermark_to_image(image_bytes)
-                                # 暂时禁用水印功能，直接使用原始图片
-                                image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-                                download_success = True
-                                logger.info(f"Artwork {artwork_id}: Image downloaded successfully from {final_image_url}")
-                                break # Exit retry loop on success
-                            except Exception as img_verify_e:
-                                download_error = f"下载的文件无效或不是图片: {img_verify_e}"
+                            chunks = img_response.aiter_bytes()
+                            header = b""
+                            while len(header) < SNIFF_BYTES:
+                                try:
+                                    header += await chunks.__anext__()
+                                except StopAsyncIteration:
+                                    break
+
+                            image_format = sniff_image_format(header)
+                            if image_format is None:
+                                download_error = "下载的文件无效或不是图片"
                                 logger.error(f"Artwork {artwork_id}: {download_error}")
                                 break # Don't retry if file is invalid
 
+                            async def image_chunks():
+                                yield header
+                                async for chunk in chunks:
+                                    yield chunk
+
+                            file_ext, content_type = image_file_info(image_format)
+                            if settings.get_bool("WATERMARK_ENABLED", False):
+                                # 添加水印需要完整图片，在图片进程池中处理后上传
+                                image_bytes = b"".join([chunk async for chunk in image_chunks()])
+                                watermark_started_at = time.monotonic()
+                                image_bytes = await ArtworkService.add_watermark_to_image(image_bytes)
+                                upload_started_at = time.monotonic()
+                                ArtworkTimingService.record(
+                                    artwork_id,
+                                    result_download_ms=elapsed_ms(download_started_at, watermark_started_at),
+                                    watermark_ms=elapsed_ms(watermark_started_at, upload_started_at),
+                                )
+                                upload_success, cos_result = await FileStorageService.upload_bytes(
+                                    image_bytes,
+                                    folder="result_images",
+                                    file_ext=file_ext,
+                                    content_type=content_type
+                                )
+                                result_bytes = image_bytes
+                            else:
+                                upload_started_at = time.monotonic()
+                                ArtworkTimingService.record(
+                                    artwork_id,
+                                    result_download_ms=elapsed_ms(download_started_at, upload_started_at),
+                                )
+                                # 需要生成派生图时边上传边保留一份完整图片
+                                received = [] if variants_enabled else None
+
+                                async def upload_chunks():
+                                    async for chunk in image_chunks():
+                                        if received is not None:
+                                            received.append(chunk)
+                                        yield chunk
+
+                                upload_success, cos_result = await FileStorageService.upload_stream(
+                                    upload_chunks(),
+                                    folder="result_images",
+                                    file_ext=file_ext,
+                                    content_type=content_type
+                                )
+                                if received is not None:
+                                    result_bytes = b"".join(received)
+                            ArtworkTimingService.record(
+                                artwork_id,
+                                result_upload_ms=elapsed_ms(upload_started_at, time.monotonic()),
+                            )
+                        download_error = ""
+                        logger.info(f"Artwork {artwork_id}: Image transferred from {final_image_url}")
+                        break # Exit retry loop once the download completed
+
                     except httpx.HTTPStatusError as e:
                         download_error = f"下载图片时HTTP错误: {e.response.status_code}"
                         logger.warning(f"Artwork {artwork_id}: Attempt {attempt + 1}/{max_retries} failed: {download_error}")
@@ -627,72 +945,67 @@ class ArtworkService:
                         logger.info(f"Artwork {artwork_id}: Waiting {wait_time}s before next download attempt.")
                         await asyncio.sleep(wait_time)
 
-                if not download_success or not image_base64:
+                if download_error:
                     err_msg = f"无法下载或验证最终图片 (已重试 {max_retries} 次): {download_error}"
                     return await handle_failure(err_msg)
 
-                # 上传到内部存储
-                upload_success, cos_result = await FileStorageService.upload_base64_image(
-                    image_base64,
-                    folder="result_images" # Ensure this folder exists or is handled
-                )
-
                 if upload_success:
                     final_result_url_internal = cos_result
                     logger.info(f"Artwork {artwork_id}: Result image uploaded to: {final_result_url_internal}")
+                    variant_urls = {}
+                    if variants_enabled and result_bytes:
+                        variant_urls = await ArtworkService._upload_variants(artwork_id, result_bytes)
+                        result_bytes = None
                     # Final success update
-                    artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
-                    if artwork:
-                         artwork.result_image_url = final_result_url_internal
-                         artwork.status = ArtworkStatus.COMPLETED.value
-                         artwork.progress = 100 # Ensure progress is 100
-                         artwork.error_message = None # Clear any previous transient errors
-                         try:
-                            db.commit()
-                            logger.info(f"Artwork {artwork_id}: Status set to COMPLETED.")
-                            return True, final_result_url_internal
-                         except Exception as commit_e:
-                              logger.error(f"Artwork {artwork_id}: Error committing completion status: {commit_e}")
-                              db.rollback()
-                              # Even if commit fails, the image is generated and uploaded,
-                              # but the status is inconsistent. Treat as failure for now.
-                              return await handle_failure(f"完成状态提交失败: {commit_e}", should_refund=False) # Don't refund if image was generated
-
-                    else:
-                        # Should not happen if initial check passed
-                         logger.error(f"Artwork {artwork_id}: Record disappeared before final update.")
-                         return await handle_failure("作品记录在最终更新前丢失", should_refund=False)
+                    db = SessionLocal()
+                    try:
+                        # 条件更新：生成期间用户取消（已标记失败并退款）时不再覆盖为完成
+                        completed = db.query(Artwork).filter(
+                            Artwork.id == artwork_id,
+                            Artwork.status == ArtworkStatus.PROCESSING.value
+                        ).update({
+                            Artwork.result_image_url: final_result_url_internal,
+                            **{getattr(Artwork, column): variant_urls.get(column) for column in VARIANT_COLUMNS.values()},
+                            Artwork.status: ArtworkStatus.COMPLETED.value,
+                            Artwork.progress: 100, # Ensure progress is 100
+                            Artwork.error_message: None, # Clear any previous transient errors
+                        }, synchronize_session=False)
+                        db.commit()
+                        if not completed:
+                            artwork_state = db.query(Artwork.status, Artwork.error_message).filter(Artwork.id == artwork_id).first()
+                    except Exception as commit_e:
+                        logger.error(f"Artwork {artwork_id}: Error committing completion status: {commit_e}")
+                        db.rollback()
+                        # Even if commit fails, the image is generated and uploaded,
+                        # but the status is inconsistent. Treat as failure for now.
+                        return await handle_failure(f"完成状态提交失败: {commit_e}", should_refund=False) # Don't refund if image was generated
+                    finally:
+                        db.close()
+
+                    if completed:
+                        logger.info(f"Artwork {artwork_id}: Status set to COMPLETED.")
+                        return True, final_result_url_internal
+
+                    logger.info(f"Artwork {artwork_id}: No longer processing ({artwork_state.status if artwork_state else 'deleted'}), result discarded.")
+                    for url in [final_result_url_internal, *variant_urls.values()]:
+                        await FileStorageService.delete_file(url)
+                    return False, (artwork_state.error_message if artwork_state else None) or "处理失败"
 
                 else:
                     err_msg = f"上传结果图片失败: {cos_result}"
                     return await handle_failure(err_msg, should_refund=False) # Don't refund if image generated but upload failed
 
             # --- Handle cases where no URL was found and no specific error occurred ---
-            elif not error_yielded:
-                logger.warning(f"Artwork {artwork_id}: Stream finished, but no result URL found and no specific failure message.")
-                error_message = '处理完成，但结果不明确（未找到URL，无特定错误）。'
-                if potential_error_fragments:
-                     # Use set to remove duplicates and join
-                     unique_fragments = "; ".join(list(set(potential_error_fragments)))
-                     error_message = f"检测到潜在问题: {unique_fragments}"
-                     logger.warning(f"Artwork {artwork_id}: Reporting potential fallback errors: {error_message}")
-
-                return await handle_failure(error_message)
-
-            # If we reach here, it means error_yielded was true, and handle_failure was already called.
-            # We return the result from the initial handle_failure call.
-            # The artwork status should already be FAILED in the DB.
-            artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first() # Fetch final state
-            final_msg = artwork.error_message if artwork else "处理失败，状态未知"
-            logger.info(f"Artwork {artwork_id}: Process finished in error state: {final_msg}")
-            return False, final_msg
-
-
-        except httpx.TimeoutException:
-            return await handle_failure("API 请求超时")
-        except httpx.RequestError as e:
-            # Network errors, DNS errors etc.
-             return await handle_failure(f"API 请求失败: {e}")
+            logger.warning(f"Artwork {artwork_id}: Stream finished, but no result URL found and no specific failure message.")
+            error_message = '处理完成，但结果不明确（未找到URL，无特定错误）。'
+            if parser.potential_errors:
+                # Use set to remove duplicates and join
+                unique_fragments = "; ".join(list(set(parser.potential_errors)))
+                error_message = f"检测到潜在问题: {unique_fragments}"
+                logger.warning(f"Artwork {artwork_id}: Reporting potential fallback errors: {error_message}")
+
+            return await handle_failure(error_message)
+
         except Exception as e:
             # Catch any other unexpected errors during the process
             logger.error(f"Artwork {artwork_id}: An unexpected error occurred in _generate_styled_image_with_progress: {e}", exc_info=True)
@@ -700,6 +1013,111 @@ class ArtworkService:
             tb_str = traceback.format_exc()
             return await handle_failure(f"处理过程中发生意外错误: {e}\n{tb_str[:500]}...") # Limit traceback length
 
+    @staticmethod
+    async def _upload_variants(artwork_id: int, image_bytes: bytes) -> Dict[str, str]:
+        """
+        生成并上传结果图的缩略图和中等尺寸图（WebP和JPEG）
+
+        Returns:
+            作品字段名 -> URL；任一派生图失败时返回空字典，列表页回退使用原图
+        """
+        try:
+            started_at = time.monotonic()
+            variants = await image_pool.variants(image_bytes)
+            uploads = []
+            for name, encoded in variants.items():
+                for image_format, data in encoded.items():
+                    file_ext, content_type = image_file_info(image_format)
+                    uploads.append((
+                        VARIANT_COLUMNS[(name, image_format)],
+                        FileStorageService.upload_bytes(data, folder="result_variants", file_ext=file_ext, content_type=content_type),
+                    ))
+            results = await asyncio.gather(*(upload for _, upload in uploads))
+
+            variant_urls = {}
+            for (column, _), (success, url) in zip(uploads, results):
+                if not success:
+                    logger.warning(f"Artwork {artwork_id}: 上传派生图 {column} 失败: {url}")
+                    return {}
+                variant_urls[column] = url
+            logger.info(f"Artwork {artwork_id}: 已生成 {len(variant_urls)} 张派生图，耗时 {elapsed_ms(started_at, time.monotonic())}ms")
+            return variant_urls
+        except Exception as e:
+            logger.warning(f"Artwork {artwork_id}: 生成派生图失败: {e}")
+            return {}
+
+    @staticmethod
+    async def fail_artwork(artwork_id: int, error_message: str, should_refund: bool = True) -> None:
+        """
+        将仍处于处理中的作品标记为失败并退还积分（用于任务重试耗尽等场景）
+        """
+        from app.db.session import SessionLocal
+        db = SessionLocal()
+        try:
+            if not ArtworkService._mark_failed(db, artwork_id, error_message, should_refund):
+                return
+            db.commit()
+            logger.error(f"Artwork {artwork_id} failed: {error_message}")
+            ArtworkService.publish_final_state(db, artwork_id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"标记作品 {artwork_id} 失败状态时发生错误: {str(e)}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mark_failed(db: Session, artwork_id: int, error_message: str, should_refund: bool = True) -> bool:
+        """
+        把处理中的作品标记为失败并退还积分（只修改会话，由调用方提交事务）
+
+        状态使用条件更新，多个worker或清理任务同时处理同一作品时只有一方生效；
+        退款通过 CreditService.refund_artwork 保证只退还一次。
+
+        Returns:
+            是否由本次调用标记为失败
+        """
+        updated = db.query(Artwork).filter(
+            Artwork.id == artwork_id,
+            Artwork.status == ArtworkStatus.PROCESSING.value
+        ).update({
+            Artwork.status: ArtworkStatus.FAILED.value,
+            Artwork.error_message: error_message,
+        }, synchronize_session="fetch")
+        if not updated:
+            return False
+
+        if should_refund:
+            success, refund_result = CreditService.refund_artwork(db, artwork_id, commit=False)
+            if not success:
+                # 退款只回滚了自己的保存点，作品仍标记为失败，refunded_at 为空便于人工补退
+                logger.error(f"Failed to refund credits for artwork {artwork_id}: {refund_result.get('error')}")
+        return True
+
+    @staticmethod
+    def publish_final_state(db: Session, artwork_id: int) -> None:
+        """
+        向进度订阅者推送作品的终态（已完成或已失败），作品仍在处理中时不推送
+        """
+        try:
+            db.rollback()  # 丢弃可能未完成的事务，读取已提交的最终状态
+            artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
+            if not artwork:
+                return
+            if artwork.status == ArtworkStatus.COMPLETED.value:
+                progress_broker.publish(artwork_id, "completed", {
+                    "status": artwork.status,
+                    "progress": 100,
+                    "result_image_url": artwork.result_image_url,
+                })
+            elif artwork.status == ArtworkStatus.FAILED.value:
+                progress_broker.publish(artwork_id, "failed", {
+                    "status": artwork.status,
+                    "progress": artwork.progress,
+                    "error_message": artwork.error_message,
+                })
+        except Exception as e:
+            logger.error(f"推送作品 {artwork_id} 终态失败: {str(e)}")
+
     @staticmethod
     def get_by_id(db: Session, artwork_id: int) -> Optional[Artwork]:
         """
@@ -874,77 +1292,101 @@ class ArtworkService:
         # 如果失败，返回错误信息
         if artwork.status == ArtworkStatus.FAILED.value:
             result["error_message"] = artwork.error_message
+        
+        # 如果仍在排队，返回排队位置
+        if artwork.status == ArtworkStatus.PROCESSING.value:
+            from app.services.generation_queue import GenerationJobService
+            queue_position = GenerationJobService.get_queue_position(db, artwork_id)
+            if queue_position is not None:
+                result["queue_position"] = queue_position
             
         return result 
 
     @staticmethod
-    async def add_watermark_to_image(image_bytes, watermark_path=None):
+    async def add_watermark_to_image(image_bytes: bytes, watermark_path: Optional[str] = None) -> bytes:
         """
-        给图片添加水印
+        给图片添加水印（在图片进程池中执行，不阻塞事件循环）
         
         Args:
             image_bytes: 要添加水印的图片字节数据
             watermark_path: 水印图片路径，如果为None则使用默认水印
             
         Returns:
-            添加水印后的图片base64字符串
+            添加水印后的图片字节数据，出错时返回原图
         """
         try:
-            # 打开原图
-            img = Image.open(io.BytesIO(image_bytes))
-            
-            # 水印路径，如果没有指定则使用默认路径
-            if not watermark_path:
-                watermark_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'watermark.jpg')
-                # 如果默认水印不存在，则记录错误并返回原图
-                if not os.path.exists(watermark_path):
-                    logger.error(f"水印图片不存在: {watermark_path}")
-                    return base64.b64encode(image_bytes).decode("utf-8")
-            
-            # 打开水印图片
-            watermark = Image.open(watermark_path)
-            
-            # 计算水印大小，设置为原图宽度的1/5
-            watermark_width = img.width // 5
-            watermark_height = int(watermark.height * watermark_width / watermark.width)
-            watermark = watermark.resize((watermark_width, watermark_height))
-            
-            # 如果水印有透明通道，保留它
-            if watermark.mode == 'RGBA':
-                if img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-                
-                # 计算水印位置（右下角）
-                position = (img.width - watermark_width - 10, img.height - watermark_height - 10)
-                
-                # 创建一个透明层
-                transparent = Image.new('RGBA', img.size, (0,0,0,0))
-                transparent.paste(watermark, position, watermark)
-                
-                # 合成图片
-                result = Image.alpha_composite(img, transparent)
-                
-                # 如果原图不是RGBA格式，转回原始格式
-                if img.mode != 'RGBA':
-                    result = result.convert(img.mode)
-            else:
-                # 水印没有透明通道，直接粘贴
-                # 计算水印位置（右下角）
-                position = (img.width - watermark_width - 10, img.height - watermark_height - 10)
-                
-                # 复制原图，粘贴水印
-                result = img.copy()
-                result.paste(watermark, position)
-            
-            # 转回字节数据
-            buffered = io.BytesIO()
-            result.save(buffered, format=img.format or 'JPEG')
-            img_bytes = buffered.getvalue()
-            
-            # 转为base64
-            return base64.b64encode(img_bytes).decode("utf-8")
-            
+            if watermark_path and not os.path.exists(watermark_path):
+                logger.error(f"水印图片不存在: {watermark_path}")
+                return image_bytes
+            if not watermark_path and not os.path.exists(DEFAULT_WATERMARK_PATH):
+                logger.error(f"水印图片不存在: {DEFAULT_WATERMARK_PATH}")
+                return image_bytes
+            return await image_pool.watermark(image_bytes, watermark_path)
         except Exception as e:
             logger.error(f"添加水印时出错: {e}", exc_info=True)
             # 出错时返回原图
-            return base64.b64encode(image_bytes).decode("utf-8") 
\ No newline at end of file
+            return image_bytes
+
+
+class AsyncArtworkService:
+    """
+    ArtworkService 中读取类方法的异步版本，供使用异步会话（get_async_db）的接口调用；
+    创建和生成流程仍使用 ArtworkService
+    """
+
+    @staticmethod
+    async def get_by_id(db: AsyncSession, artwork_id: int) -> Optional[Artwork]:
+        """
+        根据ID获取作品
+        """
+        query = filter_deleted(select(Artwork), Artwork).options(joinedload(Artwork.style))
+        return await db.scalar(query.filter(Artwork.id == artwork_id))
+
+    @staticmethod
+    async def get_all(db: AsyncSession, params: ArtworkListParams) -> List[Artwork]:
+        """
+        获取所有作品，带分页和过滤
+        """
+        query = filter_deleted(select(Artwork), Artwork).options(joinedload(Artwork.style))
+
+        if params.status:
+            query = query.filter(Artwork.status == params.status)
+
+        if params.is_public is not None:
+            query = query.filter(Artwork.is_public == params.is_public)
+
+        if params.user_id:
+            query = query.filter(Artwork.user_id == params.user_id)
+
+        if params.style_id:
+            query = query.filter(Artwork.style_id == params.style_id)
+
+        # 排序
+        if params.order_by:
+            column = getattr(Artwork, params.order_by)
+            if params.order_desc:
+                column = column.desc()
+            query = query.order_by(column)
+
+        # 分页
+        result = await db.scalars(query.offset(params.skip).limit(params.limit))
+        return list(result.all())
+
+    @staticmethod
+    async def increment_view_count(db: AsyncSession, artwork_id: int) -> Optional[int]:
+        """
+        增加作品的查看次数，返回更新后的次数
+        """
+        # 在数据库中自增，并发查看时不会互相覆盖
+        updated = await db.execute(
+            update(Artwork)
+            .where(Artwork.id == artwork_id)
+            .values(views_count=Artwork.views_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if not updated.rowcount:
+            await db.rollback()
+            return None
+        await db.commit()
+        return await db.scalar(select(Artwork.views_count).where(Artwork.id == artwork_id))
+
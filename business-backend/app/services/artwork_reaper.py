@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.artwork import Artwork, ArtworkStatus
+from app.models.generation_job import GenerationJob, GenerationJobStatus
+
+logger = logging.getLogger(__name__)
+
+
+class ArtworkReaperService:
+    """
+    清理卡住的处理中作品
+
+    worker在流式生成过程中退出时，作品会一直停留在 processing。定期扫描超过 ARTWORK_STUCK_SECONDS
+    没有任何更新（进度写入也会刷新 updated_at）的处理中作品，按生成任务的状态处理：
+    - 没有任务记录：补建任务
+    - 任务等待中，或执行中且租约未过期：仍在排队或执行，不处理
+    - 执行中但租约已过期：还有重试次数时重新排队，否则标记失败并退还积分
+    - 任务已结束但作品仍在处理中：标记失败并退还积分
+
+    所有状态变更都是条件更新，退款通过 CreditService.refund_artwork 保证幂等，
+    多个进程同时执行清理也不会重复处理。
+    """
+
+    # 清理统计（当前进程）
+    _stats: Dict[str, int] = {"runs": 0, "scanned": 0, "requeued": 0, "enqueued": 0, "failed": 0}
+
+    @staticmethod
+    def reap(db: Session) -> Dict[str, int]:
+        """
+        执行一轮清理
+
+        Returns:
+            本轮 {"scanned", "requeued", "enqueued", "failed"} 的数量
+        """
+        from app.services.artwork import ArtworkService
+        from app.services.generation_queue import GenerationJobService
+
+        now = datetime.now()
+        stuck_before = now - timedelta(seconds=max(settings.get_int("ARTWORK_STUCK_SECONDS", 1800), 60))
+        lease_cutoff = now - timedelta(seconds=GenerationJobService.lease_seconds())
+        batch_size = max(settings.get_int("ARTWORK_REAPER_BATCH_SIZE", 100), 1)
+        result = {"scanned": 0, "requeued": 0, "enqueued": 0, "failed": 0}
+
+        # 使用 (status, updated_at) 索引；排队中的作品没有更新是正常的，不占用每轮的处理数量
+        stuck = db.query(Artwork.id, Artwork.user_id).outerjoin(
+            GenerationJob, GenerationJob.artwork_id == Artwork.id
+        ).filter(
+            Artwork.status == ArtworkStatus.PROCESSING.value,
+            Artwork.updated_at < stuck_before,
+            or_(GenerationJob.id == None, GenerationJob.status != GenerationJobStatus.PENDING.value),
+        ).order_by(Artwork.updated_at).limit(batch_size).all()
+        result["scanned"] = len(stuck)
+        if not stuck:
+            db.rollback()
+            return result
+
+        jobs = {
+            job.artwork_id: job
+            for job in db.query(GenerationJob).filter(
+                GenerationJob.artwork_id.in_([artwork_id for artwork_id, _ in stuck])
+            ).all()
+        }
+
+        failed_ids = []
+        for artwork_id, user_id in stuck:
+            job = jobs.get(artwork_id)
+            try:
+                if job is None or job.is_deleted:
+                    if job is None:
+                        GenerationJobService.enqueue(db, artwork_id, user_id)
+                    else:
+                        GenerationJobService.requeue(db, artwork_id, user_id, lane=job.lane)
+                    db.commit()
+                    result["enqueued"] += 1
+                    logger.warning(f"作品 {artwork_id} 处于处理中但没有生成任务，已补建任务")
+                    continue
+
+                if job.status == GenerationJobStatus.PENDING.value:
+                    continue
+                if job.status == GenerationJobStatus.RUNNING.value and job.locked_at and job.locked_at >= lease_cutoff:
+                    continue
+
+                if job.status == GenerationJobStatus.RUNNING.value and job.attempts < job.max_attempts:
+                    # 原worker已失联，重新排队（其他worker可能已通过租约过期领取，此时不更新）
+                    requeued = db.query(GenerationJob).filter(
+                        GenerationJob.id == job.id,
+                        GenerationJob.status == GenerationJobStatus.RUNNING.value,
+                        GenerationJob.locked_at == job.locked_at,
+                    ).update({
+                        GenerationJob.status: GenerationJobStatus.PENDING.value,
+                        GenerationJob.locked_by: None,
+                        GenerationJob.available_at: now,
+                        GenerationJob.last_error: "执行任务的worker已失联",
+                    }, synchronize_session=False)
+                    db.commit()
+                    if requeued:
+                        result["requeued"] += 1
+                        logger.warning(f"作品 {artwork_id} 的任务 {job.id} 租约已过期（原worker: {job.locked_by}），重新排队")
+                    continue
+
+                # 重试次数耗尽或任务已结束，作品不会再有进展
+                error_message = "生成超时，请重新提交"
+                if job.status == GenerationJobStatus.RUNNING.value:
+                    db.query(GenerationJob).filter(
+                        GenerationJob.id == job.id,
+                        GenerationJob.status == GenerationJobStatus.RUNNING.value,
+                        GenerationJob.locked_at == job.locked_at,
+                    ).update({
+                        GenerationJob.status: GenerationJobStatus.FAILED.value,
+                        GenerationJob.locked_by: None,
+                        GenerationJob.finished_at: now,
+                        GenerationJob.last_error: error_message,
+                    }, synchronize_session=False)
+                if ArtworkService._mark_failed(db, artwork_id, error_message, should_refund=True):
+                    failed_ids.append(artwork_id)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"清理卡住的作品 {artwork_id} 失败: {str(e)}")
+
+        result["failed"] = len(failed_ids)
+        for artwork_id in failed_ids:
+            logger.error(f"作品 {artwork_id} 长时间没有进展，已标记失败并退还积分")
+            ArtworkService.publish_final_state(db, artwork_id)
+
+        if result["requeued"] or result["enqueued"]:
+            from app.services.generation_queue import generation_worker_pool
+            for _ in range(result["requeued"] + result["enqueued"]):
+                generation_worker_pool.notify()
+
+        stats = ArtworkReaperService._stats
+        stats["runs"] += 1
+        for key, value in result.items():
+            stats[key] += value
+        return result
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        return dict(ArtworkReaperService._stats)
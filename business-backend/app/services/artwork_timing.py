@@ -0,0 +1,174 @@
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.artwork import Artwork, ArtworkStatus
+from app.models.artwork_timing import ArtworkTiming
+from app.models.style import Style
+
+logger = logging.getLogger(__name__)
+
+# 记录的阶段耗时字段（毫秒）
+TIMING_STAGES = [
+    "source_upload_ms",
+    "queue_wait_ms",
+    "upstream_connect_ms",
+    "first_token_ms",
+    "stream_ms",
+    "result_download_ms",
+    "watermark_ms",
+    "result_upload_ms",
+    "total_ms",
+]
+
+# 统计分位数时最多读取的记录数
+MAX_PERCENTILE_ROWS = 20000
+
+
+def elapsed_ms(started_at: float, finished_at: float) -> int:
+    """两个 time.monotonic() 时间点之间的毫秒数"""
+    return max(int((finished_at - started_at) * 1000), 0)
+
+
+def percentile(sorted_values: List[int], q: float) -> Optional[int]:
+    """最近秩法计算分位数，sorted_values需已升序排列"""
+    if not sorted_values:
+        return None
+    rank = max(int(math.ceil(q * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+class ArtworkTimingService:
+    """
+    作品生成流水线的分阶段耗时
+
+    处理过程中各阶段的耗时先记录在当前进程的内存中，每次任务执行结束后写入 artwork_timings 表
+    （每个作品一行，重试时覆盖）。原图上传耗时在创建作品时随作品一起写入。
+    """
+
+    # 处理中的作品已记录但尚未写入的耗时
+    _pending: Dict[int, Dict[str, Any]] = {}
+
+    @staticmethod
+    def create_record(
+        db: Session,
+        artwork_id: int,
+        style_id: int,
+        source_upload_ms: Optional[int] = None,
+        cached: bool = False
+    ) -> ArtworkTiming:
+        """
+        创建作品时添加耗时记录（只添加到会话，由调用方提交事务）
+        """
+        record = ArtworkTiming(
+            artwork_id=artwork_id,
+            style_id=style_id,
+            status="cached" if cached else ArtworkStatus.PROCESSING.value,
+            attempts=0,
+            source_upload_ms=source_upload_ms,
+            total_ms=0 if cached else None,
+        )
+        db.add(record)
+        return record
+
+    @staticmethod
+    def record(artwork_id: int, **values: Any) -> None:
+        """记录处理中作品的阶段耗时或上游名称，不直接访问数据库"""
+        ArtworkTimingService._pending.setdefault(artwork_id, {}).update(values)
+
+    @staticmethod
+    def discard(artwork_id: int) -> None:
+        ArtworkTimingService._pending.pop(artwork_id, None)
+
+    @staticmethod
+    def save(db: Session, artwork_id: int) -> None:
+        """
+        写入已记录的耗时；作品已结束时同时计算总耗时
+        """
+        values = ArtworkTimingService._pending.pop(artwork_id, None)
+        if values is None:
+            return
+
+        try:
+            artwork = db.query(Artwork).filter(Artwork.id == artwork_id).first()
+            if not artwork:
+                return
+            record = db.query(ArtworkTiming).filter(ArtworkTiming.artwork_id == artwork_id).first()
+            if record is None:
+                # 引入耗时记录之前创建的作品
+                record = ArtworkTiming(artwork_id=artwork_id, style_id=artwork.style_id, attempts=0)
+                db.add(record)
+
+            for key, value in values.items():
+                setattr(record, key, value)
+            record.status = artwork.status
+            if artwork.status != ArtworkStatus.PROCESSING.value and artwork.created_at:
+                record.total_ms = max(int((datetime.now() - artwork.created_at).total_seconds() * 1000), 0)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"保存作品 {artwork_id} 的耗时记录失败: {str(e)}")
+
+    @staticmethod
+    def percentiles(db: Session, group_by: str = "style", hours: int = 24) -> Dict[str, Any]:
+        """
+        按风格或上游分组统计各阶段耗时的分位数（P50/P90/P99）
+
+        Args:
+            group_by: style-按风格，upstream-按AI上游
+            hours: 统计最近多少小时内创建的作品
+        """
+        since = datetime.now() - timedelta(hours=hours)
+        query = db.query(ArtworkTiming).filter(
+            ArtworkTiming.created_at >= since,
+            ArtworkTiming.is_deleted == False,
+        )
+        if group_by == "upstream":
+            # 复用缓存结果的作品没有经过上游
+            query = query.filter(ArtworkTiming.upstream.isnot(None))
+        records = query.order_by(ArtworkTiming.id.desc()).limit(MAX_PERCENTILE_ROWS).all()
+
+        style_names = {}
+        if group_by == "style":
+            style_ids = {record.style_id for record in records}
+            if style_ids:
+                style_names = dict(db.query(Style.id, Style.name).filter(Style.id.in_(style_ids)).all())
+
+        groups: Dict[str, List[ArtworkTiming]] = {}
+        for record in records:
+            key = record.upstream if group_by == "upstream" else str(record.style_id)
+            groups.setdefault(key, []).append(record)
+
+        result = {}
+        for key, items in groups.items():
+            stages = {}
+            for stage in TIMING_STAGES:
+                values = sorted(getattr(item, stage) for item in items if getattr(item, stage) is not None)
+                if not values:
+                    continue
+                stages[stage] = {
+                    "count": len(values),
+                    "p50": percentile(values, 0.5),
+                    "p90": percentile(values, 0.9),
+                    "p99": percentile(values, 0.99),
+                    "max": values[-1],
+                }
+            group = {
+                "count": len(items),
+                "failed": sum(1 for item in items if item.status == ArtworkStatus.FAILED.value),
+                "cached": sum(1 for item in items if item.status == "cached"),
+                "stages": stages,
+            }
+            if group_by == "style":
+                group["style_name"] = style_names.get(int(key))
+            result[key] = group
+
+        return {
+            "group_by": group_by,
+            "hours": hours,
+            "records": len(records),
+            "groups": result,
+        }
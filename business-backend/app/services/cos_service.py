@@ -5,6 +5,7 @@ import os
 import urllib.parse
 import re
 from app.core.config import settings, Settings
+from app.services.memory_storage import MEMORY_URL_PREFIX
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +72,10 @@ class COSService:
         if not url:
             logger.error("无法为空URL生成预签名")
             return None
+        
+        # 内存存储（本地压测）的URL无需签名
+        if url.startswith(MEMORY_URL_PREFIX):
+            return url
             
         try:
             # 解析URL获取bucket和key
@@ -3,7 +3,8 @@ import logging
 from datetime import datetime
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, select, update
 
 from app.models.user import User
 from app.models.credit_record import CreditRecord, CreditRecordType
@@ -13,6 +14,65 @@ logger = logging.getLogger(__name__)
 
 
 class CreditService:
+    @staticmethod
+    def refund_artwork(db: Session, artwork_id: int, commit: bool = True) -> Tuple[bool, Dict[str, Any]]:
+        """
+        退还创建作品时扣除的积分（幂等）
+
+        先用条件更新把作品的 refunded_at 从空设置为当前时间，只有更新成功的调用才会退还积分，
+        且与积分变动在同一事务中提交。重复调用或多个进程同时调用都只会退还一次；
+        没有扣除记录的作品不退还。管理员重新生成已扣费的作品时会预先设置 refunded_at，不会再次退还。
+
+        领取和积分变动在保存点中执行，失败时只回滚保存点，不影响调用方会话中未提交的修改。
+
+        Args:
+            commit: 是否提交事务，为False时由调用方统一提交或回滚
+
+        Returns:
+            成功状态和 {"refunded": 是否退还, "amount": 退还的积分}
+        """
+        from app.models.artwork import Artwork
+
+        try:
+            with db.begin_nested():
+                claimed = db.query(Artwork).filter(
+                    Artwork.id == artwork_id,
+                    Artwork.refunded_at == None
+                ).update({Artwork.refunded_at: datetime.now()}, synchronize_session=False)
+                if not claimed:
+                    return True, {"refunded": False, "amount": 0}
+
+                user_id = db.query(Artwork.user_id).filter(Artwork.id == artwork_id).scalar()
+                charged = db.query(func.coalesce(func.sum(CreditRecord.amount), 0)).filter(
+                    CreditRecord.related_id == artwork_id,
+                    CreditRecord.type == CreditRecordType.CREATE.value,
+                ).scalar() or 0
+                amount = -charged
+                if amount > 0:
+                    success, result = CreditService.update_credits(
+                        db=db,
+                        user_id=user_id,
+                        amount=amount,
+                        type=CreditRecordType.REFUND.value,
+                        description=f"作品ID {artwork_id} 风格转换失败退还积分",
+                        related_id=artwork_id,
+                        commit=False
+                    )
+                    if not success:
+                        # 回滚保存点，refunded_at 保持为空
+                        raise RuntimeError(result["error"])
+
+            if commit:
+                db.commit()
+            if amount > 0:
+                logger.info(f"Refunded {amount} credits to user {user_id} for failed artwork {artwork_id}")
+            return True, {"refunded": amount > 0, "amount": max(amount, 0)}
+        except Exception as e:
+            if commit:
+                db.rollback()
+            logger.error(f"退还作品 {artwork_id} 的积分时发生错误: {str(e)}")
+            return False, {"error": f"退还积分失败: {str(e)}"}
+
     @staticmethod
     def update_credits(
         db: Session, 
@@ -20,7 +80,8 @@ class CreditService:
         amount: int, 
         type: str,
         description: Optional[str] = None,
-        related_id: Optional[int] = None
+        related_id: Optional[int] = None,
+        commit: bool = True
     ) -> Tuple[bool, Dict[str, Any]]:
         """
         更新用户积分
@@ -32,6 +93,7 @@ class CreditService:
             type: 变动类型
             description: 变动描述
             related_id: 相关ID，如作品ID
+            commit: 是否提交事务，为False时只flush，由调用方统一提交或回滚
             
         Returns:
             成功状态和结果信息
@@ -61,13 +123,18 @@ class CreditService:
             db.add(record)
             
             # 提交事务
-            db.commit()
-            db.refresh(record)
+            if commit:
+                db.commit()
+                db.refresh(record)
+            else:
+                db.flush()
             
             return True, {"credit_record": record, "balance": user.credits}
             
         except Exception as e:
-            db.rollback()
+            # commit为False时由调用方回滚，避免丢弃调用方事务中的其他修改
+            if commit:
+                db.rollback()
             logger.error(f"更新积分时发生错误: {str(e)}")
             return False, {"error": f"更新积分失败: {str(e)}"}
     
@@ -126,7 +193,7 @@ class CreditService:
             from app.core.config import settings
             
             # 确定奖励积分数量
-            reward_amount = settings.AD_REWARD_CREDITS
+            reward_amount = settings.get_int("AD_REWARD_CREDITS", 10)
             
             # 查找用户
             user = db.query(User).filter(User.id == user_id).first()
@@ -159,4 +226,98 @@ class CreditService:
         except Exception as e:
             db.rollback()
             logger.error(f"处理广告奖励时发生错误: {str(e)}")
-            return False, {"error": f"处理广告奖励失败: {str(e)}"} 
\ No newline at end of file
+            return False, {"error": f"处理广告奖励失败: {str(e)}"}
+
+
+class AsyncCreditService:
+    """
+    CreditService 的异步版本，供使用异步会话（get_async_db）的接口调用
+    """
+
+    @staticmethod
+    async def get_user_credit_records(
+        db: AsyncSession, 
+        user_id: int, 
+        skip: int = 0, 
+        limit: int = 20
+    ) -> List[CreditRecord]:
+        """
+        获取用户的积分记录
+        """
+        result = await db.scalars(
+            select(CreditRecord)
+            .filter(CreditRecord.user_id == user_id)
+            .order_by(desc(CreditRecord.created_at))
+            .offset(skip).limit(limit)
+        )
+        return list(result.all())
+    
+    @staticmethod
+    async def get_user_credit_balance(db: AsyncSession, user_id: int) -> Optional[int]:
+        """
+        获取用户的积分余额
+        """
+        user = await db.get(User, user_id)
+        if not user:
+            return None
+        return user.credits
+    
+    @staticmethod
+    async def ad_reward(
+        db: AsyncSession, 
+        user_id: int, 
+        ad_type: str
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        广告奖励
+        
+        Args:
+            db: 异步数据库会话
+            user_id: 用户ID
+            ad_type: 广告类型，如"rewarded_video"
+            
+        Returns:
+            成功状态和结果信息
+        """
+        try:
+            from app.core.config import settings
+            
+            # 确定奖励积分数量
+            reward_amount = settings.get_int("AD_REWARD_CREDITS", 10)
+            
+            # 更新用户积分，在数据库中累加，并发领取奖励时不会互相覆盖
+            updated = await db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(credits=User.credits + reward_amount)
+                .execution_options(synchronize_session=False)
+            )
+            if not updated.rowcount:
+                await db.rollback()
+                return False, {"error": "用户不存在"}
+            balance = await db.scalar(select(User.credits).where(User.id == user_id))
+            
+            # 创建积分记录
+            record = CreditRecord(
+                user_id=user_id,
+                amount=reward_amount,
+                balance=balance,
+                type="ad_reward",
+                description=f"观看广告[{ad_type}]奖励积分",
+            )
+            db.add(record)
+            
+            # 提交事务
+            await db.commit()
+            await db.refresh(record)
+            
+            return True, {
+                "reward_amount": reward_amount,
+                "balance": balance,
+                "credit_record": record
+            }
+            
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"处理广告奖励时发生错误: {str(e)}")
+            return False, {"error": f"处理广告奖励失败: {str(e)}"}
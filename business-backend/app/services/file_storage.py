@@ -1,24 +1,40 @@
 import base64
+import hashlib
 import logging
 import os
 import uuid
 from datetime import datetime
 from io import BytesIO
 import asyncio
-from typing import Optional, Tuple
-import hashlib
+import re
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 from qcloud_cos import CosConfig, CosS3Client
-from qcloud_cos.cos_exception import CosServiceError
+from qcloud_cos.cos_exception import CosClientError, CosServiceError
 
 from app.core.config import settings
+from app.services.memory_storage import memory_storage, MEMORY_URL_PREFIX
+from utils.image_probe import SNIFF_BYTES, PROBE_BYTES, IMAGE_FORMATS, sniff_image_format, image_file_info
 
 logger = logging.getLogger(__name__)
 
+# 客户端直传允许的Content-Type -> 文件扩展名
+DIRECT_UPLOAD_CONTENT_TYPES = {
+    content_type: file_ext for image_format, (file_ext, content_type) in IMAGE_FORMATS.items() if image_format != "gif"
+}
+
+# 简单上传的ETag为内容MD5，分块上传的ETag带有 -分块数 后缀
+MD5_ETAG_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadTooLargeError(Exception):
+    """上传内容超过大小限制"""
+    pass
+
 
 class FileStorageService:
     """
-    文件存储服务，使用腾讯云COS
+    文件存储服务，使用腾讯云COS（STORAGE_BACKEND=memory 时使用进程内存，仅用于本地压测）
     """
     
     @staticmethod
@@ -51,50 +67,354 @@ class FileStorageService:
             # 解码Base64数据
             image_data = base64.b64decode(base64_data)
             
-            # 计算文件MD5，用于防止重复上传
-            file_md5 = hashlib.md5(image_data).hexdigest()
-            
-            # 生成文件名和路径
-            date_folder = datetime.now().strftime("%Y%m%d")
-            file_ext = "jpg"  # 默认扩展名
-            file_name = f"{uuid.uuid4().hex}.{file_ext}"
-            object_key = f"{settings.COS_UPLOAD_DIR}/{folder}/{date_folder}/{file_name}"
-            
+            return await FileStorageService.upload_bytes(image_data, folder=folder)
+
+        except Exception as e:
+            error_msg = f"上传图片时发生错误: {str(e)}"
+            logger.error(error_msg)
+            return False, error_msg
+
+    @staticmethod
+    def _build_object_key(folder: str, file_ext: str) -> str:
+        """生成按日期分目录的对象键"""
+        date_folder = datetime.now().strftime("%Y%m%d")
+        file_name = f"{uuid.uuid4().hex}.{file_ext}"
+        return f"{settings.COS_UPLOAD_DIR}/{folder}/{date_folder}/{file_name}"
+
+    @staticmethod
+    def direct_upload_prefix(user_id: int) -> str:
+        """用户直传原图的对象键前缀，创建作品时只接受该前缀下的对象"""
+        return f"{settings.COS_UPLOAD_DIR}/source_images/direct/{user_id}/"
+
+    @staticmethod
+    def object_url(object_key: str) -> str:
+        """对象键对应的访问URL"""
+        if memory_storage.enabled():
+            return f"{MEMORY_URL_PREFIX}{object_key}"
+        return f"{settings.COS_DOMAIN}/{object_key}"
+
+    @staticmethod
+    def create_upload_url(user_id: int, content_type: str) -> Tuple[bool, Dict[str, Any]]:
+        """
+        生成客户端直传原图的预签名PUT URL
+
+        对象键位于该用户的直传目录下，客户端上传时必须携带相同的Content-Type。
+        预签名URL无法限制文件大小，创建作品时通过HEAD请求校验。
+        """
+        file_ext = DIRECT_UPLOAD_CONTENT_TYPES.get(content_type)
+        if file_ext is None:
+            return False, {"error": f"不支持的图片类型: {content_type}"}
+        if memory_storage.enabled():
+            return False, {"error": "当前存储后端不支持客户端直传"}
+
+        date_folder = datetime.now().strftime("%Y%m%d")
+        object_key = f"{FileStorageService.direct_upload_prefix(user_id)}{date_folder}/{uuid.uuid4().hex}.{file_ext}"
+        expires = max(settings.get_int("DIRECT_UPLOAD_EXPIRES", 600), 60)
+        try:
+            upload_url = FileStorageService.get_cos_client().get_presigned_url(
+                Bucket=settings.COS_BUCKET,
+                Key=object_key,
+                Method="PUT",
+                Expired=expires,
+                Headers={"Content-Type": content_type}
+            )
+        except Exception as e:
+            logger.error(f"生成直传URL失败: {str(e)}")
+            return False, {"error": "生成上传地址失败"}
+
+        return True, {
+            "object_key": object_key,
+            "upload_url": upload_url,
+            "method": "PUT",
+            "headers": {"Content-Type": content_type},
+            "expires_in": expires,
+            "max_size": settings.get_int("MAX_UPLOAD_SIZE", 5 * 1024 * 1024),
+        }
+
+    @staticmethod
+    async def head_object(object_key: str) -> Tuple[bool, Dict[str, Any]]:
+        """
+        读取对象的元数据（不下载内容）
+
+        Returns:
+            成功状态和 {"size", "content_type", "md5"}（md5只在ETag为内容MD5时有值），或错误信息
+        """
+        if memory_storage.enabled():
+            stored = memory_storage.get(f"{MEMORY_URL_PREFIX}{object_key}")
+            if stored is None:
+                return False, {"error": "文件不存在"}
+            data, content_type = stored
+            return True, {"size": len(data), "content_type": content_type, "md5": hashlib.md5(data).hexdigest()}
+
+        try:
+            loop = asyncio.get_event_loop()
+            client = FileStorageService.get_cos_client()
+            response = await loop.run_in_executor(
+                None,
+                lambda: client.head_object(Bucket=settings.COS_BUCKET, Key=object_key)
+            )
+        except CosServiceError as e:
+            if e.get_status_code() == 404:
+                return False, {"error": "文件不存在"}
+            logger.error(f"读取对象 {object_key} 元数据失败: {str(e)}")
+            return False, {"error": f"COS服务错误: {e.get_error_code()}"}
+        except Exception as e:
+            logger.error(f"读取对象 {object_key} 元数据失败: {str(e)}")
+            return False, {"error": "读取文件信息失败"}
+
+        etag = (response.get("ETag") or "").strip('"').lower()
+        return True, {
+            "size": int(response.get("Content-Length") or 0),
+            "content_type": response.get("Content-Type"),
+            "md5": etag if MD5_ETAG_PATTERN.match(etag) else None,
+        }
+
+    @staticmethod
+    async def upload_bytes(
+        image_data: bytes,
+        folder: str = "images",
+        file_ext: Optional[str] = None,
+        content_type: Optional[str] = None
+    ) -> Tuple[bool, str]:
+        """
+        上传图片字节到腾讯云COS，未指定扩展名时根据文件头识别格式
+
+        Returns:
+            成功状态和URL（成功时）或错误信息（失败时）
+        """
+        try:
+            if file_ext is None:
+                file_ext, sniffed_content_type = image_file_info(sniff_image_format(image_data[:SNIFF_BYTES]))
+                content_type = content_type or sniffed_content_type
+            object_key = FileStorageService._build_object_key(folder, file_ext)
+
+            if memory_storage.enabled():
+                return True, memory_storage.put(object_key, image_data, content_type or f"image/{file_ext}")
+
             # 在事件循环中异步执行上传
             loop = asyncio.get_event_loop()
             success, result = await loop.run_in_executor(
-                None, 
-                FileStorageService._upload_to_cos, 
+                None,
+                FileStorageService._upload_to_cos,
                 image_data,
                 object_key,
-                file_ext
+                file_ext,
+                content_type
             )
-            
+
             if success:
                 return True, f"{settings.COS_DOMAIN}/{object_key}"
             else:
                 return False, result
-                
+
         except Exception as e:
             error_msg = f"上传图片时发生错误: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
-    
+
     @staticmethod
-    def _upload_to_cos(file_data: bytes, object_key: str, file_ext: str) -> Tuple[bool, str]:
+    async def upload_stream(
+        chunks: AsyncIterator[bytes],
+        folder: str = "images",
+        file_ext: str = "jpg",
+        content_type: Optional[str] = None
+    ) -> Tuple[bool, str]:
+        """
+        以流的方式上传到腾讯云COS，内存中最多缓存一个分片
+
+        内容不超过一个分片（COS_MULTIPART_PART_SIZE）时使用简单上传，否则使用分块上传。
+        数据源抛出的异常会在中止分块上传后继续向上抛出，由调用方决定是否重试。
+
+        Returns:
+            成功状态和URL（成功时）或错误信息（失败时）
+        """
+        # COS要求除最后一块外每块不小于1MB
+        part_size = max(settings.get_int("COS_MULTIPART_PART_SIZE", 5 * 1024 * 1024), 1024 * 1024)
+        object_key = FileStorageService._build_object_key(folder, file_ext)
+        content_type = content_type or f"image/{file_ext}"
+        loop = asyncio.get_event_loop()
+
+        if memory_storage.enabled():
+            data = bytearray()
+            async for chunk in chunks:
+                data += chunk
+            return True, memory_storage.put(object_key, bytes(data), content_type)
+
+        client = None
+        upload_id = None
+        parts = []
+        buffer = bytearray()
+
+        async def upload_part(data: bytes):
+            part_number = len(parts) + 1
+            response = await loop.run_in_executor(
+                None,
+                lambda: client.upload_part(
+                    Bucket=settings.COS_BUCKET,
+                    Key=object_key,
+                    Body=data,
+                    PartNumber=part_number,
+                    UploadId=upload_id,
+                    EnableMD5=True
+                )
+            )
+            parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                if len(buffer) < part_size:
+                    continue
+                if upload_id is None:
+                    client = FileStorageService.get_cos_client()
+                    response = await loop.run_in_executor(
+                        None,
+                        lambda: client.create_multipart_upload(
+                            Bucket=settings.COS_BUCKET,
+                            Key=object_key,
+                            ContentType=content_type
+                        )
+                    )
+                    upload_id = response["UploadId"]
+                data, buffer = bytes(buffer), bytearray()
+                await upload_part(data)
+
+            # 内容不足一个分片，直接简单上传
+            if upload_id is None:
+                success, result = await loop.run_in_executor(
+                    None,
+                    FileStorageService._upload_to_cos,
+                    bytes(buffer),
+                    object_key,
+                    file_ext,
+                    content_type
+                )
+                if success:
+                    return True, f"{settings.COS_DOMAIN}/{object_key}"
+                return False, result
+
+            if buffer:
+                data, buffer = bytes(buffer), bytearray()
+                await upload_part(data)
+            await loop.run_in_executor(
+                None,
+                lambda: client.complete_multipart_upload(
+                    Bucket=settings.COS_BUCKET,
+                    Key=object_key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Part": parts}
+                )
+            )
+            return True, f"{settings.COS_DOMAIN}/{object_key}"
+
+        except (CosServiceError, CosClientError) as e:
+            await FileStorageService._abort_multipart_upload(client, object_key, upload_id)
+            error_msg = f"COS服务错误: {str(e)}"
+            logger.error(error_msg)
+            return False, error_msg
+
+        except BaseException:
+            await FileStorageService._abort_multipart_upload(client, object_key, upload_id)
+            raise
+
+    @staticmethod
+    async def upload_limited_stream(
+        chunks: AsyncIterator[bytes],
+        max_size: int,
+        folder: str = "images"
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        流式上传客户端提交的图片：根据文件头识别格式，边上传边计算MD5和大小，
+        超过 max_size 时立即停止读取并中止上传
+
+        Returns:
+            成功状态和 {"url", "md5", "size", "header"}（header为文件开头的字节，用于解析尺寸），或错误信息
+        """
+        too_large_error = {"error": f"图片大小不能超过 {max_size // (1024 * 1024)}MB"}
+        iterator = chunks.__aiter__()
+        header = b""
+        try:
+            while len(header) < PROBE_BYTES:
+                try:
+                    header += await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                if len(header) > max_size:
+                    return False, too_large_error
+        except ValueError as e:
+            return False, {"error": f"上传数据格式错误: {str(e)}"}
+
+        image_format = sniff_image_format(header[:SNIFF_BYTES])
+        if image_format is None:
+            return False, {"error": "上传的文件不是有效的图片"}
+        file_ext, content_type = image_file_info(image_format)
+
+        digest = hashlib.md5(header)
+        received = {"size": len(header)}
+
+        async def limited_chunks():
+            yield header
+            async for chunk in iterator:
+                received["size"] += len(chunk)
+                if received["size"] > max_size:
+                    raise UploadTooLargeError()
+                digest.update(chunk)
+                yield chunk
+
+        try:
+            success, result = await FileStorageService.upload_stream(
+                limited_chunks(),
+                folder=folder,
+                file_ext=file_ext,
+                content_type=content_type
+            )
+        except UploadTooLargeError:
+            return False, too_large_error
+        except ValueError as e:
+            return False, {"error": f"上传数据格式错误: {str(e)}"}
+
+        if not success:
+            return False, {"error": f"上传图片失败: {result}"}
+        return True, {
+            "url": result,
+            "md5": digest.hexdigest(),
+            "size": received["size"],
+            "header": header[:PROBE_BYTES],
+        }
+
+    @staticmethod
+    async def _abort_multipart_upload(client, object_key: str, upload_id: Optional[str]):
+        """中止未完成的分块上传，释放已上传的分块"""
+        if client is None or upload_id is None:
+            return
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(
+                None,
+                lambda: client.abort_multipart_upload(
+                    Bucket=settings.COS_BUCKET,
+                    Key=object_key,
+                    UploadId=upload_id
+                )
+            )
+        except Exception as e:
+            logger.error(f"中止分块上传 {object_key} 失败: {str(e)}")
+
+    @staticmethod
+    def _upload_to_cos(file_data: bytes, object_key: str, file_ext: str, content_type: Optional[str] = None) -> Tuple[bool, str]:
         """
         实际执行上传到COS的函数
         """
         try:
             client = FileStorageService.get_cos_client()
-            
+
             # 上传文件到COS
             response = client.put_object(
                 Bucket=settings.COS_BUCKET,
                 Body=BytesIO(file_data),
                 Key=object_key,
                 EnableMD5=True,
-                ContentType=f"image/{file_ext}"
+                ContentType=content_type or f"image/{file_ext}"
             )
             
             return True, object_key
@@ -121,6 +441,11 @@ class FileStorageService:
             成功状态和成功信息或错误信息
         """
         try:
+            if memory_storage.is_memory_url(file_url):
+                if memory_storage.delete(file_url):
+                    return True, "文件删除成功"
+                return False, "文件不存在"
+
             # 从URL中提取对象键
             if settings.COS_DOMAIN in file_url:
                 object_key = file_url.replace(f"{settings.COS_DOMAIN}/", "")
@@ -0,0 +1,716 @@
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func
+
+from app.models.artwork import Artwork, ArtworkStatus
+from app.models.generation_job import GenerationJob, GenerationJobStatus, GenerationLane
+from app.core.config import settings
+from app.services.artwork_timing import ArtworkTimingService
+
+logger = logging.getLogger(__name__)
+
+# 活跃任务状态（占用并发名额）
+ACTIVE_JOB_STATUSES = [GenerationJobStatus.PENDING.value, GenerationJobStatus.RUNNING.value]
+
+# 调度通道，按优先级从高到低排列
+GENERATION_LANES = [GenerationLane.PAID.value, GenerationLane.NORMAL.value, GenerationLane.BULK.value]
+
+# 平均任务耗时缓存，避免每次准入判断都聚合历史任务
+_avg_duration_cache: Dict[str, float] = {"value": 0.0, "expires_at": 0.0}
+
+# 平滑加权轮询的当前权值（当前进程）
+_lane_credits: Dict[str, float] = {lane: 0.0 for lane in GENERATION_LANES}
+# 上一次领取是否由饥饿保护选出，饥饿保护与加权轮询交替进行，避免积压通道独占worker
+_lane_promoted: Dict[str, bool] = {"last": False}
+
+# 各通道的领取统计（当前进程），等待时长从任务可领取时间算起
+_lane_stats: Dict[str, Dict[str, float]] = {
+    lane: {"claimed": 0, "promoted": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+    for lane in GENERATION_LANES
+}
+
+
+class GenerationJobService:
+    """
+    持久化的生成任务队列，基于 generation_jobs 表
+    """
+
+    @staticmethod
+    def lease_seconds() -> int:
+        """任务租约时长，超过该时长仍处于running的任务视为worker已失联"""
+        return settings.get_int("GENERATION_JOB_LEASE_SECONDS", 900)
+
+    @staticmethod
+    def lane_weights() -> Dict[str, int]:
+        """各调度通道的权重，权重为0的通道只在其他通道没有任务时领取"""
+        return {
+            GenerationLane.PAID.value: max(settings.get_int("GENERATION_LANE_WEIGHT_PAID", 6), 0),
+            GenerationLane.NORMAL.value: max(settings.get_int("GENERATION_LANE_WEIGHT_NORMAL", 3), 0),
+            GenerationLane.BULK.value: max(settings.get_int("GENERATION_LANE_WEIGHT_BULK", 1), 0),
+        }
+
+    @staticmethod
+    def lane_for_user(db: Session, user_id: int) -> str:
+        """
+        根据订单记录确定用户任务的调度通道：
+        最近 GENERATION_PAID_LANE_DAYS 天内（0表示不限时间）有已支付订单的用户进入付费通道
+        """
+        from app.services.user import UserService
+
+        within_days = settings.get_int("GENERATION_PAID_LANE_DAYS", 30)
+        if UserService.is_paid_user(db, user_id, within_days=within_days):
+            return GenerationLane.PAID.value
+        return GenerationLane.NORMAL.value
+
+    @staticmethod
+    def enqueue(
+        db: Session,
+        artwork_id: int,
+        user_id: int,
+        aspect_ratio: Optional[str] = None,
+        lane: str = GenerationLane.NORMAL.value
+    ) -> GenerationJob:
+        """
+        为作品创建生成任务（只添加到会话，由调用方提交事务）
+        """
+        job = GenerationJob(
+            artwork_id=artwork_id,
+            user_id=user_id,
+            status=GenerationJobStatus.PENDING.value,
+            lane=lane,
+            aspect_ratio=aspect_ratio,
+            attempts=0,
+            max_attempts=settings.get_int("GENERATION_JOB_MAX_ATTEMPTS", 3),
+            available_at=datetime.now(),
+        )
+        db.add(job)
+        return job
+
+    @staticmethod
+    def requeue(
+        db: Session,
+        artwork_id: int,
+        user_id: int,
+        aspect_ratio: Optional[str] = None,
+        lane: str = GenerationLane.BULK.value
+    ) -> GenerationJob:
+        """
+        重新排队作品的生成任务（重置重试次数），作品没有任务记录时新建（只添加到会话，由调用方提交事务）
+        """
+        job = db.query(GenerationJob).filter(GenerationJob.artwork_id == artwork_id).first()
+        if not job:
+            return GenerationJobService.enqueue(db, artwork_id, user_id, aspect_ratio, lane=lane)
+
+        job.status = GenerationJobStatus.PENDING.value
+        job.lane = lane
+        job.aspect_ratio = aspect_ratio or job.aspect_ratio
+        job.attempts = 0
+        job.max_attempts = settings.get_int("GENERATION_JOB_MAX_ATTEMPTS", 3)
+        job.available_at = datetime.now()
+        job.locked_by = None
+        job.locked_at = None
+        job.finished_at = None
+        job.last_error = None
+        job.is_deleted = False
+        return job
+
+    @staticmethod
+    def _pick_lane(db: Session, now: datetime) -> Optional[str]:
+        """
+        选择本次领取的通道：
+        有任务等待超过 GENERATION_LANE_MAX_WAIT 秒的通道优先（防止低权重通道饿死，与加权轮询交替），
+        否则在有可领取任务的通道间按权重平滑轮询
+        """
+        rows = db.query(GenerationJob.lane, func.min(GenerationJob.available_at)).filter(
+            GenerationJob.is_deleted == False,
+            GenerationJob.status == GenerationJobStatus.PENDING.value,
+            GenerationJob.available_at <= now,
+        ).group_by(GenerationJob.lane).all()
+        oldest = {lane: available_at for lane, available_at in rows if lane in _lane_credits}
+        if not oldest:
+            return None
+
+        max_wait = settings.get_float("GENERATION_LANE_MAX_WAIT", 120.0)
+        if max_wait > 0 and not _lane_promoted["last"]:
+            starving = [lane for lane, available_at in oldest.items() if (now - available_at).total_seconds() >= max_wait]
+            if starving:
+                lane = min(starving, key=lambda item: oldest[item])
+                _lane_stats[lane]["promoted"] += 1
+                _lane_promoted["last"] = True
+                return lane
+        _lane_promoted["last"] = False
+
+        weights = GenerationJobService.lane_weights()
+        candidates = [lane for lane in GENERATION_LANES if lane in oldest and weights[lane] > 0]
+        if not candidates:
+            # 只有权重为0的通道有任务
+            return min(oldest, key=lambda item: oldest[item])
+
+        total = sum(weights[lane] for lane in candidates)
+        for lane in candidates:
+            _lane_credits[lane] += weights[lane]
+        lane = max(candidates, key=lambda item: _lane_credits[item])
+        _lane_credits[lane] -= total
+        return lane
+
+    @staticmethod
+    def _record_claim(job: GenerationJob, now: datetime) -> None:
+        stats = _lane_stats.get(job.lane)
+        if stats is None:
+            return
+        wait_ms = max((now - job.available_at).total_seconds(), 0.0) * 1000
+        stats["claimed"] += 1
+        stats["total_wait_ms"] += wait_ms
+        stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+
+    @staticmethod
+    def claim_next(db: Session, worker_id: str) -> Optional[GenerationJob]:
+        """
+        领取下一个可执行的任务：租约已过期的执行中任务，或按通道权重选出的等待中任务
+        使用 SELECT ... FOR UPDATE SKIP LOCKED 保证多个worker不会领取同一任务
+        """
+        now = datetime.now()
+        lease_cutoff = now - timedelta(seconds=GenerationJobService.lease_seconds())
+        try:
+            lane = GenerationJobService._pick_lane(db, now)
+            expired = and_(
+                GenerationJob.status == GenerationJobStatus.RUNNING.value,
+                GenerationJob.locked_at < lease_cutoff,
+            )
+            pending = and_(
+                GenerationJob.status == GenerationJobStatus.PENDING.value,
+                GenerationJob.available_at <= now,
+            )
+            query = db.query(GenerationJob).filter(GenerationJob.is_deleted == False).order_by(
+                GenerationJob.available_at, GenerationJob.id
+            )
+
+            job = None
+            if lane is not None:
+                job = query.filter(
+                    or_(and_(pending, GenerationJob.lane == lane), expired)
+                ).with_for_update(skip_locked=True).first()
+            if not job:
+                # 所选通道的任务已被其他worker领取，退回到任意通道
+                job = query.filter(or_(pending, expired)).with_for_update(skip_locked=True).first()
+
+            if not job:
+                db.rollback()
+                return None
+
+            if job.status == GenerationJobStatus.RUNNING.value:
+                logger.warning(f"任务 {job.id} 租约已过期（原worker: {job.locked_by}），重新领取")
+            else:
+                GenerationJobService._record_claim(job, now)
+
+            job.status = GenerationJobStatus.RUNNING.value
+            job.locked_by = worker_id
+            job.locked_at = now
+            job.started_at = now
+            job.attempts += 1
+            db.commit()
+            db.refresh(job)
+            return job
+        except Exception as e:
+            db.rollback()
+            logger.error(f"领取生成任务失败: {str(e)}")
+            return None
+
+    @staticmethod
+    def renew_leases(db: Session, worker_id: str, artwork_ids: List[int]) -> int:
+        """
+        为本worker执行中的任务续期租约，避免执行时间超过租约时长的任务被其他worker重复领取
+
+        Returns:
+            续期成功的任务数
+        """
+        if not artwork_ids:
+            return 0
+        renewed = db.query(GenerationJob).filter(
+            GenerationJob.artwork_id.in_(artwork_ids),
+            GenerationJob.locked_by == worker_id,
+            GenerationJob.status == GenerationJobStatus.RUNNING.value,
+        ).update({GenerationJob.locked_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+        return renewed
+
+    @staticmethod
+    def _held_job(db: Session, job_id: int, worker_id: str) -> Optional[GenerationJob]:
+        """
+        查询仍由该worker持有的执行中任务；租约已被其他worker接管或任务已被取消时返回None
+        """
+        job = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.locked_by == worker_id,
+            GenerationJob.status == GenerationJobStatus.RUNNING.value,
+        ).with_for_update().first()
+        if not job:
+            db.rollback()
+            logger.info(f"任务 {job_id} 已不由 {worker_id} 持有（租约已被接管或任务已结束），不更新任务状态")
+        return job
+
+    @staticmethod
+    def finish(db: Session, job_id: int, worker_id: str) -> None:
+        """
+        作品处理流程结束后，根据作品最终状态结束任务（只更新仍由该worker持有的任务）
+        """
+        job = GenerationJobService._held_job(db, job_id, worker_id)
+        if not job:
+            return
+        artwork = db.query(Artwork).filter(Artwork.id == job.artwork_id).first()
+        if artwork and artwork.status == ArtworkStatus.COMPLETED.value:
+            job.status = GenerationJobStatus.COMPLETED.value
+        else:
+            job.status = GenerationJobStatus.FAILED.value
+            job.last_error = artwork.error_message if artwork else "作品记录不存在"
+        job.finished_at = datetime.now()
+        job.locked_by = None
+        db.commit()
+
+    @staticmethod
+    def schedule_retry(db: Session, job_id: int, worker_id: str, error_message: str) -> Optional[bool]:
+        """
+        按指数退避重新排队任务（只更新仍由该worker持有的任务）
+
+        Returns:
+            是否已重新排队；重试次数耗尽时返回False，任务被标记为失败；
+            任务已不由该worker持有时返回None，作品由新的持有者处理
+        """
+        job = GenerationJobService._held_job(db, job_id, worker_id)
+        if not job:
+            return None
+
+        job.last_error = error_message
+        job.locked_by = None
+        if job.attempts >= job.max_attempts or job.cancel_requested:
+            job.status = GenerationJobStatus.FAILED.value
+            job.finished_at = datetime.now()
+            db.commit()
+            return False
+
+        base_delay = settings.get_float("GENERATION_RETRY_BASE_DELAY", 10.0)
+        delay = base_delay * (2 ** (job.attempts - 1))
+        job.status = GenerationJobStatus.PENDING.value
+        job.available_at = datetime.now() + timedelta(seconds=delay)
+        db.commit()
+        logger.info(f"任务 {job.id}（作品 {job.artwork_id}）将在 {delay:.0f} 秒后重试，第 {job.attempts + 1}/{job.max_attempts} 次")
+        return True
+
+    @staticmethod
+    def request_cancel(db: Session, artwork_id: int) -> Optional[GenerationJob]:
+        """
+        标记任务已被用户取消（只修改会话，由调用方提交事务）
+
+        未结束的任务直接置为失败，立即释放用户的并发名额；执行中的worker通过轮询 cancel_requested 停止生成。
+        """
+        job = db.query(GenerationJob).filter(
+            GenerationJob.artwork_id == artwork_id,
+            GenerationJob.is_deleted == False
+        ).first()
+        if not job:
+            return None
+
+        job.cancel_requested = True
+        if job.status in ACTIVE_JOB_STATUSES:
+            job.status = GenerationJobStatus.FAILED.value
+            job.finished_at = datetime.now()
+            job.last_error = "用户取消"
+        return job
+
+    @staticmethod
+    def cancelled_artwork_ids(db: Session, artwork_ids: List[int]) -> List[int]:
+        """返回其中已被用户取消的作品ID"""
+        if not artwork_ids:
+            return []
+        rows = db.query(GenerationJob.artwork_id).filter(
+            GenerationJob.artwork_id.in_(artwork_ids),
+            GenerationJob.cancel_requested == True
+        ).all()
+        return [artwork_id for artwork_id, in rows]
+
+    @staticmethod
+    def recover_jobs(db: Session, worker_id: str) -> int:
+        """
+        启动时恢复任务：由本worker标识持有的执行中任务（上次进程退出时遗留）以及租约过期的任务重新置为等待
+        """
+        lease_cutoff = datetime.now() - timedelta(seconds=GenerationJobService.lease_seconds())
+        jobs = db.query(GenerationJob).filter(
+            GenerationJob.is_deleted == False,
+            GenerationJob.status == GenerationJobStatus.RUNNING.value,
+            or_(
+                GenerationJob.locked_by == worker_id,
+                GenerationJob.locked_at < lease_cutoff,
+            )
+        ).all()
+        for job in jobs:
+            job.status = GenerationJobStatus.PENDING.value
+            job.locked_by = None
+            job.available_at = datetime.now()
+        db.commit()
+        return len(jobs)
+
+    @staticmethod
+    def enqueue_orphaned_artworks(db: Session) -> int:
+        """
+        为处于处理中但没有任务记录的作品补建任务（兼容引入任务队列之前创建的作品）
+        """
+        orphaned = db.query(Artwork.id, Artwork.user_id).outerjoin(
+            GenerationJob, GenerationJob.artwork_id == Artwork.id
+        ).filter(
+            Artwork.is_deleted == False,
+            Artwork.status == ArtworkStatus.PROCESSING.value,
+            GenerationJob.id == None,
+        ).all()
+        for artwork_id, user_id in orphaned:
+            GenerationJobService.enqueue(db, artwork_id, user_id)
+        db.commit()
+        return len(orphaned)
+
+    @staticmethod
+    def count_active(db: Session, user_id: Optional[int] = None) -> int:
+        """
+        统计等待中和执行中的任务数，可按用户过滤
+        """
+        query = db.query(func.count(GenerationJob.id)).filter(
+            GenerationJob.is_deleted == False,
+            GenerationJob.status.in_(ACTIVE_JOB_STATUSES),
+        )
+        if user_id is not None:
+            query = query.filter(GenerationJob.user_id == user_id)
+        return query.scalar() or 0
+
+    @staticmethod
+    def average_job_seconds(db: Session) -> float:
+        """
+        最近完成任务的平均执行耗时（秒），结果缓存30秒
+        """
+        now = time.monotonic()
+        if _avg_duration_cache["expires_at"] > now:
+            return _avg_duration_cache["value"]
+
+        default = settings.get_float("GENERATION_AVG_JOB_SECONDS", 60.0)
+        rows = db.query(GenerationJob.started_at, GenerationJob.finished_at).filter(
+            GenerationJob.status == GenerationJobStatus.COMPLETED.value,
+            GenerationJob.finished_at != None,
+            GenerationJob.started_at != None,
+        ).order_by(GenerationJob.id.desc()).limit(50).all()
+        durations = [
+            (finished_at - started_at).total_seconds()
+            for started_at, finished_at in rows
+            if finished_at > started_at
+        ]
+        value = sum(durations) / len(durations) if durations else default
+
+        _avg_duration_cache["value"] = value
+        _avg_duration_cache["expires_at"] = now + 30
+        return value
+
+    @staticmethod
+    def estimate_capacity(db: Session) -> int:
+        """
+        估算集群同时执行任务的能力：活跃worker数量 × 单进程并发数
+        """
+        active_workers = db.query(func.count(func.distinct(GenerationJob.locked_by))).filter(
+            GenerationJob.status == GenerationJobStatus.RUNNING.value,
+        ).scalar() or 0
+        return max(active_workers, 1) * max(settings.get_int("GENERATION_WORKER_CONCURRENCY", 4), 1)
+
+    @staticmethod
+    def check_admission(db: Session, user_id: int, count: int = 1) -> Tuple[bool, Dict[str, Any]]:
+        """
+        生成任务准入控制，在扣除积分前调用
+
+        同一次提交的多个任务作为一个整体准入：批量任务数超过用户并发上限时，只要用户当前没有活跃任务即可入队，
+        否则风格数较多的批量请求永远无法通过用户并发检查
+
+        Returns:
+            是否允许入队；拒绝时返回错误信息和建议的重试等待秒数(retry_after)
+        """
+        max_per_user = settings.get_int("GENERATION_MAX_ACTIVE_JOBS_PER_USER", 2)
+        max_global = settings.get_int("GENERATION_MAX_ACTIVE_JOBS", 200)
+
+        if max_per_user > 0:
+            user_active = GenerationJobService.count_active(db, user_id)
+            if user_active + min(count, max_per_user) > max_per_user:
+                avg_seconds = GenerationJobService.average_job_seconds(db)
+                return False, {
+                    "error": f"您已有 {user_active} 个作品正在生成，请稍后再试",
+                    "retry_after": max(int(math.ceil(avg_seconds)), 1),
+                }
+
+        if max_global > 0:
+            queue_depth = GenerationJobService.count_active(db)
+            if queue_depth + count > max_global:
+                # 需要先有多少个任务完成才能放入新任务，按集群吞吐换算为等待时间
+                excess = queue_depth + count - max_global
+                capacity = GenerationJobService.estimate_capacity(db)
+                avg_seconds = GenerationJobService.average_job_seconds(db)
+                retry_after = int(math.ceil(math.ceil(excess / capacity) * avg_seconds))
+                return False, {
+                    "error": "当前生成排队人数较多，请稍后再试",
+                    "retry_after": min(max(retry_after, 1), 3600),
+                }
+
+        return True, {}
+
+    @staticmethod
+    def get_queue_position(db: Session, artwork_id: int) -> Optional[int]:
+        """
+        获取等待中任务的排队位置（从1开始），任务不在等待状态时返回None
+        """
+        job = db.query(GenerationJob).filter(
+            GenerationJob.artwork_id == artwork_id,
+            GenerationJob.is_deleted == False,
+        ).first()
+        if not job or job.status != GenerationJobStatus.PENDING.value:
+            return None
+
+        # 同一通道内与领取顺序一致（按 available_at、id 排序），另计更高优先级通道中更早入队的任务
+        lane_index = GENERATION_LANES.index(job.lane) if job.lane in GENERATION_LANES else len(GENERATION_LANES)
+        earlier = or_(
+            GenerationJob.available_at < job.available_at,
+            and_(
+                GenerationJob.available_at == job.available_at,
+                GenerationJob.id < job.id,
+            ),
+        )
+        ahead = db.query(func.count(GenerationJob.id)).filter(
+            GenerationJob.is_deleted == False,
+            GenerationJob.status == GenerationJobStatus.PENDING.value,
+            GenerationJob.lane.in_(GENERATION_LANES[:lane_index] + [job.lane]),
+            earlier,
+        ).scalar() or 0
+        return ahead + 1
+
+    @staticmethod
+    def lane_stats(db: Session) -> Dict[str, Any]:
+        """
+        各调度通道的排队情况和等待时长
+        """
+        now = datetime.now()
+        rows = db.query(
+            GenerationJob.lane, func.count(GenerationJob.id), func.min(GenerationJob.available_at)
+        ).filter(
+            GenerationJob.is_deleted == False,
+            GenerationJob.status == GenerationJobStatus.PENDING.value,
+            GenerationJob.available_at <= now,
+        ).group_by(GenerationJob.lane).all()
+        pending = {lane: (count, oldest) for lane, count, oldest in rows}
+        weights = GenerationJobService.lane_weights()
+
+        lanes = {}
+        for lane in GENERATION_LANES:
+            stats = _lane_stats[lane]
+            count, oldest = pending.get(lane, (0, None))
+            lanes[lane] = {
+                "weight": weights[lane],
+                "pending": count,
+                "oldest_wait_seconds": round(max((now - oldest).total_seconds(), 0.0), 1) if oldest else 0.0,
+                "claimed": int(stats["claimed"]),
+                "promoted": int(stats["promoted"]),
+                "avg_wait_ms": round(stats["total_wait_ms"] / stats["claimed"], 2) if stats["claimed"] else 0.0,
+                "max_wait_ms": round(stats["max_wait_ms"], 2),
+            }
+        return {
+            "max_wait_seconds": settings.get_float("GENERATION_LANE_MAX_WAIT", 120.0),
+            "lanes": lanes,
+        }
+
+
+class GenerationWorkerPool:
+    """
+    生成任务worker池：固定数量的协程从任务表中领取任务执行，限制同时进行的生成数量
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+        # 本进程执行中的作品ID -> 生成协程，以及被用户取消的作品ID
+        self._active: Dict[int, asyncio.Task] = {}
+        self._cancelled: set = set()
+
+    def start(self):
+        """启动worker协程（需在事件循环中调用）"""
+        if self._running:
+            return
+
+        from app.db.session import SessionLocal
+        db = SessionLocal()
+        try:
+            recovered = GenerationJobService.recover_jobs(db, self.worker_id)
+            orphaned = GenerationJobService.enqueue_orphaned_artworks(db)
+            logger.info(f"生成任务恢复完成: 重新排队 {recovered} 个执行中任务，补建 {orphaned} 个任务")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"恢复生成任务失败: {str(e)}")
+        finally:
+            db.close()
+
+        concurrency = max(settings.get_int("GENERATION_WORKER_CONCURRENCY", 4), 1)
+        self._running = True
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(index)) for index in range(concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._watch_cancellations()))
+        logger.info(f"启动生成任务worker池: {self.worker_id}，并发数 {concurrency}")
+
+    def stop(self):
+        """停止所有worker协程，执行中的任务会在下次启动或租约过期后被重新领取"""
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        logger.info("已停止生成任务worker池")
+
+    def notify(self):
+        """有新任务入队时唤醒空闲worker"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel_local(self, artwork_id: int) -> bool:
+        """
+        取消本进程中正在执行的生成（关闭上游的流并释放上游并发额度）
+
+        Returns:
+            作品是否在本进程中执行；其他进程中的任务由其轮询 cancel_requested 后取消
+        """
+        task = self._active.get(artwork_id)
+        if task is None or task.done():
+            return False
+        self._cancelled.add(artwork_id)
+        task.cancel()
+        logger.info(f"已取消本进程中作品 {artwork_id} 的生成")
+        return True
+
+    async def _watch_cancellations(self):
+        """
+        定期检查本进程执行中的任务是否已被用户取消（取消请求可能由其他进程接收），
+        并按租约时长的1/3续期执行中任务的租约
+        """
+        from app.db.session import SessionLocal
+
+        last_renewed = time.monotonic()
+        while self._running:
+            await asyncio.sleep(max(settings.get_float("GENERATION_CANCEL_POLL_INTERVAL", 2.0), 0.2))
+            if not self._active:
+                continue
+            artwork_ids = list(self._active)
+            db = SessionLocal()
+            try:
+                if time.monotonic() - last_renewed >= GenerationJobService.lease_seconds() / 3:
+                    GenerationJobService.renew_leases(db, self.worker_id, artwork_ids)
+                    last_renewed = time.monotonic()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"续期任务租约失败: {str(e)}")
+            try:
+                cancelled = GenerationJobService.cancelled_artwork_ids(db, artwork_ids)
+            except Exception as e:
+                logger.error(f"检查任务取消状态失败: {str(e)}")
+                cancelled = []
+            finally:
+                db.close()
+            for artwork_id in cancelled:
+                self.cancel_local(artwork_id)
+
+    async def _wait_for_work(self):
+        poll_interval = settings.get_float("GENERATION_POLL_INTERVAL", 2.0)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _worker_loop(self, index: int):
+        from app.db.session import SessionLocal
+
+        while self._running:
+            try:
+                db = SessionLocal()
+                try:
+                    job = GenerationJobService.claim_next(db, self.worker_id)
+                finally:
+                    db.close()
+
+                if job is None:
+                    await self._wait_for_work()
+                    continue
+
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"生成任务worker {index} 异常: {str(e)}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _run_job(self, job: GenerationJob):
+        from app.db.session import SessionLocal
+        from app.services.artwork import ArtworkService, RetryableGenerationError
+
+        logger.info(f"开始执行任务 {job.id}（作品 {job.artwork_id}），第 {job.attempts}/{job.max_attempts} 次")
+
+        # 租约过期被重新领取的任务可能已超出重试次数
+        if job.attempts > job.max_attempts:
+            await ArtworkService.fail_artwork(job.artwork_id, "生成任务多次中断，已停止重试")
+            db = SessionLocal()
+            try:
+                GenerationJobService.finish(db, job.id, self.worker_id)
+            finally:
+                db.close()
+            return
+
+        # 排队耗时只统计首次领取（从入队到领取），重试的退避等待不计入
+        timing = {"attempts": job.attempts}
+        if job.attempts == 1 and job.started_at and job.available_at:
+            timing["queue_wait_ms"] = max(int((job.started_at - job.available_at).total_seconds() * 1000), 0)
+        ArtworkTimingService.record(job.artwork_id, **timing)
+
+        retry_error = None
+        process = asyncio.create_task(ArtworkService.process_artwork_style(
+            job.artwork_id,
+            job.aspect_ratio,
+            allow_retry=job.attempts < job.max_attempts,
+        ))
+        self._active[job.artwork_id] = process
+        try:
+            await process
+        except asyncio.CancelledError:
+            # 用户取消时作品已由取消接口标记失败并退还积分，这里只结束任务；worker池停止时继续向上抛出
+            if job.artwork_id not in self._cancelled:
+                raise
+            logger.info(f"任务 {job.id}（作品 {job.artwork_id}）已被用户取消")
+        except RetryableGenerationError as e:
+            retry_error = str(e)
+        except Exception as e:
+            logger.error(f"任务 {job.id} 执行时发生未处理异常: {str(e)}", exc_info=True)
+            retry_error = f"处理过程中发生错误: {str(e)}"
+        finally:
+            self._active.pop(job.artwork_id, None)
+            self._cancelled.discard(job.artwork_id)
+
+        db = SessionLocal()
+        try:
+            if retry_error is None:
+                GenerationJobService.finish(db, job.id, self.worker_id)
+            elif GenerationJobService.schedule_retry(db, job.id, self.worker_id, retry_error) is False:
+                await ArtworkService.fail_artwork(job.artwork_id, retry_error)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"更新任务 {job.id} 状态失败: {str(e)}")
+        finally:
+            db.close()
+
+
+# 创建单例实例
+generation_worker_pool = GenerationWorkerPool()
@@ -0,0 +1,265 @@
+from dataclasses import dataclass
+from typing import Any, List, Optional
+import enum
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+class StreamEventType(str, enum.Enum):
+    PROGRESS = "progress"        # 百分比进度，value为0-100的整数
+    QUEUED = "queued"            # 排队中
+    GENERATING = "generating"    # 生成中
+    COMPLETED = "completed"      # 上游报告生成完成
+    FAILED = "failed"            # 上游报告生成失败，value为失败原因（可能为None）
+    RESULT_URL = "result_url"    # 结果图片URL，value为URL
+
+
+@dataclass
+class StreamEvent:
+    type: StreamEventType
+    value: Any = None
+
+
+# 上游协议中的标记（与AI中转服务的Markdown输出格式一致）
+PROGRESS_PERCENT_PATTERN = re.compile(r"进度：\s*(\d{1,3}(?:\.\d+)?)\s*%")
+URL_PATTERN = re.compile(r"!\[[^\]]*\]\((https?://[^\s)]+)\)|(?:点击)?下载\s*(https?://\S+)")
+FAILURE_PATTERN = re.compile(r">\s*生成失败\s*❌")
+FAILURE_REASON_PATTERN = re.compile(r"失败原因：\s*(.*)")
+FAILURE_REASON_LINE_PATTERN = re.compile(r">\s*失败原因：\s*(.*)")
+
+GENERATING_KEYWORDS = ["生成中", "⚡", "绘制中"]
+QUEUED_KEYWORDS = ["排队中", "🕐", "队列中"]
+COMPLETION_KEYWORDS = ["生成完成", "✅", "绘制成功"]
+ERROR_KEYWORDS = ["错误", "异常", "failed", "error", "unable", "cannot", "失败"]
+STATUS_LINE_PREFIXES = ('>', '✅', '[', '![', '🏃‍', '🕐', '⚡')
+
+# 一个事件中跨多个 data 行的JSON最大长度（字符），超过时丢弃已缓存的内容
+MAX_EVENT_DATA_CHARS = 64 * 1024
+
+
+class GenerationStreamParser:
+    """
+    AI生成SSE流的增量解析器
+
+    按行消费增量内容，每个字符只扫描常数次，解析代价与流长度成线性关系。
+    ```json 代码块内的内容不参与状态判断；进度百分比在行未结束时也会被识别，
+    其余标记在整行到达后识别。
+    """
+
+    def __init__(self):
+        self._line_buffer = ""
+        self._data_lines: List[str] = []  # 当前事件中尚未组成完整JSON的 data 行
+        self._data_chars = 0  # _data_lines 的总长度
+        self._progress_offset = 0  # 当前未结束行中已扫描过进度的位置
+        self._in_json_block = False
+        self._pending_failure = False  # 已出现失败标记，等待下一行的失败原因
+
+        self.done = False  # 是否收到 [DONE]
+        self.progress = 0
+        self.state: Optional[StreamEventType] = None
+        self.result_url: Optional[str] = None
+        self.failed = False
+        self.failure_reason: Optional[str] = None
+        self.potential_errors: List[str] = []
+
+    def feed_sse_line(self, line: str) -> List[StreamEvent]:
+        """
+        解析一行SSE数据（data: {...}），返回新产生的事件
+
+        注释行（以 : 开头）和 event/id/retry 字段被忽略。每个 data 行先单独解析，是完整JSON时立即处理；
+        否则视为跨多行JSON的一部分缓存起来，按SSE规范以换行拼接，拼成完整JSON时处理，不必等待事件结尾的空行。
+        事件结束（空行）时仍不是合法JSON、或缓存超过 MAX_EVENT_DATA_CHARS 的内容会被丢弃并记录日志，
+        不影响后续事件的解析。
+        """
+        line = line.rstrip("\r\n")
+        if not line:
+            # 空行结束当前事件
+            if self._data_lines:
+                self._drop_data("事件结束时仍不是合法JSON")
+            return []
+        if not line.startswith("data:"):
+            return []
+
+        value = line[len("data:"):]
+        value = value[1:] if value.startswith(" ") else value
+        if value.strip() == "[DONE]":
+            if self._data_lines:
+                self._drop_data("收到 [DONE] 时仍不是合法JSON")
+            self.done = True
+            return self.finish()
+
+        try:
+            chunk = json.loads(value)
+        except json.JSONDecodeError:
+            chunk = None
+        else:
+            # 有未完成的内容时，只有单独成为JSON对象的行才是新事件（上游未发送空行分隔），
+            # 其余可单独解析的行（如数组中的数字）仍按续行处理
+            if not self._data_lines:
+                return self._process_data(chunk)
+            if isinstance(chunk, dict):
+                self._drop_data("后续 data 行已是完整JSON")
+                return self._process_data(chunk)
+
+        self._data_lines.append(value)
+        self._data_chars += len(value) + 1
+        if len(self._data_lines) == 1:
+            return []
+        if self._data_chars > MAX_EVENT_DATA_CHARS:
+            self._drop_data(f"超过 {MAX_EVENT_DATA_CHARS} 个字符")
+            return []
+        try:
+            chunk = json.loads("\n".join(self._data_lines))
+        except json.JSONDecodeError:
+            # 等待后续 data 行
+            return []
+        self._data_lines = []
+        self._data_chars = 0
+        return self._process_data(chunk)
+
+    def _drop_data(self, reason: str):
+        data = "\n".join(self._data_lines)
+        self._data_lines = []
+        self._data_chars = 0
+        logger.warning(f"丢弃无法解析的SSE数据（{reason}）: {data[:200]!r}")
+
+    def _process_data(self, chunk: Any) -> List[StreamEvent]:
+        if not isinstance(chunk, dict):
+            return []
+        choices = chunk.get("choices")
+        if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+            return []
+        delta = choices[0].get("delta")
+        content = delta.get("content") if isinstance(delta, dict) else None
+        if not content or not isinstance(content, str):
+            return []
+        return self.feed(content)
+
+    def feed(self, text: str) -> List[StreamEvent]:
+        """
+        消费一段增量文本，返回新产生的事件
+        """
+        events: List[StreamEvent] = []
+        if self.failed:
+            return events
+
+        self._line_buffer += text
+        while "\n" in self._line_buffer and not self.failed:
+            line, self._line_buffer = self._line_buffer.split("\n", 1)
+            self._process_line(line, events)
+            self._progress_offset = 0
+
+        # 未结束的行中提前识别进度，只扫描上次匹配之后的部分
+        if not self.failed and not self._pending_failure and not self._in_json_block and self._line_buffer:
+            self._scan_progress(self._line_buffer, events)
+        return events
+
+    def finish(self) -> List[StreamEvent]:
+        """
+        流结束时处理剩余内容
+        """
+        events: List[StreamEvent] = []
+        if self._line_buffer and not self.failed:
+            line, self._line_buffer = self._line_buffer, ""
+            self._process_line(line, events)
+            self._progress_offset = 0
+        if self._pending_failure and not self.failed:
+            self._emit_failure(None, events)
+        return events
+
+    @property
+    def failure_message(self) -> str:
+        message = "生成失败 ❌"
+        if self.failure_reason:
+            message += f" 原因：{self.failure_reason}"
+        return message
+
+    def _emit_failure(self, reason: Optional[str], events: List[StreamEvent]):
+        self._pending_failure = False
+        self.failed = True
+        self.failure_reason = reason.strip() if reason and reason.strip() else None
+        self.state = StreamEventType.FAILED
+        events.append(StreamEvent(StreamEventType.FAILED, self.failure_reason))
+
+    def _set_progress(self, value: int, events: List[StreamEvent]):
+        value = min(value, 100)
+        if value > self.progress:
+            self.progress = value
+            events.append(StreamEvent(StreamEventType.PROGRESS, value))
+
+    def _set_state(self, state: StreamEventType, events: List[StreamEvent]):
+        if self.state != state:
+            self.state = state
+            events.append(StreamEvent(state))
+
+    def _scan_progress(self, line: str, events: List[StreamEvent]) -> bool:
+        matched = False
+        for match in PROGRESS_PERCENT_PATTERN.finditer(line, self._progress_offset):
+            try:
+                self._set_progress(int(float(match.group(1))), events)
+                matched = True
+            except ValueError:
+                pass
+            self._progress_offset = match.end()
+        return matched
+
+    def _process_line(self, line: str, events: List[StreamEvent]):
+        stripped = line.strip()
+
+        # 失败原因可能在失败标记的下一行
+        if self._pending_failure:
+            reason_match = FAILURE_REASON_LINE_PATTERN.match(stripped)
+            self._emit_failure(reason_match.group(1) if reason_match else None, events)
+            return
+
+        # 跳过 ```json 代码块
+        if self._in_json_block:
+            if stripped.startswith("```"):
+                self._in_json_block = False
+            return
+        if stripped.startswith("```json"):
+            self._in_json_block = True
+            return
+
+        if not stripped:
+            return
+
+        if FAILURE_PATTERN.search(stripped):
+            reason_match = FAILURE_REASON_PATTERN.search(stripped)
+            if reason_match:
+                self._emit_failure(reason_match.group(1), events)
+            else:
+                self._pending_failure = True
+            return
+
+        has_progress = self._scan_progress(line, events)
+
+        if not has_progress:
+            if any(keyword in stripped for keyword in GENERATING_KEYWORDS):
+                self._set_state(StreamEventType.GENERATING, events)
+            elif any(keyword in stripped for keyword in QUEUED_KEYWORDS):
+                self._set_state(StreamEventType.QUEUED, events)
+
+        is_completion = any(keyword in stripped for keyword in COMPLETION_KEYWORDS)
+        if is_completion:
+            self._set_state(StreamEventType.COMPLETED, events)
+            self._set_progress(100, events)
+
+        if self.result_url is None:
+            url_match = URL_PATTERN.search(stripped)
+            if url_match:
+                self.result_url = url_match.group(1) or url_match.group(2)
+                events.append(StreamEvent(StreamEventType.RESULT_URL, self.result_url))
+                self._set_progress(100, events)
+                return
+
+        # 兜底：记录可能表示错误的文本片段
+        if not has_progress and not is_completion and len(stripped) < 150:
+            if stripped.startswith(STATUS_LINE_PREFIXES) or stripped.startswith(("{", '"')) or stripped.endswith(("}", '"')):
+                return
+            lowered = stripped.lower()
+            if any(keyword in lowered for keyword in ERROR_KEYWORDS):
+                self.potential_errors.append(stripped)
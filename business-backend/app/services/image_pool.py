@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from utils import image_ops
+
+logger = logging.getLogger(__name__)
+
+# 默认水印图片
+DEFAULT_WATERMARK_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "watermark.jpg")
+
+
+class ImagePoolBusyError(Exception):
+    """图片进程池排队已满，在等待时间内没有可用的位置"""
+    pass
+
+
+class ImageProcessPool:
+    """
+    图片处理进程池
+
+    Pillow的解码、校验、水印等CPU密集型操作在独立的子进程中执行，避免阻塞事件循环。
+    同时提交的任务数（执行中+排队中）不超过 IMAGE_POOL_MAX_PENDING，
+    超出时等待 IMAGE_POOL_QUEUE_TIMEOUT 秒，仍无位置则抛出 ImagePoolBusyError。
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._workers = 0
+        self._stats: Dict[str, Any] = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "waiting": 0,
+            "in_flight": 0,
+            "total_wait_ms": 0.0,
+            "total_run_ms": 0.0,
+            "max_run_ms": 0.0,
+        }
+
+    def start(self):
+        """创建进程池（需在事件循环中调用）"""
+        if self._executor is not None:
+            return
+        self._workers = max(settings.get_int("IMAGE_POOL_WORKERS", min(2, os.cpu_count() or 1)), 1)
+        max_pending = max(settings.get_int("IMAGE_POOL_MAX_PENDING", 32), self._workers)
+        # 使用spawn避免在已有线程和事件循环的进程中fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._semaphore = asyncio.Semaphore(max_pending)
+        logger.info(f"启动图片处理进程池，进程数 {self._workers}，最大排队数 {max_pending}")
+
+    def stop(self):
+        """关闭进程池，不等待排队中的任务"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._semaphore = None
+            logger.info("已关闭图片处理进程池")
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        在进程池中执行函数（func必须是可序列化的模块级函数）
+
+        Raises:
+            ImagePoolBusyError: 排队已满且等待超时
+        """
+        if self._executor is None:
+            self.start()
+
+        queue_timeout = settings.get_float("IMAGE_POOL_QUEUE_TIMEOUT", 30.0)
+        # 进程池重建后旧任务仍释放原来的信号量
+        semaphore = self._semaphore
+        stats = self._stats
+        stats["waiting"] += 1
+        wait_start = time.monotonic()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=queue_timeout)
+        except asyncio.TimeoutError:
+            stats["rejected"] += 1
+            raise ImagePoolBusyError(f"图片处理繁忙，排队超过 {queue_timeout} 秒")
+        finally:
+            stats["waiting"] -= 1
+
+        stats["submitted"] += 1
+        stats["in_flight"] += 1
+        run_start = time.monotonic()
+        stats["total_wait_ms"] += (run_start - wait_start) * 1000
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, func, *args)
+            stats["completed"] += 1
+            return result
+        except BrokenProcessPool:
+            # 子进程异常退出（如内存不足被杀），重建进程池
+            stats["failed"] += 1
+            logger.error("图片处理进程池已损坏，重新创建")
+            self.stop()
+            raise
+        except Exception:
+            stats["failed"] += 1
+            raise
+        finally:
+            run_ms = (time.monotonic() - run_start) * 1000
+            stats["in_flight"] -= 1
+            stats["total_run_ms"] += run_ms
+            stats["max_run_ms"] = max(stats["max_run_ms"], run_ms)
+            semaphore.release()
+
+    async def image_size(self, image_data: bytes) -> Tuple[int, int]:
+        """读取图片宽高"""
+        return await self.run(image_ops.image_size, image_data)
+
+    async def watermark(self, image_data: bytes, watermark_path: Optional[str] = None) -> bytes:
+        """添加水印，返回新的图片字节"""
+        quality = min(max(settings.get_int("WATERMARK_QUALITY", 75), 1), 100)
+        return await self.run(image_ops.apply_watermark, image_data, watermark_path or DEFAULT_WATERMARK_PATH, quality)
+
+    async def variants(self, image_data: bytes) -> Dict[str, Dict[str, bytes]]:
+        """生成缩略图和中等尺寸的派生图，返回 名称 -> {"webp": 字节, "jpeg": 字节}"""
+        sizes = {
+            "thumbnail": max(settings.get_int("IMAGE_THUMBNAIL_SIZE", 360), 16),
+            "medium": max(settings.get_int("IMAGE_MEDIUM_SIZE", 1080), 16),
+        }
+        quality = min(max(settings.get_int("IMAGE_VARIANT_QUALITY", 80), 1), 100)
+        return await self.run(image_ops.make_variants, image_data, sizes, quality)
+
+    def stats(self) -> Dict[str, Any]:
+        """进程池的使用情况（当前进程）"""
+        stats = self._stats
+        finished = stats["completed"] + stats["failed"]
+        return {
+            "workers": self._workers,
+            "submitted": stats["submitted"],
+            "completed": stats["completed"],
+            "failed": stats["failed"],
+            "rejected": stats["rejected"],
+            "waiting": stats["waiting"],
+            "in_flight": stats["in_flight"],
+            "avg_wait_ms": round(stats["total_wait_ms"] / stats["submitted"], 2) if stats["submitted"] else 0.0,
+            "avg_run_ms": round(stats["total_run_ms"] / finished, 2) if finished else 0.0,
+            "max_run_ms": round(stats["max_run_ms"], 2),
+        }
+
+
+# 创建单例实例
+image_pool = ImageProcessPool()
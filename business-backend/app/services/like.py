@@ -1,8 +1,9 @@
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Set
 import logging
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, exists, select, update, delete
 from sqlalchemy.exc import IntegrityError
 
 from app.models.like import Like
@@ -154,4 +155,124 @@ class LikeService:
         """
         return db.query(func.count(Like.id))\
             .filter(Like.artwork_id == artwork_id)\
-            .scalar() 
\ No newline at end of file
+            .scalar()
+
+
+class AsyncLikeService:
+    """
+    LikeService 的异步版本，供使用异步会话（get_async_db）的接口调用
+    """
+
+    @staticmethod
+    async def like_artwork(
+        db: AsyncSession, 
+        user_id: int, 
+        artwork_id: int
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        点赞作品
+        """
+        try:
+            # 检查作品是否存在
+            if await db.scalar(select(Artwork.id).where(Artwork.id == artwork_id)) is None:
+                return False, {"error": "作品不存在"}
+            
+            # 创建点赞记录（重复点赞在此触发唯一约束冲突）
+            db.add(Like(user_id=user_id, artwork_id=artwork_id))
+            await db.flush()
+            
+            # 更新作品点赞数，在数据库中自增，并发点赞时不会互相覆盖
+            await db.execute(
+                update(Artwork)
+                .where(Artwork.id == artwork_id)
+                .values(likes_count=Artwork.likes_count + 1)
+                .execution_options(synchronize_session=False)
+            )
+            likes_count = await db.scalar(select(Artwork.likes_count).where(Artwork.id == artwork_id))
+            
+            # 提交事务
+            await db.commit()
+            
+            return True, {"message": "点赞成功", "likes_count": likes_count}
+            
+        except IntegrityError:
+            # 唯一约束冲突，用户已经点赞过该作品
+            await db.rollback()
+            return False, {"error": "已经点赞过该作品"}
+            
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"点赞作品时发生错误: {str(e)}")
+            return False, {"error": f"点赞失败: {str(e)}"}
+    
+    @staticmethod
+    async def unlike_artwork(
+        db: AsyncSession, 
+        user_id: int, 
+        artwork_id: int
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """
+        取消点赞作品
+        """
+        try:
+            # 检查作品是否存在
+            if await db.scalar(select(Artwork.id).where(Artwork.id == artwork_id)) is None:
+                return False, {"error": "作品不存在"}
+            
+            # 删除点赞记录，并发取消时只有一个请求删除成功
+            deleted = await db.execute(delete(Like).where(
+                Like.user_id == user_id,
+                Like.artwork_id == artwork_id
+            ).execution_options(synchronize_session=False))
+            
+            if not deleted.rowcount:
+                await db.rollback()
+                return False, {"error": "未点赞过该作品"}
+            
+            # 更新作品点赞数，在数据库中自减（确保不会小于0）
+            await db.execute(
+                update(Artwork)
+                .where(Artwork.id == artwork_id, Artwork.likes_count > 0)
+                .values(likes_count=Artwork.likes_count - 1)
+                .execution_options(synchronize_session=False)
+            )
+            likes_count = await db.scalar(select(Artwork.likes_count).where(Artwork.id == artwork_id))
+            
+            # 提交事务
+            await db.commit()
+            
+            return True, {"message": "取消点赞成功", "likes_count": likes_count}
+            
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"取消点赞作品时发生错误: {str(e)}")
+            return False, {"error": f"取消点赞失败: {str(e)}"}
+    
+    @staticmethod
+    async def check_user_liked(
+        db: AsyncSession, 
+        user_id: int, 
+        artwork_id: int
+    ) -> bool:
+        """
+        检查用户是否已点赞作品
+        """
+        return bool(await db.scalar(select(
+            exists().where(
+                Like.user_id == user_id,
+                Like.artwork_id == artwork_id
+            )
+        )))
+    
+    @staticmethod
+    async def liked_artwork_ids(db: AsyncSession, user_id: int, artwork_ids: List[int]) -> Set[int]:
+        """
+        返回其中用户已点赞的作品ID（作品列表批量查询点赞状态）
+        """
+        if not artwork_ids:
+            return set()
+        result = await db.scalars(select(Like.artwork_id).filter(
+            Like.user_id == user_id,
+            Like.artwork_id.in_(artwork_ids)
+        ))
+        return set(result.all())
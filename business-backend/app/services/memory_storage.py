@@ -0,0 +1,72 @@
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 内存存储的URL前缀
+MEMORY_URL_PREFIX = "memory://"
+
+
+class MemoryStorage:
+    """
+    进程内存中的对象存储
+
+    STORAGE_BACKEND=memory 时代替腾讯云COS，用于本地压测和基准测试：
+    上传的数据只保存在当前进程中，进程退出后丢失，URL形如 memory://{object_key}。
+    """
+
+    def __init__(self):
+        self._objects: Dict[str, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "deletes": 0, "bytes_written": 0}
+
+    @staticmethod
+    def enabled() -> bool:
+        """是否使用内存存储（STORAGE_BACKEND 只从环境变量读取，避免误改数据库配置后影响线上存储）"""
+        return settings.STORAGE_BACKEND == "memory"
+
+    @staticmethod
+    def is_memory_url(url: Optional[str]) -> bool:
+        return bool(url) and url.startswith(MEMORY_URL_PREFIX)
+
+    def put(self, object_key: str, data: bytes, content_type: str) -> str:
+        """保存对象，返回URL"""
+        with self._lock:
+            self._objects[object_key] = (data, content_type)
+            self._stats["puts"] += 1
+            self._stats["bytes_written"] += len(data)
+        return f"{MEMORY_URL_PREFIX}{object_key}"
+
+    def get(self, url: str) -> Optional[Tuple[bytes, str]]:
+        """按URL读取对象，返回 (数据, Content-Type)"""
+        if not self.is_memory_url(url):
+            return None
+        return self._objects.get(url[len(MEMORY_URL_PREFIX):])
+
+    def delete(self, url: str) -> bool:
+        if not self.is_memory_url(url):
+            return False
+        with self._lock:
+            removed = self._objects.pop(url[len(MEMORY_URL_PREFIX):], None) is not None
+            if removed:
+                self._stats["deletes"] += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "objects": len(self._objects),
+                "bytes_stored": sum(len(data) for data, _ in self._objects.values()),
+                **self._stats,
+            }
+
+
+# 创建单例实例
+memory_storage = MemoryStorage()
@@ -1,10 +1,10 @@
 from typing import List, Optional, Dict, Any, Tuple
 import logging
 import uuid
-import httpx
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, and_, select
 import threading
 
 from app.models.order import Order, OrderStatus
@@ -13,6 +13,7 @@ from app.models.user import User
 from app.schemas.order import OrderCreate, OrderUpdate
 from app.services.credit import CreditService
 from app.core.config import settings
+from app.core.http_client import http_clients
 
 logger = logging.getLogger(__name__)
 
@@ -85,9 +86,9 @@ class OrderService:
                 "timeExpire": expire_time  # 添加过期时间
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(payment_url, json=payment_data)
-                result = response.json()
+            client = http_clients.get("payment")
+            response = await client.post(payment_url, json=payment_data)
+            result = response.json()
             
             if response.status_code != 200 or result.get("code") != 200:
                 return False, {"error": f"创建支付失败: {result.get('message', '未知错误')}"}
@@ -237,9 +238,9 @@ class OrderService:
                     "outTradeNo": order.order_no
                 }
                 
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(payment_url, json=payment_data)
-                    result = response.json()
+                client = http_clients.get("payment")
+                response = await client.post(payment_url, json=payment_data)
+                result = response.json()
                 
                 if response.status_code != 200 or result.get("code") != 200:
                     return False, {"error": f"查询支付状态失败: {result.get('message', '未知错误')}"}
@@ -325,9 +326,9 @@ class OrderService:
             # 调用Java支付服务关闭订单
             close_url = f"{settings.PAYMENT_GATEWAY_URL}/api/pay/close-order/{order_no}"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(close_url)
-                result = response.json()
+            client = http_clients.get("payment")
+            response = await client.post(close_url)
+            result = response.json()
             
             if response.status_code == 200 and result.get("code") == 200:
                 # 成功关闭订单
@@ -354,4 +355,100 @@ class OrderService:
                 return False, {"error": f"关闭订单失败: {result.get('message', '未知错误')}"}
         except Exception as e:
             logger.error(f"关闭订单请求失败: {str(e)}")
-            return False, {"error": f"关闭订单请求失败: {str(e)}"} 
\ No newline at end of file
+            return False, {"error": f"关闭订单请求失败: {str(e)}"}
+
+
+class AsyncOrderService:
+    """
+    OrderService 的异步版本，供使用异步会话（get_async_db）的接口调用；
+    支付状态查询和回调与后台订单检查任务共用 OrderService
+    """
+
+    @staticmethod
+    async def create_order(db: AsyncSession, user_id: int, product_id: int) -> Tuple[bool, Dict[str, Any]]:
+        """创建订单"""
+        try:
+            # 查询商品信息
+            product = await db.scalar(select(Product).filter(
+                Product.id == product_id,
+                Product.is_active == True,
+                Product.is_deleted == False
+            ))
+            
+            if not product:
+                return False, {"error": "商品不存在或已下架"}
+            
+            # 创建订单
+            order = Order(
+                order_no=OrderService.generate_order_no(),
+                user_id=user_id,
+                product_id=product_id,
+                amount=product.price,
+                credits=product.credits,
+                status=OrderStatus.PENDING
+            )
+            
+            db.add(order)
+            await db.commit()
+            await db.refresh(order)
+            
+            return True, {"order": order}
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"创建订单失败: {str(e)}")
+            return False, {"error": f"创建订单失败: {str(e)}"}
+    
+    @staticmethod
+    async def get_user_orders(
+        db: AsyncSession, 
+        user_id: int, 
+        skip: int = 0, 
+        limit: int = 20
+    ) -> List[Order]:
+        """获取用户订单列表"""
+        result = await db.scalars(select(Order).filter(
+            Order.user_id == user_id,
+            Order.is_deleted == False
+        ).order_by(desc(Order.created_at)).offset(skip).limit(limit))
+        return list(result.all())
+    
+    @staticmethod
+    async def get_order_detail(db: AsyncSession, order_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """获取订单详情"""
+        # 联合查询订单及商品信息
+        result = (await db.execute(select(
+            Order, 
+            Product.name.label("product_name"),
+            Product.description.label("product_description"),
+            Product.image_url.label("product_image_url")
+        ).join(
+            Product, 
+            Order.product_id == Product.id
+        ).filter(
+            Order.id == order_id,
+            Order.user_id == user_id,
+            Order.is_deleted == False
+        ))).first()
+        
+        if not result:
+            return None
+        
+        order, product_name, product_description, product_image_url = result
+        
+        # 构建响应数据
+        return {
+            "id": order.id,
+            "order_no": order.order_no,
+            "amount": order.amount,
+            "credits": order.credits,
+            "status": order.status,
+            "payment_id": order.payment_id,
+            "payment_time": order.payment_time,
+            "refund_time": order.refund_time,
+            "remark": order.remark,
+            "created_at": order.created_at,
+            "updated_at": order.updated_at,
+            "product_name": product_name,
+            "product_description": product_description,
+            "product_image_url": product_image_url
+        }
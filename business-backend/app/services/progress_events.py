@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# 作品结束（完成/失败）时发布的事件类型
+TERMINAL_EVENTS = {"completed", "failed"}
+
+
+class _ArtworkChannel:
+    """单个作品的事件通道：保留最近的事件用于断线续传，并向所有订阅者推送"""
+
+    def __init__(self, buffer_size: int):
+        self.seq = 0
+        self.events: Deque[Tuple[int, str, Dict[str, Any]]] = deque(maxlen=buffer_size)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.closed = False
+        self.updated_at = time.monotonic()
+
+
+class ProgressEventBroker:
+    """
+    进程内的作品进度发布/订阅
+
+    生成流水线发布进度和终态事件，SSE连接订阅对应作品的事件。
+    每个事件带有续传令牌（进程标识-序号），客户端重连时携带 Last-Event-ID 即可补发缓冲区中错过的事件；
+    令牌来自其他进程或已超出缓冲区时返回None，由调用方从数据库读取快照。
+    """
+
+    def __init__(self):
+        # 进程标识，用于识别令牌是否由本进程签发
+        self._instance_id = uuid.uuid4().hex[:8]
+        self._channels: Dict[int, _ArtworkChannel] = {}
+        self._last_purge = time.monotonic()
+
+    @staticmethod
+    def _buffer_size() -> int:
+        return max(settings.get_int("PROGRESS_EVENT_BUFFER_SIZE", 50), 1)
+
+    @staticmethod
+    def _retention_seconds() -> float:
+        return settings.get_float("PROGRESS_EVENT_RETENTION_SECONDS", 300.0)
+
+    def _token(self, seq: int) -> str:
+        return f"{self._instance_id}-{seq}"
+
+    def _parse_token(self, token: Optional[str]) -> Optional[int]:
+        if not token:
+            return None
+        instance_id, _, seq = token.partition("-")
+        if instance_id != self._instance_id or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _get_channel(self, artwork_id: int) -> _ArtworkChannel:
+        channel = self._channels.get(artwork_id)
+        if channel is None:
+            channel = _ArtworkChannel(self._buffer_size())
+            self._channels[artwork_id] = channel
+        return channel
+
+    def _purge_idle(self):
+        """清理没有订阅者且超过保留时间没有新事件的通道，最多每10秒执行一次"""
+        now = time.monotonic()
+        if now - self._last_purge < 10:
+            return
+        self._last_purge = now
+        deadline = now - self._retention_seconds()
+        expired = [
+            artwork_id for artwork_id, channel in self._channels.items()
+            if not channel.subscribers and channel.updated_at < deadline
+        ]
+        for artwork_id in expired:
+            del self._channels[artwork_id]
+
+    def current_token(self, artwork_id: int) -> str:
+        """作品当前的续传令牌（用于快照事件）"""
+        channel = self._channels.get(artwork_id)
+        return self._token(channel.seq if channel else 0)
+
+    def publish(self, artwork_id: int, event: str, data: Dict[str, Any]):
+        """
+        发布作品事件，非阻塞；订阅者队列已满时丢弃该订阅者的事件（订阅者会定期回查数据库）
+        """
+        self._purge_idle()
+        channel = self._get_channel(artwork_id)
+        if channel.closed and event in TERMINAL_EVENTS:
+            # 同一次处理的终态只推送一次
+            return
+
+        channel.seq += 1
+        channel.updated_at = time.monotonic()
+        channel.closed = event in TERMINAL_EVENTS
+        payload = {"artwork_id": artwork_id, **data}
+        channel.events.append((channel.seq, event, payload))
+
+        for queue in list(channel.subscribers):
+            try:
+                queue.put_nowait((self._token(channel.seq), event, payload))
+            except asyncio.QueueFull:
+                logger.warning(f"作品 {artwork_id} 的进度订阅者处理过慢，丢弃事件 {event}")
+
+    def subscribe(self, artwork_id: int, last_event_id: Optional[str] = None) -> Tuple[asyncio.Queue, Optional[List[Tuple[str, str, Dict[str, Any]]]]]:
+        """
+        订阅作品事件
+
+        Returns:
+            (事件队列, 需要补发的事件列表)；补发列表为None表示无法续传，需要先发送数据库快照
+        """
+        channel = self._get_channel(artwork_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        channel.subscribers.add(queue)
+
+        seq = self._parse_token(last_event_id)
+        if seq is None or seq > channel.seq:
+            return queue, None
+        # 缓冲区中最早的事件之前还有未保留的事件，无法完整续传
+        oldest_seq = channel.events[0][0] if channel.events else channel.seq + 1
+        if seq < oldest_seq - 1:
+            return queue, None
+        replay = [(self._token(item_seq), event, payload) for item_seq, event, payload in channel.events if item_seq > seq]
+        return queue, replay
+
+    def unsubscribe(self, artwork_id: int, queue: asyncio.Queue):
+        channel = self._channels.get(artwork_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        # 从未发布过事件的通道（仅由订阅创建）无需保留
+        if not channel.subscribers and channel.seq == 0:
+            del self._channels[artwork_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._channels),
+            "subscribers": sum(len(channel.subscribers) for channel in self._channels.values()),
+        }
+
+
+# 创建单例实例
+progress_broker = ProgressEventBroker()
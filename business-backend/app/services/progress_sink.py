@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import case, func, update
+
+from app.core.config import settings
+from app.models.artwork import Artwork, ArtworkStatus
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressSink:
+    """
+    生成进度的合并写入器
+
+    生成流水线只在内存中记录每个作品的最新进度，由后台协程按固定间隔批量写入数据库：
+    每个作品在一个间隔内最多写入一次，同一批次的多个作品合并为一条UPDATE语句。
+    进度到达100%时立即写入，作品结束（完成/失败）后丢弃未写入的进度。
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+    @staticmethod
+    def flush_interval() -> float:
+        return max(settings.get_float("PROGRESS_FLUSH_INTERVAL", 2.0), 0.1)
+
+    @staticmethod
+    def batch_size() -> int:
+        return max(settings.get_int("PROGRESS_FLUSH_BATCH_SIZE", 200), 1)
+
+    def start(self):
+        """启动后台写入协程（需在事件循环中调用）"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"启动进度合并写入任务，写入间隔 {self.flush_interval()}s")
+
+    def stop(self):
+        """停止后台写入协程，并同步写入剩余的进度"""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._write_batch(pending)
+        logger.info("已停止进度合并写入任务")
+
+    def report(self, artwork_id: int, progress: int):
+        """
+        记录作品的最新进度（只增不减），不直接访问数据库
+        """
+        progress = min(max(int(progress), 0), 100)
+        if progress > self._pending.get(artwork_id, -1):
+            self._pending[artwork_id] = progress
+
+    def discard(self, artwork_id: int):
+        """作品已结束，丢弃尚未写入的进度"""
+        self._pending.pop(artwork_id, None)
+
+    async def flush_artwork(self, artwork_id: int):
+        """立即写入单个作品的进度（用于进度到达100%等终态）"""
+        progress = self._pending.pop(artwork_id, None)
+        if progress is not None:
+            await self._write({artwork_id: progress})
+
+    async def flush(self):
+        """写入所有待写入的进度，按批次大小拆分为多条UPDATE"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        size = self.batch_size()
+        for start in range(0, len(items), size):
+            await self._write(dict(items[start:start + size]))
+
+    async def _write(self, batch: Dict[int, int]):
+        loop = asyncio.get_running_loop()
+        success = await loop.run_in_executor(None, self._write_batch, batch)
+        if not success:
+            # 写入失败时放回待写入队列，保留更新的进度
+            for artwork_id, progress in batch.items():
+                self.report(artwork_id, progress)
+
+    @staticmethod
+    def _write_batch(batch: Dict[int, int]) -> bool:
+        """
+        使用一条UPDATE写入一批作品的进度，只更新处理中且进度更小的作品
+        """
+        from app.db.session import SessionLocal
+        new_progress = case(batch, value=Artwork.id)
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Artwork)
+                .where(
+                    Artwork.id.in_(list(batch.keys())),
+                    Artwork.status == ArtworkStatus.PROCESSING.value,
+                    func.coalesce(Artwork.progress, 0) < new_progress,
+                )
+                .values(progress=new_progress)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            logger.debug(f"批量写入 {len(batch)} 个作品的进度")
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.error(f"批量写入作品进度失败: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+    async def _flush_loop(self):
+        while self._running:
+            try:
+                await asyncio.sleep(self.flush_interval())
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"进度合并写入任务异常: {str(e)}", exc_info=True)
+
+
+# 创建单例实例
+progress_sink = ProgressSink()
@@ -0,0 +1,164 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.result_cache import ResultCache
+from app.models.style import Style
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCacheService:
+    """
+    生成结果缓存
+
+    以 (原图内容MD5, 风格ID, 风格版本) 为键保存生成结果。用户重复提交同一张图片和同一风格时
+    直接复用已有结果，不再调用上游生成服务。风格版本由提示词和参考图计算得出，
+    修改风格后旧结果自然失效。
+
+    需要同时开启全局配置 RESULT_CACHE_ENABLED 和风格的 cache_enabled，
+    超过有效期（风格的 cache_ttl_hours，为空时使用 RESULT_CACHE_TTL_HOURS）的结果不再命中，并由后台任务定期清理。
+    """
+
+    # 命中统计（当前进程）
+    _stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "purged": 0}
+
+    @staticmethod
+    def style_version(style: Style) -> str:
+        """计算风格版本：提示词和参考图的摘要"""
+        content = f"{style.prompt or ''}\n{style.reference_image_url or ''}"
+        return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_enabled(style: Style) -> bool:
+        """该风格是否使用结果缓存"""
+        return settings.get_bool("RESULT_CACHE_ENABLED", False) and bool(style.cache_enabled)
+
+    @staticmethod
+    def ttl_hours(style: Style) -> int:
+        """该风格结果缓存的有效小时数"""
+        if style.cache_ttl_hours:
+            return style.cache_ttl_hours
+        return settings.get_int("RESULT_CACHE_TTL_HOURS", 72)
+
+    @staticmethod
+    def lookup(db: Session, source_hash: Optional[str], style: Style) -> Optional[ResultCache]:
+        """
+        查找可复用的生成结果
+
+        Returns:
+            有效期内的缓存记录，未启用或未命中时返回None
+        """
+        if not source_hash or not ResultCacheService.is_enabled(style):
+            return None
+
+        expire_before = datetime.now() - timedelta(hours=ResultCacheService.ttl_hours(style))
+        entry = db.query(ResultCache).filter(
+            ResultCache.source_hash == source_hash,
+            ResultCache.style_id == style.id,
+            ResultCache.style_version == ResultCacheService.style_version(style),
+            ResultCache.created_at >= expire_before,
+            ResultCache.is_deleted == False
+        ).first()
+
+        if entry is None:
+            ResultCacheService._stats["misses"] += 1
+            return None
+
+        ResultCacheService._stats["hits"] += 1
+        db.query(ResultCache).filter(ResultCache.id == entry.id).update(
+            {ResultCache.hit_count: ResultCache.hit_count + 1},
+            synchronize_session=False
+        )
+        return entry
+
+    @staticmethod
+    def store(db: Session, source_hash: Optional[str], style: Style, result_image_url: str, artwork_id: int) -> None:
+        """
+        保存生成结果（已存在相同键的记录时更新结果和时间）
+        """
+        if not source_hash or not result_image_url or not ResultCacheService.is_enabled(style):
+            return
+
+        style_version = ResultCacheService.style_version(style)
+        now = datetime.now()
+        try:
+            entry = db.query(ResultCache).filter(
+                ResultCache.source_hash == source_hash,
+                ResultCache.style_id == style.id,
+                ResultCache.style_version == style_version
+            ).first()
+            if entry:
+                entry.result_image_url = result_image_url
+                entry.artwork_id = artwork_id
+                entry.is_deleted = False
+                entry.created_at = now
+            else:
+                db.add(ResultCache(
+                    source_hash=source_hash,
+                    style_id=style.id,
+                    style_version=style_version,
+                    result_image_url=result_image_url,
+                    artwork_id=artwork_id,
+                    hit_count=0,
+                    created_at=now
+                ))
+            db.commit()
+            ResultCacheService._stats["stores"] += 1
+        except IntegrityError:
+            # 相同结果已由其他任务写入
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"保存作品 {artwork_id} 的结果缓存失败: {str(e)}")
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        """
+        删除过期的缓存记录（按风格各自的有效期）
+
+        Returns:
+            删除的记录数
+        """
+        now = datetime.now()
+        default_ttl = settings.get_int("RESULT_CACHE_TTL_HOURS", 72)
+        purged = 0
+
+        style_ttls = dict(db.query(Style.id, Style.cache_ttl_hours).filter(Style.cache_ttl_hours.isnot(None)).all())
+        # 使用自定义有效期的风格逐个清理，其余风格按全局有效期清理
+        for style_id, ttl_hours in style_ttls.items():
+            purged += db.query(ResultCache).filter(
+                ResultCache.style_id == style_id,
+                ResultCache.created_at < now - timedelta(hours=ttl_hours)
+            ).delete(synchronize_session=False)
+
+        query = db.query(ResultCache).filter(ResultCache.created_at < now - timedelta(hours=default_ttl))
+        if style_ttls:
+            query = query.filter(ResultCache.style_id.notin_(list(style_ttls)))
+        purged += query.delete(synchronize_session=False)
+
+        db.commit()
+        ResultCacheService._stats["purged"] += purged
+        return purged
+
+    @staticmethod
+    def stats(db: Session) -> Dict[str, Any]:
+        """命中统计（当前进程）和缓存记录数"""
+        stats = ResultCacheService._stats
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "enabled": settings.get_bool("RESULT_CACHE_ENABLED", False),
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            "stores": stats["stores"],
+            "purged": stats["purged"],
+            "entries": db.query(func.count(ResultCache.id)).filter(ResultCache.is_deleted == False).scalar() or 0,
+            "total_hits": db.query(func.coalesce(func.sum(ResultCache.hit_count), 0)).scalar() or 0,
+        }
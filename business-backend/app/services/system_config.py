@@ -125,8 +125,21 @@ class SystemConfigService:
             "AD_REWARD_CREDITS": str(base_settings.AD_REWARD_CREDITS),
             "CREATE_COST_CREDITS": str(base_settings.CREATE_COST_CREDITS),
             "MAX_UPLOAD_SIZE": str(base_settings.MAX_UPLOAD_SIZE),
+            "DIRECT_UPLOAD_EXPIRES": str(base_settings.DIRECT_UPLOAD_EXPIRES),
             "OPENAI_API_URL": base_settings.OPENAI_API_URL,
             "OPENAI_MODEL": base_settings.OPENAI_MODEL,
+            "AI_UPSTREAMS": base_settings.AI_UPSTREAMS,
+            "AI_FIRST_TOKEN_TIMEOUT": str(base_settings.AI_FIRST_TOKEN_TIMEOUT),
+            "AI_UPSTREAM_WINDOW": str(base_settings.AI_UPSTREAM_WINDOW),
+            "AI_UPSTREAM_FAILURE_THRESHOLD": str(base_settings.AI_UPSTREAM_FAILURE_THRESHOLD),
+            "AI_UPSTREAM_COOLDOWN": str(base_settings.AI_UPSTREAM_COOLDOWN),
+            "AI_UPSTREAM_ACQUIRE_TIMEOUT": str(base_settings.AI_UPSTREAM_ACQUIRE_TIMEOUT),
+            "GENERATION_HEDGE_TIER": base_settings.GENERATION_HEDGE_TIER,
+            "GENERATION_HEDGE_DELAY": str(base_settings.GENERATION_HEDGE_DELAY),
+            "OPENAI_API_KEYS": base_settings.OPENAI_API_KEYS,
+            "API_KEY_RPM": str(base_settings.API_KEY_RPM),
+            "API_KEY_BURST": str(base_settings.API_KEY_BURST),
+            "API_KEY_COOLDOWN": str(base_settings.API_KEY_COOLDOWN),
             "WECHAT_API_BASE_URL": base_settings.WECHAT_API_BASE_URL,
             "COS_REGION": base_settings.COS_REGION,
             "COS_BUCKET": base_settings.COS_BUCKET,
@@ -134,6 +147,45 @@ class SystemConfigService:
             "COS_UPLOAD_DIR": base_settings.COS_UPLOAD_DIR,
             "AD_PLATFORM": base_settings.AD_PLATFORM,
             "PAYMENT_CALLBACK_TOKEN": base_settings.PAYMENT_CALLBACK_TOKEN,
+            "HTTP2_ENABLED": str(base_settings.HTTP2_ENABLED).lower(),
+            "GENERATION_WORKER_CONCURRENCY": str(base_settings.GENERATION_WORKER_CONCURRENCY),
+            "GENERATION_JOB_MAX_ATTEMPTS": str(base_settings.GENERATION_JOB_MAX_ATTEMPTS),
+            "GENERATION_RETRY_BASE_DELAY": str(base_settings.GENERATION_RETRY_BASE_DELAY),
+            "GENERATION_JOB_LEASE_SECONDS": str(base_settings.GENERATION_JOB_LEASE_SECONDS),
+            "GENERATION_POLL_INTERVAL": str(base_settings.GENERATION_POLL_INTERVAL),
+            "GENERATION_CANCEL_POLL_INTERVAL": str(base_settings.GENERATION_CANCEL_POLL_INTERVAL),
+            "GENERATION_MAX_ACTIVE_JOBS": str(base_settings.GENERATION_MAX_ACTIVE_JOBS),
+            "GENERATION_MAX_ACTIVE_JOBS_PER_USER": str(base_settings.GENERATION_MAX_ACTIVE_JOBS_PER_USER),
+            "GENERATION_AVG_JOB_SECONDS": str(base_settings.GENERATION_AVG_JOB_SECONDS),
+            "GENERATION_PAID_LANE_DAYS": str(base_settings.GENERATION_PAID_LANE_DAYS),
+            "GENERATION_LANE_WEIGHT_PAID": str(base_settings.GENERATION_LANE_WEIGHT_PAID),
+            "GENERATION_LANE_WEIGHT_NORMAL": str(base_settings.GENERATION_LANE_WEIGHT_NORMAL),
+            "GENERATION_LANE_WEIGHT_BULK": str(base_settings.GENERATION_LANE_WEIGHT_BULK),
+            "GENERATION_LANE_MAX_WAIT": str(base_settings.GENERATION_LANE_MAX_WAIT),
+            "ARTWORK_STUCK_SECONDS": str(base_settings.ARTWORK_STUCK_SECONDS),
+            "ARTWORK_REAPER_INTERVAL": str(base_settings.ARTWORK_REAPER_INTERVAL),
+            "ARTWORK_REAPER_BATCH_SIZE": str(base_settings.ARTWORK_REAPER_BATCH_SIZE),
+            "ARTWORK_BATCH_MAX_STYLES": str(base_settings.ARTWORK_BATCH_MAX_STYLES),
+            "RESULT_CACHE_ENABLED": str(base_settings.RESULT_CACHE_ENABLED).lower(),
+            "RESULT_CACHE_TTL_HOURS": str(base_settings.RESULT_CACHE_TTL_HOURS),
+            "RESULT_CACHE_PURGE_INTERVAL": str(base_settings.RESULT_CACHE_PURGE_INTERVAL),
+            "IMAGE_POOL_WORKERS": str(base_settings.IMAGE_POOL_WORKERS),
+            "IMAGE_POOL_MAX_PENDING": str(base_settings.IMAGE_POOL_MAX_PENDING),
+            "IMAGE_POOL_QUEUE_TIMEOUT": str(base_settings.IMAGE_POOL_QUEUE_TIMEOUT),
+            "WATERMARK_ENABLED": str(base_settings.WATERMARK_ENABLED).lower(),
+            "WATERMARK_QUALITY": str(base_settings.WATERMARK_QUALITY),
+            "IMAGE_VARIANTS_ENABLED": str(base_settings.IMAGE_VARIANTS_ENABLED).lower(),
+            "IMAGE_THUMBNAIL_SIZE": str(base_settings.IMAGE_THUMBNAIL_SIZE),
+            "IMAGE_MEDIUM_SIZE": str(base_settings.IMAGE_MEDIUM_SIZE),
+            "IMAGE_VARIANT_QUALITY": str(base_settings.IMAGE_VARIANT_QUALITY),
+            "IMAGE_PROBE_BYTES": str(base_settings.IMAGE_PROBE_BYTES),
+            "COS_MULTIPART_PART_SIZE": str(base_settings.COS_MULTIPART_PART_SIZE),
+            "PROGRESS_FLUSH_INTERVAL": str(base_settings.PROGRESS_FLUSH_INTERVAL),
+            "PROGRESS_FLUSH_BATCH_SIZE": str(base_settings.PROGRESS_FLUSH_BATCH_SIZE),
+            "PROGRESS_EVENT_BUFFER_SIZE": str(base_settings.PROGRESS_EVENT_BUFFER_SIZE),
+            "PROGRESS_EVENT_RETENTION_SECONDS": str(base_settings.PROGRESS_EVENT_RETENTION_SECONDS),
+            "PROGRESS_STREAM_KEEPALIVE": str(base_settings.PROGRESS_STREAM_KEEPALIVE),
+            "PROGRESS_STREAM_MAX_SECONDS": str(base_settings.PROGRESS_STREAM_MAX_SECONDS),
         }
         
         # 添加或更新配置
@@ -1,12 +1,13 @@
 from typing import Optional, Dict, Any
-import httpx
 import json
 import logging
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from app.core.config import settings
+from app.core.http_client import http_clients
 from app.models.user import User
+from app.models.order import Order, OrderStatus
 from app.schemas.user import UserCreate, UserUpdate
 from app.core.security import create_access_token
 
@@ -29,9 +30,9 @@ class UserService:
                 "grant_type": "authorization_code"
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, params=params)
-                response_data = response.json()
+            client = http_clients.get("wechat")
+            response = await client.get(url, params=params)
+            response_data = response.json()
             
             # 检查微信API返回
             if "errcode" in response_data and response_data["errcode"] != 0:
@@ -143,6 +144,20 @@ class UserService:
         """
         return db.query(User).filter(User.id == user_id).first()
     
+    @staticmethod
+    def is_paid_user(db: Session, user_id: int, within_days: Optional[int] = None) -> bool:
+        """
+        用户是否有过已支付的订单，within_days大于0时只看最近若干天内支付的订单
+        """
+        query = db.query(Order.id).filter(
+            Order.user_id == user_id,
+            Order.status.in_([OrderStatus.PAID, OrderStatus.COMPLETED]),
+            Order.is_deleted == False
+        )
+        if within_days:
+            query = query.filter(Order.payment_time >= datetime.now() - timedelta(days=within_days))
+        return query.first() is not None
+    
     @staticmethod
     def update(db: Session, user_id: int, user_update: UserUpdate):
         """
@@ -7,6 +7,12 @@ from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.models.order import Order, OrderStatus
 from app.services.order import OrderService
+from app.services.generation_queue import generation_worker_pool
+from app.services.progress_sink import progress_sink
+from app.services.image_pool import image_pool
+from app.services.result_cache import ResultCacheService
+from app.services.artwork_reaper import ArtworkReaperService
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -138,12 +144,47 @@ async def check_all_orders_on_startup():
         if 'db' in locals():
             db.close()
 
+async def purge_result_cache_task():
+    """周期性清理过期的生成结果缓存"""
+    while True:
+        await asyncio.sleep(max(settings.get_int("RESULT_CACHE_PURGE_INTERVAL", 3600), 60))
+        db = SessionLocal()
+        try:
+            purged = ResultCacheService.purge_expired(db)
+            if purged:
+                logger.info(f"已清理 {purged} 条过期的结果缓存")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"清理结果缓存任务异常: {str(e)}")
+        finally:
+            db.close()
+
+async def reap_stuck_artworks_task():
+    """周期性清理长时间没有进展的处理中作品"""
+    while True:
+        await asyncio.sleep(max(settings.get_int("ARTWORK_REAPER_INTERVAL", 60), 10))
+        db = SessionLocal()
+        try:
+            result = ArtworkReaperService.reap(db)
+            if result["requeued"] or result["enqueued"] or result["failed"]:
+                logger.info(
+                    f"清理卡住的作品: 重新排队 {result['requeued']} 个，补建任务 {result['enqueued']} 个，"
+                    f"标记失败 {result['failed']} 个"
+                )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"清理卡住的作品任务异常: {str(e)}")
+        finally:
+            db.close()
+
 # 存储任务引用
 background_task = None
+result_cache_task = None
+reaper_task = None
 
 def start_background_tasks():
     """启动后台任务"""
-    global background_task
+    global background_task, result_cache_task, reaper_task
     
     # 启动时检查所有订单
     asyncio.create_task(check_all_orders_on_startup())
@@ -151,15 +192,38 @@ def start_background_tasks():
     if background_task is None:
         logger.info("启动订单状态检查后台任务")
         background_task = asyncio.create_task(check_payment_status_task())
+    
+    if result_cache_task is None:
+        result_cache_task = asyncio.create_task(purge_result_cache_task())
+    
+    if reaper_task is None:
+        reaper_task = asyncio.create_task(reap_stuck_artworks_task())
+    
+    # 启动进度合并写入任务、图片处理进程池和生成任务worker池
+    progress_sink.start()
+    image_pool.start()
+    generation_worker_pool.start()
 
 def stop_background_tasks():
     """停止后台任务"""
-    global background_task
+    global background_task, result_cache_task, reaper_task
     
     if background_task:
         logger.info("停止订单状态检查后台任务")
         background_task.cancel()
         background_task = None
+    
+    if result_cache_task:
+        result_cache_task.cancel()
+        result_cache_task = None
+    
+    if reaper_task:
+        reaper_task.cancel()
+        reaper_task = None
+    
+    generation_worker_pool.stop()
+    progress_sink.stop()
+    image_pool.stop()
 
 def add_order_to_check_queue(order_id: int):
     """添加订单到检查队列"""
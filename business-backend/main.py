@@ -1,6 +1,5 @@
 import logging
 import os
-import sys
 
 # 确保logs目录存在
 if not os.path.exists("logs"):
@@ -23,17 +22,27 @@ import time
 import json
 
 from app.db.session import get_db, SessionLocal
+from app.db.async_session import async_engine
 from app.api.api import api_router
 from app.core.config import settings, DynamicSettings
 from app.tasks import start_background_tasks, stop_background_tasks
+from app.core.http_client import http_clients
 
 logger = logging.getLogger(__name__)
 logger.info("应用启动中...")
 logger.info(f"日志级别: {log_level.upper()}")
 # logger.info(f"日志文件: {log_file if log_file else '未配置'}")
 
-# 初始化系统配置
-try:
+
+def load_system_config():
+    """
+    从数据库加载系统配置（在启动事件中调用，已加载时跳过）
+
+    不在导入本模块时执行：图片处理进程池使用spawn创建子进程，子进程会重新导入启动脚本，
+    以 python main.py 启动时每个子进程都会连接数据库并重复初始化。
+    """
+    if DynamicSettings._is_initialized:
+        return
     logger.info("正在从数据库加载系统配置...")
     db = SessionLocal()
     try:
@@ -49,13 +58,10 @@ try:
     except Exception as e:
         logger.error(f"从数据库加载系统配置失败: {str(e)}")
         print(f"错误: 无法从数据库加载系统配置: {str(e)}")
-        sys.exit(1)
+        raise
     finally:
         db.close()
-except Exception as e:
-    logger.error(f"连接数据库失败: {str(e)}")
-    print(f"错误: 无法连接到数据库: {str(e)}")
-    sys.exit(1)
+
 
 app = FastAPI(
     title="AI风格转换画廊API",
@@ -143,13 +149,21 @@ async def auth_middleware(request, call_next):
 
 @app.on_event("startup")
 async def startup_event():
+    load_system_config()
+    if settings.STORAGE_BACKEND == "memory":
+        logger.warning("=" * 60)
+        logger.warning("STORAGE_BACKEND=memory：上传的图片只保存在进程内存中，重启后丢失，仅用于本地压测，切勿在线上使用")
+        logger.warning("=" * 60)
     # 其他启动代码...
+    await http_clients.startup()
     start_background_tasks()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # 其他关闭代码...
     stop_background_tasks()
+    await http_clients.shutdown()
+    await async_engine.dispose()
 
 if __name__ == "__main__":
     import uvicorn
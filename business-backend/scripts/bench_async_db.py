@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+同步/异步数据库会话在混合负载下的请求延迟对比
+
+请求处理函数都是 async def，使用同步会话时查询直接在事件循环中执行，一条慢查询会阻塞同一进程中的所有请求。
+本脚本在当前进程内加载应用，通过ASGI并发发送两类请求，持续 --duration 秒：
+- 快请求：画廊列表（含点赞状态）、积分余额、点赞状态，轮流请求
+- 慢请求：--slow-concurrency 个并发持续执行一条耗时约 --slow-seconds 秒的查询，模拟报表、锁等待等慢SQL
+
+同步模式请求脚本注册的 /bench/sync/* 路由（与改造前的接口相同：async def 中调用同步服务），
+异步模式请求改造后的 /artworks/gallery、/credits/balance、/likes/check 接口，
+分别输出快请求和慢请求的成功数、失败数和延迟分位数。
+
+慢查询在MySQL上使用 SELECT SLEEP()，在SQLite上使用递归CTE计数（--sqlite-slow-rows 控制耗时）。
+数据库使用 DATABASE_URI 指定的库，脚本会在其中创建测试用户、风格和作品，请使用测试库。
+
+运行方式：
+python -m scripts.bench_async_db
+python -m scripts.bench_async_db --mode async --duration 20 --fast-concurrency 16 --slow-concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+# 添加项目根目录到Python路径
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from scripts.bench_generation_pipeline import format_percentiles
+
+
+def slow_statement(args: argparse.Namespace, backend: str):
+    from sqlalchemy import text
+
+    if backend == "mysql":
+        return text("SELECT SLEEP(:seconds)").bindparams(seconds=args.slow_seconds)
+    return text(
+        "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :rows) SELECT count(*) FROM c"
+    ).bindparams(rows=args.sqlite_slow_rows)
+
+
+def build_sync_router(args: argparse.Namespace, backend: str):
+    """改造前的接口：async def 处理函数中直接使用同步会话"""
+    from fastapi import APIRouter, Depends
+    from sqlalchemy.orm import Session
+
+    from app.core.deps import get_current_active_user
+    from app.db.session import get_db
+    from app.models.like import Like
+    from app.models.user import User
+    from app.schemas.artwork import Artwork, ArtworkListParams, ArtworkStatus
+    from app.services.artwork import ArtworkService
+    from app.services.credit import CreditService
+    from app.services.like import LikeService
+
+    router = APIRouter()
+    statement = slow_statement(args, backend)
+
+    @router.get("/gallery")
+    async def gallery(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+        params = ArtworkListParams(skip=0, limit=10, status=ArtworkStatus.COMPLETED, is_public=True)
+        artworks_db = ArtworkService.get_all(db=db, params=params)
+        likes = db.query(Like.artwork_id).filter(
+            Like.user_id == current_user.id,
+            Like.artwork_id.in_([art.id for art in artworks_db])
+        ).all()
+        liked_artwork_ids = {like[0] for like in likes}
+        return [
+            Artwork(**{**Artwork.from_orm(art).dict(), "is_liked_by_current_user": art.id in liked_artwork_ids})
+            for art in artworks_db
+        ]
+
+    @router.get("/balance")
+    async def balance(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+        return {"balance": CreditService.get_user_credit_balance(db=db, user_id=current_user.id)}
+
+    @router.get("/check/{artwork_id}")
+    async def check(artwork_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+        return {"liked": LikeService.check_user_liked(db=db, user_id=current_user.id, artwork_id=artwork_id)}
+
+    @router.get("/slow")
+    async def slow(db: Session = Depends(get_db)):
+        return {"result": db.execute(statement).scalar()}
+
+    return router
+
+
+def build_async_router(args: argparse.Namespace, backend: str):
+    """慢查询接口（异步会话）"""
+    from fastapi import APIRouter, Depends
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.db.async_session import get_async_db
+
+    router = APIRouter()
+    statement = slow_statement(args, backend)
+
+    @router.get("/slow")
+    async def slow(db: AsyncSession = Depends(get_async_db)):
+        return {"result": (await db.execute(statement)).scalar()}
+
+    return router
+
+
+async def benchmark(args: argparse.Namespace):
+    import httpx
+    from sqlalchemy.engine import make_url
+
+    import main as app_main
+    from app.core.config import settings
+    from app.core.security import create_access_token
+    from app.db.session import SessionLocal
+    from app.models.artwork import Artwork, ArtworkStatus
+    from app.models.like import Like
+    from app.models.style import Style
+    from app.models.user import User
+
+    # 从数据库加载系统配置（导入应用时不加载）
+    app_main.load_system_config()
+
+    backend = make_url(settings.DATABASE_URI).get_backend_name()
+    app_main.app.include_router(build_sync_router(args, backend), prefix="/bench/sync")
+    app_main.app.include_router(build_async_router(args, backend), prefix="/bench/async")
+
+    # 测试数据
+    db = SessionLocal()
+    try:
+        run_id = uuid.uuid4().hex[:8]
+        style = Style(name=f"bench-{run_id}", prompt="基准测试风格", credits_cost=1, is_active=True)
+        db.add(style)
+        users = [User(openid=f"bench-{run_id}-{index}", credits=100) for index in range(args.users)]
+        db.add_all(users)
+        db.flush()
+        artworks = [
+            Artwork(
+                user_id=users[index % len(users)].id,
+                style_id=style.id,
+                source_image_url=f"bench/{run_id}/{index}.jpg",
+                result_image_url=f"bench/{run_id}/{index}-result.jpg",
+                status=ArtworkStatus.COMPLETED.value,
+                is_public=True,
+                public_scope="all",
+            )
+            for index in range(args.artworks)
+        ]
+        db.add_all(artworks)
+        db.flush()
+        db.add_all([
+            Like(user_id=user.id, artwork_id=artwork.id)
+            for user in users for artwork in artworks[::3]
+        ])
+        db.commit()
+        tokens = [create_access_token(user.id) for user in users]
+        artwork_ids = [artwork.id for artwork in artworks]
+    finally:
+        db.close()
+
+    def fast_urls(mode: str) -> List[str]:
+        if mode == "sync":
+            return ["/bench/sync/gallery", "/bench/sync/balance", "/bench/sync/check/{artwork_id}"]
+        return [
+            f"{settings.API_STR}/artworks/gallery",
+            f"{settings.API_STR}/credits/balance",
+            f"{settings.API_STR}/likes/check/{{artwork_id}}",
+        ]
+
+    async def run_mode(mode: str, client: httpx.AsyncClient) -> Dict[str, Dict]:
+        results = {kind: {"latencies": [], "errors": {}} for kind in ("fast", "slow")}
+        urls = fast_urls(mode)
+
+        async def request(kind: str, url: str, headers: Dict[str, str]):
+            started = time.monotonic()
+            try:
+                response = await client.get(url, headers=headers)
+                outcome = None if response.status_code == 200 else f"HTTP {response.status_code}"
+            except Exception as e:
+                outcome = type(e).__name__
+            if outcome is None:
+                results[kind]["latencies"].append(time.monotonic() - started)
+            else:
+                results[kind]["errors"][outcome] = results[kind]["errors"].get(outcome, 0) + 1
+
+        async def fast_client(index: int, deadline: float):
+            headers = {"Authorization": f"Bearer {tokens[index % len(tokens)]}"}
+            count = index
+            while time.monotonic() < deadline:
+                url = urls[count % len(urls)].format(artwork_id=artwork_ids[count % len(artwork_ids)])
+                await request("fast", url, headers)
+                count += 1
+
+        async def slow_client(deadline: float):
+            while time.monotonic() < deadline:
+                await request("slow", f"/bench/{mode}/slow", {})
+
+        # 预热：建立连接、加载路由
+        for url in urls:
+            await client.get(url.format(artwork_id=artwork_ids[0]), headers={"Authorization": f"Bearer {tokens[0]}"})
+
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(fast_client(index, deadline) for index in range(args.fast_concurrency)),
+            *(slow_client(deadline) for _ in range(args.slow_concurrency)),
+        )
+        results["elapsed"] = time.monotonic() - start
+        return results
+
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+    transport = httpx.ASGITransport(app=app_main.app, raise_app_exceptions=False)
+    report = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            # 单独测一次慢查询的耗时
+            started = time.monotonic()
+            await client.get("/bench/async/slow")
+            slow_query_seconds = time.monotonic() - started
+            for mode in modes:
+                report[mode] = await run_mode(mode, client)
+    finally:
+        await app_main.async_engine.dispose()
+
+    print(f"\n数据库: {backend}，慢查询单次耗时 {slow_query_seconds * 1000:.0f}ms")
+    print(f"快请求并发 {args.fast_concurrency}，慢请求并发 {args.slow_concurrency}，每种模式持续 {args.duration:.0f}s")
+    for mode in modes:
+        results = report[mode]
+        name = "同步会话（改造前）" if mode == "sync" else "异步会话（当前实现）"
+        print(f"\n模式: {name}")
+        for kind, label in (("fast", "快请求"), ("slow", "慢请求")):
+            latencies, errors = results[kind]["latencies"], results[kind]["errors"]
+            print(
+                f"{label}: 成功 {len(latencies)}（{len(latencies) / results['elapsed']:.1f} 次/秒），"
+                f"失败 {sum(errors.values())} {errors or ''}"
+            )
+            print(f"  延迟: {format_percentiles(latencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/异步数据库会话在混合负载下的请求延迟对比")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both", help="压测的模式")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种模式的压测秒数")
+    parser.add_argument("--fast-concurrency", type=int, default=8, help="同时进行的快请求数")
+    parser.add_argument("--slow-concurrency", type=int, default=2, help="同时进行的慢请求数")
+    parser.add_argument("--slow-seconds", type=float, default=0.2, help="MySQL上慢查询的耗时（SELECT SLEEP）")
+    parser.add_argument("--sqlite-slow-rows", type=int, default=250000, help="SQLite上慢查询递归计数的行数")
+    parser.add_argument("--users", type=int, default=10, help="测试用户数（请求轮流使用）")
+    parser.add_argument("--artworks", type=int, default=50, help="公开作品数")
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    os.chdir(ROOT_DIR)
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
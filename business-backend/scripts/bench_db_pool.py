@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+生成任务与API请求争用数据库连接的压测
+
+启动模拟AI上游（scripts/fake_ai_upstream.py，默认每个作品流式生成十几秒），提交 --generations 个作品，
+--workers 个生成任务同时执行期间，以 --api-concurrency 个并发持续请求 GET /artworks 共 --duration 秒，输出：
+- API请求的成功数、失败数（连接池等待超过 DB_POOL_TIMEOUT 时返回500）和延迟分位数
+- 连接池中同时借出的最大连接数
+- 生成任务的完成情况
+
+同步连接池默认使用改造前的容量（pool_size 5 + max_overflow 10）。GET /artworks 已改用异步会话（独立的连接池），
+--hold-connection 下API请求不再等待同步连接池，但创建作品等仍使用同步会话的接口会。
+--hold-connection 模拟改造前的行为：每个生成任务在整个流式请求期间占用一个连接，
+默认的15个worker即可占满连接池，API请求会等待连接直至超时。worker数超过连接池容量时，
+领取任务的worker会在事件循环中阻塞等待连接，整个进程几乎停顿，压测耗时会很长。
+
+数据库使用 DATABASE_URI 指定的库，脚本会在其中创建测试用户和风格，请使用测试库。
+
+运行方式：
+python -m scripts.bench_db_pool
+python -m scripts.bench_db_pool --hold-connection
+python -m scripts.bench_db_pool --generations 40 --workers 40 --pool-size 10 --max-overflow 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+# 添加项目根目录到Python路径
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from scripts.bench_generation_pipeline import (
+    format_percentiles,
+    make_source_image,
+    start_fake_upstream,
+    wait_for_upstream,
+)
+
+
+def hold_connection_during_stream(engine):
+    """模拟改造前的行为：生成任务在整个流式请求期间占用一个数据库连接"""
+    from app.services.artwork import ArtworkService
+
+    request_generation_stream = ArtworkService._request_generation_stream
+
+    async def request_holding_connection(*args, **kwargs):
+        with engine.connect():
+            await request_generation_stream(*args, **kwargs)
+
+    ArtworkService._request_generation_stream = staticmethod(request_holding_connection)
+
+
+async def run(args: argparse.Namespace):
+    if args.upstream_url:
+        await benchmark(args, args.upstream_url)
+        return
+
+    upstream_process = start_fake_upstream(args)
+    base_url = f"http://127.0.0.1:{args.upstream_port}"
+    try:
+        await wait_for_upstream(base_url)
+        await benchmark(args, f"{base_url}/v1")
+    finally:
+        upstream_process.terminate()
+        upstream_process.wait()
+
+
+async def benchmark(args: argparse.Namespace, upstream_url: str):
+    import httpx
+
+    import main as app_main
+    from app.core.config import settings, DynamicSettings
+    from app.core.security import create_access_token
+    from app.db.session import SessionLocal, engine
+    from app.models.artwork import Artwork, ArtworkStatus
+    from app.models.style import Style
+    from app.models.user import User
+
+    # 先从数据库加载系统配置，压测用的配置在此之后覆盖
+    app_main.load_system_config()
+
+    overrides = {
+        "AI_UPSTREAMS": json.dumps([{"name": "fake", "url": upstream_url, "api_key": "bench"}]),
+        "GENERATION_WORKER_CONCURRENCY": str(args.workers),
+        "GENERATION_MAX_ACTIVE_JOBS": "0",
+        "GENERATION_MAX_ACTIVE_JOBS_PER_USER": "0",
+        "RESULT_CACHE_ENABLED": "false",
+        "WATERMARK_ENABLED": "false",
+    }
+    for key, value in overrides.items():
+        DynamicSettings.update(key, value)
+    if args.hold_connection:
+        hold_connection_during_stream(engine)
+
+    # 测试数据
+    db = SessionLocal()
+    try:
+        run_id = uuid.uuid4().hex[:8]
+        style = Style(name=f"bench-{run_id}", prompt="基准测试风格", credits_cost=1, is_active=True)
+        db.add(style)
+        users = [User(openid=f"bench-{run_id}-{index}", credits=args.generations + 10) for index in range(args.users)]
+        db.add_all(users)
+        db.commit()
+        style_id = style.id
+        tokens = [create_access_token(user.id) for user in users]
+    finally:
+        db.close()
+
+    image_base64 = make_source_image(256)
+    pool_peak = {"checked_out": 0}
+    artwork_ids: List[int] = []
+    api_latencies: List[float] = []
+    api_errors: Dict[str, int] = {}
+
+    async def sample_pool(stop: asyncio.Event):
+        while not stop.is_set():
+            pool_peak["checked_out"] = max(pool_peak["checked_out"], engine.pool.checkedout())
+            await asyncio.sleep(0.05)
+
+    async def api_client(index: int, client: httpx.AsyncClient, deadline: float):
+        headers = {"Authorization": f"Bearer {tokens[index % len(tokens)]}"}
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                response = await client.get(f"{settings.API_STR}/artworks", headers=headers)
+                outcome = None if response.status_code == 200 else f"HTTP {response.status_code}"
+            except Exception as e:
+                outcome = type(e).__name__
+            if outcome is None:
+                api_latencies.append(time.monotonic() - started)
+            else:
+                api_errors[outcome] = api_errors.get(outcome, 0) + 1
+
+    def count_by_status() -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            rows = db.query(Artwork.status).filter(Artwork.id.in_(artwork_ids)).all()
+        finally:
+            db.close()
+        counts: Dict[str, int] = {}
+        for status, in rows:
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    await app_main.startup_event()
+    transport = httpx.ASGITransport(app=app_main.app, raise_app_exceptions=False)
+    stop_sampling = asyncio.Event()
+    sampler = asyncio.create_task(sample_pool(stop_sampling))
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for index in range(args.generations):
+                response = await client.post(
+                    f"{settings.API_STR}/artworks",
+                    json={"style_id": style_id, "image_base64": image_base64},
+                    headers={"Authorization": f"Bearer {tokens[index % len(tokens)]}"},
+                )
+                if response.status_code == 200:
+                    artwork_ids.append(response.json()["id"])
+            print(f"已提交 {len(artwork_ids)}/{args.generations} 个作品，等待生成任务开始流式请求...")
+            await asyncio.sleep(args.warmup)
+
+            start = time.monotonic()
+            await asyncio.gather(*(
+                api_client(index, client, start + args.duration) for index in range(args.api_concurrency)
+            ))
+            elapsed = time.monotonic() - start
+            during_load = count_by_status()
+
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline and count_by_status().get(ArtworkStatus.PROCESSING.value, 0):
+                await asyncio.sleep(0.5)
+    finally:
+        stop_sampling.set()
+        await sampler
+        await app_main.shutdown_event()
+
+    mode = "流式请求期间占用连接（改造前）" if args.hold_connection else "短事务（当前实现）"
+    print(f"\n模式: {mode}")
+    print(
+        f"连接池: pool_size {settings.DB_POOL_SIZE} + max_overflow {settings.DB_MAX_OVERFLOW}，"
+        f"等待超时 {settings.DB_POOL_TIMEOUT}s，最多同时借出 {pool_peak['checked_out']} 个连接"
+    )
+    print(f"生成任务: {len(artwork_ids)} 个，worker并发 {args.workers}，压测结束时状态 {during_load}")
+    print(f"API请求: 并发 {args.api_concurrency}，持续 {elapsed:.1f}s，成功 {len(api_latencies)}，失败 {sum(api_errors.values())} {api_errors or ''}")
+    print(f"API延迟: {format_percentiles(api_latencies)}")
+    print(f"生成结果: {count_by_status()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成任务与API请求争用数据库连接的压测")
+    parser.add_argument("--generations", type=int, default=30, help="提交的作品数")
+    parser.add_argument("--workers", type=int, default=15, help="生成任务worker并发数（GENERATION_WORKER_CONCURRENCY）")
+    parser.add_argument("--users", type=int, default=10, help="测试用户数（请求轮流使用）")
+    parser.add_argument("--api-concurrency", type=int, default=8, help="同时进行的API请求数")
+    parser.add_argument("--duration", type=float, default=10.0, help="API压测持续秒数")
+    parser.add_argument("--warmup", type=float, default=2.0, help="提交作品后等待生成任务开始的秒数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="压测结束后等待生成任务结束的最长秒数")
+    parser.add_argument("--hold-connection", action="store_true", help="模拟改造前在流式请求期间占用连接")
+    parser.add_argument("--pool-size", type=int, default=5, help="DB_POOL_SIZE")
+    parser.add_argument("--max-overflow", type=int, default=10, help="DB_MAX_OVERFLOW")
+    parser.add_argument("--pool-timeout", type=int, default=5, help="DB_POOL_TIMEOUT")
+    parser.add_argument("--upstream-url", default=None, help="使用已启动的模拟上游（包含路径前缀，如 http://127.0.0.1:18900/v1）")
+    parser.add_argument("--upstream-port", type=int, default=18901)
+    parser.add_argument("--first-token-delay", type=float, default=1.0)
+    parser.add_argument("--chunk-delay", type=float, default=1.0)
+    parser.add_argument("--result-size", default="512x512", help="模拟上游返回的结果图尺寸")
+    args = parser.parse_args()
+    # start_fake_upstream 需要的故障注入参数
+    args.http_error_rate = args.stall_rate = args.failure_rate = 0.0
+
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(args.max_overflow)
+    os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    os.chdir(ROOT_DIR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+生成流水线的端到端基准测试
+
+在子进程中启动 scripts/fake_ai_upstream.py 作为AI上游，存储使用内存后端（STORAGE_BACKEND=memory），
+在当前进程内加载应用并启动生成任务worker，通过ASGI直接并发调用 POST /artworks，
+等待所有作品结束后输出：
+- 吞吐量（每秒完成的作品数）
+- 创建接口延迟和端到端（创建到完成）延迟的分位数
+- 数据库往返次数（SQL语句、提交、回滚，不含本脚本轮询作品状态的查询）
+- 进程峰值RSS
+
+数据库使用 DATABASE_URI 指定的库，脚本会在其中创建测试用户和风格，请使用测试库。
+生成任务只在读写数据时短暂占用连接；连接池容量见 DB_POOL_SIZE + DB_MAX_OVERFLOW，
+生成任务与API请求争用连接的情况见 scripts/bench_db_pool.py。
+
+运行方式：
+python -m scripts.bench_generation_pipeline
+python -m scripts.bench_generation_pipeline --requests 500 --concurrency 8 --workers 6 --chunk-delay 0.02
+python -m scripts.bench_generation_pipeline --upstream-url http://127.0.0.1:18900/v1   # 使用已启动的模拟上游
+"""
+
+import argparse
+import asyncio
+import base64
+import contextvars
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 添加项目根目录到Python路径
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+# 轮询作品状态的查询不计入数据库往返次数
+_bench_internal = contextvars.ContextVar("bench_internal", default=False)
+
+
+def peak_rss_mb() -> float:
+    # Linux下ru_maxrss单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_source_image(size: int) -> str:
+    """生成测试原图（噪声JPEG），返回base64"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(buffer, "JPEG", quality=90)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def start_fake_upstream(args: argparse.Namespace) -> subprocess.Popen:
+    command = [
+        sys.executable, str(ROOT_DIR / "scripts" / "fake_ai_upstream.py"),
+        "--port", str(args.upstream_port),
+        "--first-token-delay", str(args.first_token_delay),
+        "--chunk-delay", str(args.chunk_delay),
+        "--http-error-rate", str(args.http_error_rate),
+        "--stall-rate", str(args.stall_rate),
+        "--failure-rate", str(args.failure_rate),
+        "--image-size", args.result_size,
+    ]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for_upstream(url: str, timeout: float = 15.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{url}/stats")
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"模拟上游 {url} 未能在 {timeout} 秒内启动")
+
+
+def install_query_counter(engine) -> Dict[str, int]:
+    from sqlalchemy import event
+
+    counts = {"statements": 0, "commits": 0, "rollbacks": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if not _bench_internal.get():
+            counts["statements"] += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(conn):
+        if not _bench_internal.get():
+            counts["commits"] += 1
+
+    @event.listens_for(engine, "rollback")
+    def count_rollback(conn):
+        if not _bench_internal.get():
+            counts["rollbacks"] += 1
+
+    return counts
+
+
+def format_percentiles(values: List[float]) -> str:
+    from app.services.artwork_timing import percentile
+
+    if not values:
+        return "-"
+    ordered = sorted(values)
+    return " ".join(
+        f"{name}={percentile(ordered, q) * 1000:.0f}ms"
+        for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+    ) + f" max={ordered[-1] * 1000:.0f}ms"
+
+
+async def run(args: argparse.Namespace):
+    if args.upstream_url:
+        await benchmark(args, args.upstream_url)
+        return
+
+    upstream_process = start_fake_upstream(args)
+    base_url = f"http://127.0.0.1:{args.upstream_port}"
+    try:
+        await wait_for_upstream(base_url)
+        await benchmark(args, f"{base_url}/v1")
+    finally:
+        if upstream_process is not None:
+            upstream_process.terminate()
+            upstream_process.wait()
+
+
+async def benchmark(args: argparse.Namespace, upstream_url: str):
+    import json
+    import httpx
+
+    import main as app_main
+    from app.core.config import settings, DynamicSettings
+    from app.core.security import create_access_token
+    from app.db.session import SessionLocal, engine
+    from app.models.artwork import Artwork, ArtworkStatus
+    from app.models.style import Style
+    from app.models.user import User
+    from app.services.memory_storage import memory_storage
+
+    # 先从数据库加载系统配置，压测用的配置在此之后覆盖
+    app_main.load_system_config()
+
+    overrides = {
+        "AI_UPSTREAMS": json.dumps([{"name": "fake", "url": upstream_url, "api_key": "bench"}]),
+        "GENERATION_WORKER_CONCURRENCY": str(args.workers),
+        "GENERATION_MAX_ACTIVE_JOBS": "0",
+        "GENERATION_MAX_ACTIVE_JOBS_PER_USER": "0",
+        "GENERATION_RETRY_BASE_DELAY": "1",
+        "RESULT_CACHE_ENABLED": "false",
+        "WATERMARK_ENABLED": str(args.watermark).lower(),
+    }
+    for key, value in overrides.items():
+        DynamicSettings.update(key, value)
+
+    # 测试数据
+    db = SessionLocal()
+    try:
+        run_id = uuid.uuid4().hex[:8]
+        style = Style(name=f"bench-{run_id}", prompt="基准测试风格", credits_cost=1, is_active=True)
+        db.add(style)
+        users = [User(openid=f"bench-{run_id}-{index}", credits=args.requests + 10) for index in range(args.users)]
+        db.add_all(users)
+        db.commit()
+        style_id = style.id
+        tokens = [create_access_token(user.id) for user in users]
+    finally:
+        db.close()
+
+    image_base64 = make_source_image(args.source_size)
+    counts = install_query_counter(engine)
+
+    await app_main.startup_event()
+    transport = httpx.ASGITransport(app=app_main.app)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    submitted_at: Dict[int, float] = {}
+    finished_at: Dict[int, float] = {}
+    final_status: Dict[int, str] = {}
+    create_latencies: List[float] = []
+    rejected: Dict[int, int] = {}
+
+    async def submit(index: int, client: httpx.AsyncClient):
+        async with semaphore:
+            started = time.monotonic()
+            response = await client.post(
+                f"{settings.API_STR}/artworks",
+                json={"style_id": style_id, "image_base64": image_base64},
+                headers={"Authorization": f"Bearer {tokens[index % len(tokens)]}"},
+            )
+            create_latencies.append(time.monotonic() - started)
+            if response.status_code != 200:
+                rejected[response.status_code] = rejected.get(response.status_code, 0) + 1
+                return
+            submitted_at[response.json()["id"]] = started
+
+    async def poll_until_done(deadline: float):
+        _bench_internal.set(True)
+        while time.monotonic() < deadline:
+            pending = [artwork_id for artwork_id in submitted_at if artwork_id not in finished_at]
+            if pending:
+                db = SessionLocal()
+                try:
+                    rows = db.query(Artwork.id, Artwork.status).filter(
+                        Artwork.id.in_(pending),
+                        Artwork.status != ArtworkStatus.PROCESSING.value,
+                    ).all()
+                finally:
+                    db.close()
+                now = time.monotonic()
+                for artwork_id, status in rows:
+                    finished_at[artwork_id] = now
+                    final_status[artwork_id] = status
+            elif submissions_done.is_set():
+                return
+            await asyncio.sleep(args.poll_interval)
+
+    submissions_done = asyncio.Event()
+    rss_before = peak_rss_mb()
+    start = time.monotonic()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            poller = asyncio.create_task(poll_until_done(start + args.timeout))
+            await asyncio.gather(*(submit(index, client) for index in range(args.requests)))
+            submissions_done.set()
+            await poller
+    finally:
+        await app_main.shutdown_event()
+    elapsed = time.monotonic() - start
+
+    completed = [artwork_id for artwork_id, status in final_status.items() if status == ArtworkStatus.COMPLETED.value]
+    failed = [artwork_id for artwork_id, status in final_status.items() if status == ArtworkStatus.FAILED.value]
+    unfinished = len(submitted_at) - len(finished_at)
+    end_to_end = [finished_at[artwork_id] - submitted_at[artwork_id] for artwork_id in completed]
+    round_trips = counts["statements"] + counts["commits"] + counts["rollbacks"]
+
+    print(f"请求数 {args.requests}，并发 {args.concurrency}，worker并发 {args.workers}，用户数 {args.users}")
+    print(f"接受 {len(submitted_at)}，拒绝 {sum(rejected.values())} {rejected or ''}")
+    print(f"完成 {len(completed)}，失败 {len(failed)}，超时未结束 {unfinished}")
+    print(f"总耗时 {elapsed:.2f}s，吞吐量 {len(completed) / elapsed:.2f} 个/秒")
+    print(f"创建接口延迟: {format_percentiles(create_latencies)}")
+    print(f"端到端延迟:   {format_percentiles(end_to_end)}")
+    print(
+        f"数据库往返: {round_trips}（SQL {counts['statements']}，提交 {counts['commits']}，回滚 {counts['rollbacks']}），"
+        f"每个作品 {round_trips / max(len(submitted_at), 1):.1f}"
+    )
+    print(f"峰值RSS: {peak_rss_mb():.1f}MB（开始前 {rss_before:.1f}MB）")
+    print(f"内存存储: {memory_storage.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成流水线端到端基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="创建作品的请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的创建请求数")
+    parser.add_argument("--users", type=int, default=20, help="测试用户数（请求轮流使用）")
+    parser.add_argument("--workers", type=int, default=4, help="生成任务worker并发数（GENERATION_WORKER_CONCURRENCY）")
+    parser.add_argument("--source-size", type=int, default=512, help="原图边长（像素）")
+    parser.add_argument("--result-size", default="1024x1024", help="模拟上游返回的结果图尺寸")
+    parser.add_argument("--watermark", action="store_true", help="开启结果图水印")
+    parser.add_argument("--timeout", type=float, default=600.0, help="等待所有作品结束的最长秒数")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="轮询作品状态的间隔秒数")
+    parser.add_argument("--upstream-url", default=None, help="使用已启动的模拟上游（包含路径前缀，如 http://127.0.0.1:18900/v1）")
+    parser.add_argument("--upstream-port", type=int, default=18900)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    os.chdir(ROOT_DIR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+结果图片转存（AI结果URL -> COS）的内存占用基准测试
+
+对比两种方式在并发任务下的进程峰值RSS：
+- old: 整张下载 -> Pillow校验 -> base64编码 -> upload_base64_image（解码 -> BytesIO）
+- new: 流式下载 -> 文件头校验 -> FileStorageService.upload_stream
+
+本地HTTP服务提供测试图片；COS客户端替换为按块读取并丢弃数据的实现，只衡量本进程的内存占用。
+每种方式在独立的子进程中运行，峰值RSS取自 resource.getrusage。
+
+运行方式：
+python -m scripts.bench_result_transfer
+python -m scripts.bench_result_transfer --size-mb 8 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+
+class DiscardingCosClient:
+    """按块读取上传内容并丢弃，模拟SDK发送请求体的行为"""
+
+    @staticmethod
+    def _drain(body):
+        if isinstance(body, (bytes, bytearray)):
+            return
+        while body.read(64 * 1024):
+            pass
+
+    def put_object(self, Bucket, Body, Key, **kwargs):
+        self._drain(Body)
+        return {"ETag": '"put"'}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {"UploadId": "bench"}
+
+    def upload_part(self, Bucket, Key, Body, PartNumber, UploadId, **kwargs):
+        self._drain(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload={}, **kwargs):
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        return {}
+
+
+def peak_rss_mb() -> float:
+    # Linux下ru_maxrss单位为KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def transfer_old(client, url: str):
+    from PIL import Image
+    from app.services.file_storage import FileStorageService
+
+    response = await client.get(url)
+    response.raise_for_status()
+    image_bytes = await response.aread()
+    Image.open(io.BytesIO(image_bytes)).verify()
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    success, result = await FileStorageService.upload_base64_image(image_base64, folder="result_images")
+    assert success, result
+
+
+async def transfer_new(client, url: str):
+    from app.services.file_storage import FileStorageService
+    from utils.image_probe import SNIFF_BYTES, sniff_image_format, image_file_info
+
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        chunks = response.aiter_bytes()
+        header = b""
+        while len(header) < SNIFF_BYTES:
+            try:
+                header += await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+        image_format = sniff_image_format(header)
+        assert image_format is not None
+
+        async def image_chunks():
+            yield header
+            async for chunk in chunks:
+                yield chunk
+
+        file_ext, content_type = image_file_info(image_format)
+        success, result = await FileStorageService.upload_stream(
+            image_chunks(), folder="result_images", file_ext=file_ext, content_type=content_type
+        )
+        assert success, result
+
+
+def run_worker(mode: str, url: str, concurrency: int, rounds: int):
+    """子进程：执行指定方式的并发转存并输出峰值RSS"""
+    import httpx
+    from app.services.file_storage import FileStorageService
+
+    FileStorageService.get_cos_client = staticmethod(lambda: DiscardingCosClient())
+    transfer = transfer_old if mode == "old" else transfer_new
+
+    async def main():
+        async with httpx.AsyncClient(timeout=60) as client:
+            # 预热一次，排除导入和连接建立带来的内存增长
+            await transfer(client, url)
+            baseline = peak_rss_mb()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                await asyncio.gather(*(transfer(client, url) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        return baseline, peak_rss_mb(), elapsed
+
+    baseline, peak, elapsed = asyncio.run(main())
+    print(f"{baseline:.1f} {peak:.1f} {elapsed:.3f}")
+
+
+def make_test_image(path: str, size_mb: float):
+    """生成接近指定大小的JPEG图片（噪声图难以压缩）"""
+    from PIL import Image
+
+    side = int((size_mb * 1024 * 1024 / 0.95) ** 0.5)
+    Image.effect_noise((side, side), 64).convert("RGB").save(path, "JPEG", quality=95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结果图片转存内存占用基准测试")
+    parser.add_argument("--size-mb", type=float, default=6.0, help="测试图片大小（MB，近似值）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发任务数")
+    parser.add_argument("--rounds", type=int, default=2, help="并发轮数")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--worker", choices=["old", "new"], help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.url, args.concurrency, args.rounds)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, "result.jpg")
+        make_test_image(image_path, args.size_mb)
+        image_mb = os.path.getsize(image_path) / 1024 / 1024
+        url = f"http://127.0.0.1:{args.port}/result.jpg"
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "http.server", str(args.port), "--bind", "127.0.0.1", "--directory", tmp_dir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            time.sleep(1)
+            print(f"图片大小 {image_mb:.2f}MB，并发 {args.concurrency}，轮数 {args.rounds}")
+            print(f"{'方式':<6} {'基线RSS(MB)':>12} {'峰值RSS(MB)':>12} {'每任务增量(MB)':>16} {'耗时(s)':>10}")
+            for mode in ("old", "new"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "scripts.bench_result_transfer", "--worker", mode, "--url", url,
+                     "--concurrency", str(args.concurrency), "--rounds", str(args.rounds)],
+                    cwd=str(ROOT_DIR), capture_output=True, text=True, check=True,
+                ).stdout.strip().splitlines()[-1]
+                baseline, peak, elapsed = (float(value) for value in output.split())
+                per_job = (peak - baseline) / args.concurrency
+                print(f"{mode:<6} {baseline:>12.1f} {peak:>12.1f} {per_job:>16.2f} {elapsed:>10.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
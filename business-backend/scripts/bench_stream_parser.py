@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+AI生成SSE流解析器的基准测试脚本
+
+对比旧的全量重扫方式与增量解析器在不同流长度下的耗时，验证增量解析为线性复杂度。
+解析结果的正确性由 tests/test_generation_stream_parser.py 中录制的上游响应校验。
+
+运行方式：
+python -m scripts.bench_stream_parser
+python -m scripts.bench_stream_parser --sizes 500,1000,2000,4000,8000
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from app.services.generation_stream_parser import GenerationStreamParser
+
+
+def to_sse_lines(deltas):
+    """将增量内容包装为上游的SSE数据行"""
+    lines = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": delta}}]}, ensure_ascii=False)
+        for delta in deltas
+    ]
+    lines.append("data: [DONE]")
+    return lines
+
+
+def run_parser(lines):
+    parser = GenerationStreamParser()
+    events = []
+    for line in lines:
+        events.extend(parser.feed_sse_line(line))
+        if parser.done or parser.failed:
+            break
+    if not parser.done:
+        events.extend(parser.finish())
+    return parser, events
+
+
+# 旧实现：每个分片都对累积的完整内容重新执行正则
+OLD_PROGRESS_PATTERN = re.compile(r"进度：\s*(\d{1,3}(?:\.\d+)?)\s*%")
+OLD_URL_PATTERN = re.compile(r"(?:点击)?下载\s*(https?://\S+?)\s*|!\[.*?\]\((https?://\S+?)\)")
+OLD_FAILURE_PATTERN = re.compile(r">\s*生成失败\s*❌\s*(?:\n?>\s*失败原因：\s*(.*))?", re.MULTILINE)
+OLD_JSON_BLOCK_PATTERN = re.compile(r"```json\n.*?\n```", re.DOTALL)
+
+
+def run_old(lines):
+    full_response_content = ""
+    for line in lines:
+        json_str = line[len("data: "):].strip()
+        if json_str == "[DONE]":
+            break
+        content = json.loads(json_str)["choices"][0]["delta"].get("content")
+        if not content:
+            continue
+        full_response_content += content
+        content_for_status_check = OLD_JSON_BLOCK_PATTERN.sub("", full_response_content)
+        if OLD_FAILURE_PATTERN.search(full_response_content):
+            break
+        list(OLD_PROGRESS_PATTERN.finditer(content_for_status_check))
+        OLD_URL_PATTERN.search(full_response_content)
+
+
+def build_stream(chunks: int):
+    """构造一个包含chunks个进度分片的长流"""
+    deltas = ["```json\n", '{"prompt": "油画风格"}\n', "```\n", "> 🕐 排队中...\n", "> ⚡ 生成中...\n"]
+    for i in range(chunks):
+        deltas.append(f"> 🏃‍ 进度：{min(i * 100 // chunks, 99)}%\n")
+    deltas.append("> ✅ 生成完成\n![image](https://example.com/result.png)\n")
+    return to_sse_lines(deltas)
+
+
+def timed(func, lines, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(lines)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_benchmark(sizes, repeat: int):
+    print(f"\n{'分片数':>8} {'旧实现(ms)':>12} {'增量解析(ms)':>14} {'增量每分片(us)':>16}")
+    for size in sizes:
+        lines = build_stream(size)
+        old_ms = timed(run_old, lines, repeat)
+        new_ms = timed(run_parser, lines, repeat)
+        print(f"{size:>8} {old_ms:>12.2f} {new_ms:>14.2f} {new_ms * 1000 / size:>16.2f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="AI生成SSE流解析器基准测试")
+    arg_parser.add_argument("--sizes", default="250,500,1000,2000,4000", help="流的分片数，逗号分隔")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="每个规模重复次数（取最快一次）")
+    args = arg_parser.parse_args()
+
+    run_benchmark([int(size) for size in args.sizes.split(",")], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
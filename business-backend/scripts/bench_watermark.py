@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+结果图水印的基准测试
+
+对比旧实现（每次从磁盘读取水印、默认滤镜缩放、透明水印时合成整张RGBA图层）
+与 utils.image_ops.apply_watermark（水印缓存、只合成右下角区域）在1K/2K/4K结果图上的单张耗时。
+同时给出单独解码+编码的耗时，作为添加水印的下限参考。
+
+运行方式：
+python -m scripts.bench_watermark
+python -m scripts.bench_watermark --sizes 1024,2048,4096 --repeat 5 --quality 85
+"""
+
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from PIL import Image
+
+from utils import image_ops
+
+DEFAULT_WATERMARK = ROOT_DIR / "app" / "static" / "watermark.jpg"
+
+
+def legacy_apply_watermark(image_data: bytes, watermark_path: str) -> bytes:
+    """旧实现"""
+    img = Image.open(io.BytesIO(image_data))
+    image_format = img.format or "JPEG"
+    watermark = Image.open(watermark_path)
+
+    watermark_width = img.width // 5
+    watermark_height = int(watermark.height * watermark_width / watermark.width)
+    watermark = watermark.resize((watermark_width, watermark_height))
+    position = (img.width - watermark_width - 10, img.height - watermark_height - 10)
+
+    if watermark.mode == "RGBA":
+        original_mode = img.mode
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        transparent = Image.new("RGBA", img.size, (0, 0, 0, 0))
+        transparent.paste(watermark, position, watermark)
+        result = Image.alpha_composite(img, transparent)
+        if original_mode != "RGBA":
+            result = result.convert(original_mode)
+    else:
+        result = img.copy()
+        result.paste(watermark, position)
+
+    buffered = io.BytesIO()
+    result.save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def decode_encode(image_data: bytes, quality: int) -> bytes:
+    """只解码再编码，不添加水印"""
+    img = Image.open(io.BytesIO(image_data))
+    image_format = img.format or "JPEG"
+    buffered = io.BytesIO()
+    img.save(buffered, format=image_format, quality=quality)
+    return buffered.getvalue()
+
+
+def make_result_image(size: int) -> bytes:
+    """生成测试结果图（带渐变的噪声JPEG，压缩后的大小接近真实图片）"""
+    noise = Image.effect_noise((size, size), 32).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_transparent_watermark(path: str):
+    """从默认水印生成带透明通道的PNG水印"""
+    with Image.open(DEFAULT_WATERMARK) as source:
+        watermark = source.convert("RGBA")
+    watermark.putalpha(160)
+    watermark.save(path, "PNG")
+
+
+def timed(func, repeat: int, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_benchmark(sizes, repeat: int, quality: int, watermarks):
+    for name, watermark_path in watermarks:
+        print(f"\n水印: {name}")
+        print(f"{'尺寸':>6} {'原图(KB)':>10} {'解码+编码(ms)':>14} {'旧实现(ms)':>12} {'新实现(ms)':>12} {'输出(KB)':>10}")
+        for size in sizes:
+            image_data = make_result_image(size)
+            # 预热：新实现首次调用会加载并缓存水印
+            output = image_ops.apply_watermark(image_data, watermark_path, quality)
+            baseline_ms = timed(decode_encode, repeat, image_data, quality)
+            legacy_ms = timed(legacy_apply_watermark, repeat, image_data, watermark_path)
+            new_ms = timed(image_ops.apply_watermark, repeat, image_data, watermark_path, quality)
+            print(
+                f"{size:>6} {len(image_data) / 1024:>10.0f} {baseline_ms:>14.1f} "
+                f"{legacy_ms:>12.1f} {new_ms:>12.1f} {len(output) / 1024:>10.0f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结果图水印基准测试")
+    parser.add_argument("--sizes", default="1024,2048,4096", help="结果图边长，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每个尺寸重复次数（取最快一次）")
+    parser.add_argument("--quality", type=int, default=75, help="新实现的编码质量（WATERMARK_QUALITY）")
+    parser.add_argument("--watermark", default=str(DEFAULT_WATERMARK), help="水印图片路径")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        transparent_path = str(Path(tmp_dir) / "watermark.png")
+        make_transparent_watermark(transparent_path)
+        run_benchmark(sizes, args.repeat, args.quality, [
+            (Path(args.watermark).name, args.watermark),
+            ("透明PNG", transparent_path),
+        ])
+
+
+if __name__ == "__main__":
+    main()
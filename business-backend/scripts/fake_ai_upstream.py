@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+本地模拟的AI上游服务，用于在不调用付费接口的情况下压测生成流水线
+
+实现与 ArtworkService._request_generation_stream 相同的协议：
+POST {upstream_url}/chat/completions，返回 text/event-stream，每行 data: {"choices": [{"delta": {"content": ...}}]}，
+以 data: [DONE] 结束。内容为AI中转服务的Markdown格式（排队中、生成中、进度、生成完成/失败、结果图片链接），
+结果图片由本服务托管（GET /images/result.{ext}）。
+
+录制的响应：
+--transcripts 指定目录或文件，支持两种格式：
+- *.sse：从真实上游录制的原始SSE行（data: ...），结果图片链接会替换为本服务托管的图片
+- *.json：delta内容字符串数组
+未指定时使用内置的成功和失败响应。
+
+故障注入（概率为0-1）：
+--http-error-rate 返回502，--rate-limit-rate 返回429（带Retry-After），
+--stall-rate 返回响应头后停顿 --stall-seconds 秒，--failure-rate 返回上游生成失败的响应，
+--truncate-rate 在结果图片链接之前断开连接。
+也可以通过路径强制指定行为，便于配置多个表现不同的上游：
+/ok、/error、/ratelimit、/stall、/fail、/truncate 前缀，例如 http://127.0.0.1:18900/stall/chat/completions；
+其他前缀（如 /v1）按概率注入故障。
+
+运行方式：
+python scripts/fake_ai_upstream.py --port 18900
+python scripts/fake_ai_upstream.py --port 18900 --chunk-delay 0.5 --stall-rate 0.1 --transcripts recordings/
+
+对应的系统配置：
+AI_UPSTREAMS=[{"name": "fake", "url": "http://127.0.0.1:18900/v1", "api_key": "test"}]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# 录制响应中的图片链接
+IMAGE_URL_PATTERN = re.compile(r"(\]\()https?://[^\s)]+(\))|((?:点击)?下载\s*)https?://\S+")
+
+# 结果图片链接的占位符（内置和JSON格式的响应中使用）
+RESULT_URL_PLACEHOLDER = "{result_url}"
+
+SUCCESS_TRANSCRIPT = [
+    "```json\n", '{"prompt": "风格转换", "ratio": "1:1"}\n', "```\n\n",
+    "> 🕐 排队中", "...\n\n",
+    "> ⚡ 生成中", "...\n\n",
+    "> 🏃‍ 进度：", "12", "%\n", "> 🏃‍ 进度：37%\n", "> 🏃‍ 进度：64%\n", "> 🏃‍ 进度：91%\n",
+    "> ✅ 生成完成\n\n",
+    f"![image]({RESULT_URL_PLACEHOLDER})\n\n",
+    f"[点击下载]({RESULT_URL_PLACEHOLDER})\n",
+]
+
+FAILURE_TRANSCRIPT = [
+    "> 🕐 排队中...\n\n", "> ⚡ 生成中...\n\n", "> 🏃‍ 进度：5%\n",
+    "> 生成失败 ❌\n", "> 失败原因：", "图片内容违反使用政策\n",
+]
+
+# 通过路径前缀强制指定的行为
+FORCED_MODES = {"ok", "error", "ratelimit", "stall", "fail", "truncate"}
+
+
+@dataclass
+class UpstreamConfig:
+    first_token_delay: float = 1.0
+    chunk_delay: float = 0.2
+    jitter: float = 0.2
+    http_error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 90.0
+    failure_rate: float = 0.0
+    truncate_rate: float = 0.0
+    image_width: int = 1024
+    image_height: int = 1024
+    image_format: str = "jpeg"
+    public_url: Optional[str] = None
+    transcripts: List[List[str]] = field(default_factory=list)
+
+
+def load_transcripts(path: str) -> List[List[str]]:
+    """读取录制的响应（目录下的 *.sse / *.json 文件，或单个文件）"""
+    source = Path(path)
+    files = sorted(source.glob("*")) if source.is_dir() else [source]
+    transcripts = []
+    for file in files:
+        if file.suffix == ".json":
+            deltas = json.loads(file.read_text(encoding="utf-8"))
+        elif file.suffix == ".sse":
+            deltas = []
+            for line in file.read_text(encoding="utf-8").splitlines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                content = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content")
+                if content:
+                    deltas.append(content)
+        else:
+            continue
+        # 录制的图片链接指向真实上游，替换为本服务托管的图片
+        deltas = [
+            IMAGE_URL_PATTERN.sub(
+                lambda m: f"{m.group(1)}{RESULT_URL_PLACEHOLDER}{m.group(2)}" if m.group(1) else f"{m.group(3)}{RESULT_URL_PLACEHOLDER}",
+                delta
+            )
+            for delta in deltas
+        ]
+        if deltas:
+            transcripts.append(deltas)
+    return transcripts
+
+
+def render_image(width: int, height: int, image_format: str) -> bytes:
+    """生成结果图片：随机噪声，压缩后的大小接近真实照片"""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG" if image_format == "jpeg" else image_format.upper(), quality=85)
+    return buffer.getvalue()
+
+
+def create_app(config: UpstreamConfig) -> FastAPI:
+    app = FastAPI(title="Fake AI upstream")
+    transcripts = config.transcripts or [SUCCESS_TRANSCRIPT]
+    file_ext = "jpg" if config.image_format == "jpeg" else config.image_format
+    image_bytes = render_image(config.image_width, config.image_height, config.image_format)
+    stats: Dict[str, int] = {
+        "requests": 0, "in_flight": 0, "completed": 0, "http_errors": 0, "rate_limited": 0,
+        "stalled": 0, "failed": 0, "truncated": 0, "image_downloads": 0,
+    }
+
+    def pick_mode(prefix: str) -> str:
+        if prefix in FORCED_MODES:
+            return prefix
+        roll = random.random()
+        for mode, rate in (
+            ("error", config.http_error_rate),
+            ("ratelimit", config.rate_limit_rate),
+            ("stall", config.stall_rate),
+            ("fail", config.failure_rate),
+            ("truncate", config.truncate_rate),
+        ):
+            if roll < rate:
+                return mode
+            roll -= rate
+        return "ok"
+
+    def delay(seconds: float) -> float:
+        return max(seconds * (1 + random.uniform(-config.jitter, config.jitter)), 0.0)
+
+    def sse_line(content: str) -> str:
+        return "data: " + json.dumps({"choices": [{"delta": {"content": content}}]}, ensure_ascii=False) + "\n\n"
+
+    async def handle(request: Request, prefix: str):
+        payload = await request.json()
+        if not payload.get("stream") or not payload.get("messages"):
+            return JSONResponse({"error": "stream and messages are required"}, status_code=400)
+
+        stats["requests"] += 1
+        mode = pick_mode(prefix)
+        if mode == "error":
+            stats["http_errors"] += 1
+            return Response("upstream error (injected)", status_code=502)
+        if mode == "ratelimit":
+            stats["rate_limited"] += 1
+            return Response("rate limited (injected)", status_code=429, headers={"Retry-After": "5"})
+
+        base_url = config.public_url or str(request.base_url).rstrip("/")
+        result_url = f"{base_url}/images/result.{file_ext}?t={time.time_ns()}"
+        deltas = FAILURE_TRANSCRIPT if mode == "fail" else random.choice(transcripts)
+        deltas = [delta.replace(RESULT_URL_PLACEHOLDER, result_url) for delta in deltas]
+        if mode == "truncate":
+            # 在第一条包含结果链接的内容之前断开
+            cut = next((i for i, delta in enumerate(deltas) if result_url in delta), len(deltas))
+            deltas = deltas[:max(cut, 1)]
+
+        async def stream():
+            stats["in_flight"] += 1
+            try:
+                if mode == "stall":
+                    stats["stalled"] += 1
+                    await asyncio.sleep(config.stall_seconds)
+                else:
+                    await asyncio.sleep(delay(config.first_token_delay))
+                for delta in deltas:
+                    yield sse_line(delta)
+                    await asyncio.sleep(delay(config.chunk_delay))
+                if mode == "truncate":
+                    stats["truncated"] += 1
+                    return
+                yield "data: [DONE]\n\n"
+                stats["failed" if mode == "fail" else "completed"] += 1
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        return await handle(request, "")
+
+    @app.post("/{prefix}/chat/completions")
+    async def prefixed_chat_completions(prefix: str, request: Request):
+        return await handle(request, prefix)
+
+    @app.get("/images/result.{ext}")
+    async def result_image(ext: str):
+        stats["image_downloads"] += 1
+        return Response(image_bytes, media_type=f"image/{config.image_format}")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {**stats, "transcripts": len(transcripts), "image_bytes": len(image_bytes)}
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="本地模拟的AI上游服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18900)
+    parser.add_argument("--public-url", default=None, help="结果图片链接使用的地址，默认取请求的Host")
+    parser.add_argument("--transcripts", default=None, help="录制的响应目录或文件（*.sse / *.json）")
+    parser.add_argument("--first-token-delay", type=float, default=1.0, help="首行数据前的等待秒数")
+    parser.add_argument("--chunk-delay", type=float, default=0.2, help="相邻两行数据的间隔秒数")
+    parser.add_argument("--jitter", type=float, default=0.2, help="等待时间的随机浮动比例")
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=90.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", default="1024x1024", help="结果图片尺寸，如 1024x1024")
+    parser.add_argument("--image-format", default="jpeg", choices=["jpeg", "png", "webp"])
+    return parser.parse_args(argv)
+
+
+def build_config(args: argparse.Namespace) -> UpstreamConfig:
+    width, height = (int(value) for value in args.image_size.lower().split("x"))
+    return UpstreamConfig(
+        first_token_delay=args.first_token_delay,
+        chunk_delay=args.chunk_delay,
+        jitter=args.jitter,
+        http_error_rate=args.http_error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        failure_rate=args.failure_rate,
+        truncate_rate=args.truncate_rate,
+        image_width=width,
+        image_height=height,
+        image_format=args.image_format,
+        public_url=args.public_url,
+        transcripts=load_transcripts(args.transcripts) if args.transcripts else [],
+    )
+
+
+def main():
+    import uvicorn
+
+    args = parse_args()
+    app = create_app(build_config(args))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
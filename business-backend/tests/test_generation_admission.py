@@ -0,0 +1,71 @@
+"""
+生成任务准入控制测试：不连接数据库，用固定的活跃任务数替换统计查询
+"""
+
+import pytest
+
+from app.core.config import settings
+from app.services.generation_queue import GenerationJobService
+
+
+CONFIG = {
+    "GENERATION_MAX_ACTIVE_JOBS_PER_USER": 2,
+    "GENERATION_MAX_ACTIVE_JOBS": 200,
+    "ARTWORK_BATCH_MAX_STYLES": 6,
+}
+
+
+@pytest.fixture
+def active_jobs(monkeypatch):
+    """按用户设置活跃任务数，键None表示全局"""
+    counts = {None: 0}
+
+    def count_active(db, user_id=None):
+        if user_id is None:
+            return counts[None]
+        return counts.get(user_id, 0)
+
+    monkeypatch.setattr(GenerationJobService, "count_active", staticmethod(count_active))
+    monkeypatch.setattr(GenerationJobService, "average_job_seconds", staticmethod(lambda db: 30.0))
+    monkeypatch.setattr(GenerationJobService, "estimate_capacity", staticmethod(lambda db: 4))
+    monkeypatch.setattr(settings, "get_int", lambda key, default=0: CONFIG.get(key, default))
+    return counts
+
+
+def test_batch_from_idle_user_is_admitted(active_jobs):
+    admitted, result = GenerationJobService.check_admission(None, user_id=1, count=3)
+    assert admitted, result
+
+
+def test_full_size_batch_from_idle_user_is_admitted(active_jobs):
+    admitted, result = GenerationJobService.check_admission(None, user_id=1, count=CONFIG["ARTWORK_BATCH_MAX_STYLES"])
+    assert admitted, result
+
+
+def test_batch_from_busy_user_is_rejected_with_retry_after(active_jobs):
+    active_jobs[1] = 1
+    active_jobs[None] = 1
+    admitted, result = GenerationJobService.check_admission(None, user_id=1, count=3)
+    assert not admitted
+    assert result["retry_after"] == 30
+
+
+def test_single_job_within_user_limit_is_admitted(active_jobs):
+    active_jobs[1] = 1
+    active_jobs[None] = 1
+    admitted, result = GenerationJobService.check_admission(None, user_id=1, count=1)
+    assert admitted, result
+
+
+def test_user_at_limit_is_rejected(active_jobs):
+    active_jobs[1] = 2
+    active_jobs[None] = 2
+    admitted, result = GenerationJobService.check_admission(None, user_id=1, count=1)
+    assert not admitted
+
+
+def test_global_limit_counts_every_job_in_batch(active_jobs):
+    active_jobs[None] = 198
+    admitted, result = GenerationJobService.check_admission(None, user_id=1, count=3)
+    assert not admitted
+    assert result["retry_after"] >= 1
@@ -0,0 +1,217 @@
+"""
+GenerationStreamParser 的单元测试：使用录制的上游响应校验解析出的事件
+
+运行方式：
+python -m pytest tests/test_generation_stream_parser.py
+"""
+
+import json
+
+import pytest
+
+from app.services.generation_stream_parser import GenerationStreamParser, StreamEventType, MAX_EVENT_DATA_CHARS
+
+
+# 录制的上游响应内容（按上游实际的增量切分方式）
+TRANSCRIPTS = {
+    "success": [
+        "```json\n", '{\n  "prompt": "油画风格",\n', '  "ratio": "3:4"\n}\n', "```\n\n",
+        "> 🕐 排队中", "...\n\n",
+        "> ⚡ 生成中", "...\n\n",
+        "> 🏃‍ 进度：", "12", "%\n", "> 🏃‍ 进度：37%\n", "> 🏃‍ 进度：", "81.5%\n",
+        "\n> ✅ 生成完成\n\n",
+        "![image](https://filesystem.site/cdn/20250101/abc123.png)\n\n",
+        "[点击下载](https://filesystem.site/cdn/download/20250101/abc123.png)",
+    ],
+    "failure_next_line": [
+        "> 🕐 排队中...\n\n", "> ⚡ 生成中...\n\n", "> 🏃‍ 进度：5%\n",
+        "> 生成失败 ❌\n", "> 失败原因：", "图片内容违反使用政策\n",
+        "> 🏃‍ 进度：90%\n",
+    ],
+    "failure_same_line": [
+        "> ⚡ 生成中...\n\n", "> 生成失败 ❌ 失败原因：上游超时\n",
+    ],
+    "url_only": [
+        "> 🏃‍ 进度：100%\n\n", "下载 https://example.com/result/final.png",
+    ],
+    "unclear": [
+        "> ⚡ 生成中...\n", "Unable to process the request right now\n",
+    ],
+}
+
+# 期望的解析结果：(事件类型序列, 结果URL, 失败原因, 潜在错误)
+EXPECTED = {
+    "success": (
+        ["queued", "generating", "progress", "progress", "progress", "completed", "progress", "result_url"],
+        "https://filesystem.site/cdn/20250101/abc123.png", None, [],
+    ),
+    "failure_next_line": (
+        ["queued", "generating", "progress", "failed"],
+        None, "图片内容违反使用政策", [],
+    ),
+    "failure_same_line": (
+        ["generating", "failed"],
+        None, "上游超时", [],
+    ),
+    "url_only": (
+        ["progress", "result_url"],
+        "https://example.com/result/final.png", None, [],
+    ),
+    "unclear": (
+        ["generating"],
+        None, None, ["Unable to process the request right now"],
+    ),
+}
+
+
+def data_line(content: str) -> str:
+    return "data: " + json.dumps({"choices": [{"delta": {"content": content}}]}, ensure_ascii=False)
+
+
+def to_sse_lines(deltas):
+    """将增量内容包装为上游的SSE数据行（每个事件后跟空行）"""
+    lines = []
+    for delta in deltas:
+        lines.extend([data_line(delta), ""])
+    lines.extend(["data: [DONE]", ""])
+    return lines
+
+
+def run_parser(lines):
+    """与 ArtworkService._request_generation_stream 相同的调用方式"""
+    parser = GenerationStreamParser()
+    events = []
+    for line in lines:
+        events.extend(parser.feed_sse_line(line))
+        if parser.done or parser.failed:
+            break
+    if not parser.done:
+        events.extend(parser.finish())
+    return parser, events
+
+
+def summarize(parser, events):
+    return (
+        [event.type.value for event in events],
+        parser.result_url, parser.failure_reason, parser.potential_errors,
+    )
+
+
+def rechunk(deltas, size: int):
+    """把录制的内容按固定长度重新切分，标记和多字节字符会被切断在不同分片中"""
+    content = "".join(deltas)
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+@pytest.mark.parametrize("name", sorted(TRANSCRIPTS))
+def test_transcript(name):
+    parser, events = run_parser(to_sse_lines(TRANSCRIPTS[name]))
+    assert summarize(parser, events) == EXPECTED[name]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16])
+@pytest.mark.parametrize("name", sorted(TRANSCRIPTS))
+def test_split_chunks(name, size):
+    parser, events = run_parser(to_sse_lines(rechunk(TRANSCRIPTS[name], size)))
+    assert summarize(parser, events) == EXPECTED[name]
+
+
+@pytest.mark.parametrize("name", sorted(TRANSCRIPTS))
+def test_crlf(name):
+    # SSE行以CRLF结尾，内容中的换行也是CRLF
+    deltas = [delta.replace("\n", "\r\n") for delta in TRANSCRIPTS[name]]
+    lines = [line + "\r\n" for line in to_sse_lines(deltas)]
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED[name]
+
+
+def test_multiline_data():
+    lines = []
+    for delta in TRANSCRIPTS["success"]:
+        payload = json.dumps({"choices": [{"delta": {"content": delta}}]}, ensure_ascii=False, indent=1)
+        lines.extend("data: " + part for part in payload.split("\n"))
+        lines.append("")
+    lines.extend(["data: [DONE]", ""])
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED["success"]
+
+
+def test_multiline_data_invalid_json_dropped_at_event_end():
+    parser = GenerationStreamParser()
+    assert parser.feed_sse_line('data: {"choices": [') == []
+    assert parser.feed_sse_line("") == []
+    events = parser.feed_sse_line(data_line("> ⚡ 生成中...\n"))
+    assert [event.type.value for event in events] == ["generating"]
+
+
+@pytest.mark.parametrize("blank_lines", [True, False])
+def test_malformed_line_does_not_poison_stream(blank_lines):
+    # 一行损坏的数据之后，后续事件仍能正常解析
+    lines = ['data: {"choices": [{"delta": {"content": "截断', ""] + to_sse_lines(TRANSCRIPTS["success"])
+    if not blank_lines:
+        lines = [line for line in lines if line]
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED["success"]
+
+
+def test_oversized_event_data_dropped(caplog):
+    # 不以空行结束的超长事件不会无限缓存，之后的事件仍能正常解析
+    lines = ['data: {"choices": ['] + ["data: " + "x" * 1000] * (MAX_EVENT_DATA_CHARS // 1000 + 1)
+    lines += [data_line(delta) for delta in TRANSCRIPTS["url_only"]] + ["data: [DONE]"]
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED["url_only"]
+    assert any(f"超过 {MAX_EVENT_DATA_CHARS} 个字符" in record.message for record in caplog.records)
+
+
+@pytest.mark.parametrize("payload", [
+    "1", "[]", '"text"', "null", '{"choices": null}', '{"choices": [1]}',
+    '{"choices": [{"delta": "x"}]}', '{"choices": [{"delta": {"content": 5}}]}',
+])
+def test_non_object_payloads_ignored(payload):
+    lines = ["data: " + payload, ""] + to_sse_lines(TRANSCRIPTS["url_only"])
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED["url_only"]
+
+
+def test_comments_and_other_fields_ignored():
+    lines = [": keepalive", "event: message", "id: 1", "retry: 3000"]
+    for delta in TRANSCRIPTS["success"]:
+        lines.extend([": ping", data_line(delta), ""])
+    lines.extend(["data: [DONE]", ""])
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED["success"]
+
+
+def test_data_without_space():
+    parser, events = run_parser([line.replace("data: ", "data:", 1) for line in to_sse_lines(TRANSCRIPTS["url_only"])])
+    assert summarize(parser, events) == EXPECTED["url_only"]
+
+
+def test_done_flushes_unterminated_line():
+    parser = GenerationStreamParser()
+    assert parser.feed_sse_line(data_line("下载 https://example.com/a.png")) == []
+    events = parser.feed_sse_line("data: [DONE]")
+    assert parser.done
+    assert [event.type for event in events] == [StreamEventType.RESULT_URL, StreamEventType.PROGRESS]
+    assert parser.result_url == "https://example.com/a.png"
+
+
+def test_content_after_done_not_processed():
+    lines = to_sse_lines(["> ⚡ 生成中...\n"]) + [data_line("> 生成失败 ❌ 失败原因：不应解析\n")]
+    parser, events = run_parser(lines)
+    assert parser.done
+    assert not parser.failed
+    assert [event.type.value for event in events] == ["generating"]
+
+
+def test_stream_without_blank_lines():
+    # 部分上游不在事件之间发送空行
+    lines = [line for line in to_sse_lines(TRANSCRIPTS["success"]) if line]
+    parser, events = run_parser(lines)
+    assert summarize(parser, events) == EXPECTED["success"]
+
+
+def test_progress_never_decreases():
+    parser = GenerationStreamParser()
+    events = parser.feed("> 🏃‍ 进度：50%\n> 🏃‍ 进度：20%\n> 🏃‍ 进度：120%\n")
+    assert [event.value for event in events] == [50, 100]
@@ -0,0 +1,160 @@
+"""
+图片CPU密集型操作
+
+这些函数在图片进程池（app.services.image_pool）的子进程中执行，
+只依赖Pillow和标准库，参数和返回值均为可序列化的基础类型。
+子进程是常驻的，水印等可复用的数据缓存在模块级变量中。
+"""
+import io
+import os
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from PIL import Image
+
+# 每个进程最多缓存的水印缩放尺寸数
+MAX_SCALED_WATERMARKS = 16
+
+# 已解码的水印：路径 -> (文件修改时间, 图片)
+_watermark_sources: Dict[str, Tuple[float, Image.Image]] = {}
+# 缩放后的水印：(路径, 宽度) -> 图片
+_scaled_watermarks: "OrderedDict[Tuple[str, int], Image.Image]" = OrderedDict()
+
+
+def image_size(image_data: bytes) -> Tuple[int, int]:
+    """读取图片宽高（只解析文件头）"""
+    with Image.open(io.BytesIO(image_data)) as img:
+        return img.width, img.height
+
+
+def _load_watermark(watermark_path: str) -> Image.Image:
+    """
+    读取并解码水印图片，按文件修改时间缓存（替换水印文件后自动重新加载）
+    """
+    mtime = os.path.getmtime(watermark_path)
+    cached = _watermark_sources.get(watermark_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with Image.open(watermark_path) as source:
+        source.load()
+        # 统一为RGB或RGBA，合成时不再逐张转换
+        watermark = source.convert("RGBA" if "A" in source.getbands() or "transparency" in source.info else "RGB")
+    _watermark_sources[watermark_path] = (mtime, watermark)
+    # 水印文件变化后，旧的缩放结果全部失效
+    for key in [key for key in _scaled_watermarks if key[0] == watermark_path]:
+        del _scaled_watermarks[key]
+    return watermark
+
+
+def _scaled_watermark(watermark_path: str, width: int) -> Image.Image:
+    """按目标宽度缩放后的水印，最近使用的若干个尺寸缓存在当前进程中"""
+    watermark = _load_watermark(watermark_path)
+    key = (watermark_path, width)
+    scaled = _scaled_watermarks.get(key)
+    if scaled is not None:
+        _scaled_watermarks.move_to_end(key)
+        return scaled
+
+    height = max(int(watermark.height * width / watermark.width), 1)
+    scaled = watermark.resize((width, height), Image.LANCZOS)
+    _scaled_watermarks[key] = scaled
+    if len(_scaled_watermarks) > MAX_SCALED_WATERMARKS:
+        _scaled_watermarks.popitem(last=False)
+    return scaled
+
+
+def apply_watermark(image_data: bytes, watermark_path: str, quality: int = 75) -> bytes:
+    """
+    在图片右下角添加水印，水印宽度为原图宽度的1/5，输出格式与原图一致
+
+    水印只解码一次，缩放结果按宽度缓存；合成只处理右下角水印所在的区域。
+
+    Args:
+        quality: JPEG/WebP 的编码质量
+
+    Returns:
+        添加水印后的图片字节
+    """
+    img = Image.open(io.BytesIO(image_data))
+    image_format = img.format or "JPEG"
+    img.load()
+
+    watermark_width = img.width // 5
+    if watermark_width < 1:
+        return image_data
+    watermark = _scaled_watermark(watermark_path, watermark_width)
+
+    # 计算水印位置（右下角）
+    position = (img.width - watermark.width - 10, img.height - watermark.height - 10)
+
+    if img.mode not in ("RGB", "RGBA", "L"):
+        # 调色板等模式无法直接合成
+        img = img.convert("RGBA" if "transparency" in img.info or "A" in img.getbands() else "RGB")
+    if watermark.mode == "RGBA":
+        if img.mode == "RGBA":
+            # 保留原图的透明度，只在水印区域做alpha合成
+            img.alpha_composite(watermark, dest=position)
+        else:
+            # 不透明的原图按水印的alpha粘贴，等价于alpha合成
+            img.paste(watermark, position, watermark)
+    else:
+        img.paste(watermark, position)
+
+    save_options = {}
+    if image_format in ("JPEG", "WEBP"):
+        save_options["quality"] = quality
+    if image_format == "JPEG" and img.mode == "RGBA":
+        img = img.convert("RGB")
+
+    buffered = io.BytesIO()
+    img.save(buffered, format=image_format, **save_options)
+    return buffered.getvalue()
+
+
+def _flatten_alpha(img: Image.Image) -> Image.Image:
+    """透明背景合成到白底，用于输出JPEG"""
+    if img.mode == "RGB":
+        return img
+    if "A" not in img.getbands():
+        return img.convert("RGB")
+    background = Image.new("RGB", img.size, (255, 255, 255))
+    background.paste(img, (0, 0), img.getchannel("A"))
+    return background
+
+
+def make_variants(image_data: bytes, sizes: Dict[str, int], quality: int = 80) -> Dict[str, Dict[str, bytes]]:
+    """
+    生成按最长边缩放的派生图，每个尺寸输出WebP和JPEG两种格式
+
+    原图只解码一次（JPEG按最大目标尺寸降采样解码），从大到小依次缩放；
+    原图小于目标尺寸时不放大。
+
+    Args:
+        sizes: 名称 -> 最长边像素，如 {"medium": 1080, "thumbnail": 360}
+        quality: 编码质量
+
+    Returns:
+        名称 -> {"webp": 字节, "jpeg": 字节}
+    """
+    img = Image.open(io.BytesIO(image_data))
+    largest = max(sizes.values())
+    # JPEG解码时直接按1/2、1/4、1/8降采样，大图可节省大部分解码时间
+    img.draft("RGB", (largest, largest))
+    img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or "A" in img.getbands() else "RGB")
+
+    variants = {}
+    current = img
+    for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        scaled = current.copy()
+        scaled.thumbnail((size, size), Image.LANCZOS)
+        current = scaled
+
+        webp_buffer = io.BytesIO()
+        scaled.save(webp_buffer, "WEBP", quality=quality, method=4)
+        jpeg_buffer = io.BytesIO()
+        _flatten_alpha(scaled).save(jpeg_buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+        variants[name] = {"webp": webp_buffer.getvalue(), "jpeg": jpeg_buffer.getvalue()}
+    return variants
@@ -0,0 +1,188 @@
+"""
+图片文件头探测工具
+
+只根据文件开头的若干字节识别图片格式和尺寸，不需要下载或解码整张图片
+"""
+import asyncio
+import io
+import logging
+import struct
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 识别格式所需的文件头长度
+SNIFF_BYTES = 32
+
+# 读取尺寸时默认请求的字节数（JPEG的SOF段通常位于EXIF之后，64KB可覆盖绝大多数图片）
+PROBE_BYTES = 64 * 1024
+
+# 格式 -> (文件扩展名, Content-Type)
+IMAGE_FORMATS = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "png": ("png", "image/png"),
+    "webp": ("webp", "image/webp"),
+    "gif": ("gif", "image/gif"),
+}
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """
+    根据文件头识别图片格式
+
+    Args:
+        header: 文件开头的字节（至少12字节，建议 SNIFF_BYTES 字节）
+
+    Returns:
+        jpeg / png / webp / gif，无法识别时返回None
+    """
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if len(header) >= 12 and header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+
+def image_file_info(image_format: Optional[str]) -> Tuple[str, str]:
+    """
+    获取图片格式对应的文件扩展名和Content-Type，未知格式按jpg处理
+    """
+    return IMAGE_FORMATS.get(image_format or "", IMAGE_FORMATS["jpeg"])
+
+
+# JPEG中携带图片尺寸的SOF标记（排除DHT/JPG/DAC）
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    offset = 2
+    length = len(data)
+    while offset + 4 <= length:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        # 填充字节
+        if marker == 0xFF:
+            offset += 1
+            continue
+        # 无长度字段的标记
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        segment_length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > length:
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        if marker == 0xDA:  # 扫描数据开始，之后不会再有SOF
+            return None
+        offset += 2 + segment_length
+    return None
+
+
+def _png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def _webp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        # 有损格式：帧头起始码之后为14位宽高
+        if data[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        # 无损格式：签名字节之后为14位宽-1、14位高-1
+        if data[20] != 0x2F:
+            return None
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        # 扩展格式：24位画布宽-1、高-1
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def parse_image_size(header: bytes) -> Optional[Tuple[int, int]]:
+    """
+    从文件开头的字节中解析图片宽高，支持JPEG、PNG、WebP
+
+    Returns:
+        (宽, 高)，数据不足或格式不支持时返回None
+    """
+    image_format = sniff_image_format(header)
+    try:
+        if image_format == "jpeg":
+            return _jpeg_size(header)
+        if image_format == "png":
+            return _png_size(header)
+        if image_format == "webp":
+            return _webp_size(header)
+    except (struct.error, IndexError):
+        return None
+    return None
+
+
+def image_size_from_bytes(image_data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    获取完整图片数据的宽高，优先解析文件头，不支持的格式交给Pillow（只读取文件头，不解码像素）
+    """
+    size = parse_image_size(image_data[:PROBE_BYTES])
+    if size:
+        return size
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_data)) as img:
+            return img.width, img.height
+    except Exception as e:
+        logger.warning(f"无法识别图片尺寸: {e}")
+        return None
+
+
+async def fetch_image_size(client, url: str, probe_bytes: int = PROBE_BYTES) -> Optional[Tuple[int, int]]:
+    """
+    获取远程图片的宽高
+
+    先使用Range请求只读取文件开头的 probe_bytes 字节（服务端不支持Range时读够即断开），
+    无法从文件头解析时再完整下载。交给Pillow识别的部分在线程池中执行，不阻塞事件循环。
+
+    Args:
+        client: httpx.AsyncClient
+        url: 图片URL
+        probe_bytes: 读取的文件头字节数
+
+    Returns:
+        (宽, 高)，无法识别时返回None
+    """
+    header = bytearray()
+    async with client.stream("GET", url, headers={"Range": f"bytes=0-{probe_bytes - 1}"}) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            header += chunk
+            if len(header) >= probe_bytes:
+                break
+    # 读取的内容不足 probe_bytes 说明已是完整文件
+    complete = len(header) < probe_bytes
+    size = parse_image_size(bytes(header))
+    if size:
+        return size
+    loop = asyncio.get_running_loop()
+    if complete:
+        return await loop.run_in_executor(None, image_size_from_bytes, bytes(header))
+
+    logger.info(f"无法从文件头解析图片尺寸，完整下载: {url}")
+    response = await client.get(url)
+    response.raise_for_status()
+    return await loop.run_in_executor(None, image_size_from_bytes, response.content)
@@ -0,0 +1,85 @@
+"""
+multipart/form-data 请求体的流式解析
+
+只取出指定文件字段的内容，按收到的顺序逐块产出，不在内存或临时文件中缓存整个文件
+"""
+from typing import AsyncIterator, Dict, List
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+async def iter_multipart_file(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    field_name: str = "file"
+) -> AsyncIterator[bytes]:
+    """
+    从multipart请求体中流式读取文件字段（只读取第一个同名字段，之后的内容不再解析）
+
+    Raises:
+        ValueError: 不是有效的multipart请求体或缺少文件字段
+    """
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("缺少multipart boundary")
+
+    target = field_name.encode("utf-8")
+    pending: List[bytes] = []
+    headers: Dict[bytes, bytes] = {}
+    state = {"field": b"", "value": b"", "in_file": False, "found": False, "done": False}
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        headers[state["field"].lower()] = state["value"]
+        state["field"] = b""
+        state["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        if not state["found"] and options.get(b"name") == target:
+            state["in_file"] = True
+            state["found"] = True
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["in_file"]:
+            pending.append(bytes(data[start:end]))
+
+    def on_part_end():
+        if state["in_file"]:
+            state["in_file"] = False
+            state["done"] = True
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    async for chunk in chunks:
+        parser.write(chunk)
+        if pending:
+            data = b"".join(pending)
+            pending.clear()
+            yield data
+        if state["done"]:
+            return
+
+    parser.finalize()
+    if not state["found"]:
+        raise ValueError(f"缺少文件字段 {field_name}")
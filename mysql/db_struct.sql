@@ -56,7 +56,14 @@ CREATE TABLE `artworks` (
   `user_id` bigint NOT NULL COMMENT '创建用户ID',
   `style_id` bigint NOT NULL COMMENT '使用的风格ID',
   `source_image_url` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '原图URL',
+  `source_width` int DEFAULT NULL COMMENT '原图宽度（像素）',
+  `source_height` int DEFAULT NULL COMMENT '原图高度（像素）',
+  `source_hash` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT '原图内容MD5（用于结果缓存）',
   `result_image_url` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci COMMENT '结果图URL',
+  `thumbnail_url` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci COMMENT '缩略图URL（JPEG）',
+  `thumbnail_webp_url` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci COMMENT '缩略图URL（WebP）',
+  `medium_url` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci COMMENT '中等尺寸图URL（JPEG）',
+  `medium_webp_url` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci COMMENT '中等尺寸图URL（WebP）',
   `status` enum('processing','completed','failed') CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT 'processing' COMMENT '处理状态',
   `is_public` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否公开：0-私密，1-公开',
   `public_scope` enum('result_only','all') CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci DEFAULT 'result_only' COMMENT '公开范围: result_only-仅结果图, all-全部',
@@ -65,6 +72,7 @@ CREATE TABLE `artworks` (
   `error_message` text CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci COMMENT '错误信息（如有）',
   `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否删除：0-否，1-是',
   `progress` int NOT NULL DEFAULT '0' COMMENT '作品处理进度',
+  `refunded_at` datetime DEFAULT NULL COMMENT '退还积分的时间，为空表示未退还',
   `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
   `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
   PRIMARY KEY (`id`),
@@ -73,6 +81,7 @@ CREATE TABLE `artworks` (
   KEY `idx_is_public` (`is_public`),
   KEY `idx_status` (`status`),
   KEY `idx_created_at` (`created_at`),
+  KEY `idx_status_updated_at` (`status`,`updated_at`),
   CONSTRAINT `artworks_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
   CONSTRAINT `artworks_ibfk_2` FOREIGN KEY (`style_id`) REFERENCES `styles` (`id`) ON DELETE RESTRICT
 ) ENGINE=InnoDB AUTO_INCREMENT=113 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='作品表';
@@ -196,6 +205,9 @@ CREATE TABLE `styles` (
   `credits_cost` int NOT NULL DEFAULT '10' COMMENT '使用所需积分',
   `is_active` tinyint(1) NOT NULL DEFAULT '1' COMMENT '是否启用：0-禁用，1-启用',
   `sort_order` int NOT NULL DEFAULT '0' COMMENT '排序值',
+  `cache_enabled` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否复用相同原图的生成结果',
+  `cache_ttl_hours` int DEFAULT NULL COMMENT '结果缓存有效小时数，为空时使用全局配置',
+  `hedge_enabled` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否对该风格的任务启用对冲请求',
   `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否删除：0-否，1-是',
   `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
   `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
@@ -295,6 +307,75 @@ CREATE TABLE `orders` (
   CONSTRAINT `orders_ibfk_2` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='订单表';
 
+CREATE TABLE `generation_jobs` (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '任务ID',
+  `artwork_id` bigint NOT NULL COMMENT '作品ID',
+  `user_id` bigint NOT NULL COMMENT '用户ID（冗余字段，用于按用户统计并发）',
+  `status` enum('pending','running','completed','failed') NOT NULL DEFAULT 'pending' COMMENT '任务状态',
+  `lane` varchar(20) NOT NULL DEFAULT 'normal' COMMENT '调度通道：paid-付费，normal-普通，bulk-批量/重新生成',
+  `aspect_ratio` varchar(20) DEFAULT NULL COMMENT '原图宽高比',
+  `attempts` int NOT NULL DEFAULT '0' COMMENT '已执行次数',
+  `max_attempts` int NOT NULL DEFAULT '3' COMMENT '最大执行次数',
+  `available_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '最早可领取时间（用于退避重试）',
+  `locked_by` varchar(100) DEFAULT NULL COMMENT '领取任务的worker标识',
+  `locked_at` datetime DEFAULT NULL COMMENT '租约起点（领取时设置，执行中的worker定期续期）',
+  `started_at` datetime DEFAULT NULL COMMENT '本次执行的开始时间（用于统计任务耗时）',
+  `finished_at` datetime DEFAULT NULL COMMENT '结束时间',
+  `last_error` text COMMENT '最近一次错误信息',
+  `cancel_requested` tinyint(1) NOT NULL DEFAULT '0' COMMENT '用户是否已取消（执行中的worker轮询该字段停止生成）',
+  `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否删除：0-否，1-是',
+  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_artwork_id` (`artwork_id`),
+  KEY `idx_status_available_at` (`status`,`available_at`),
+  KEY `idx_user_id_status` (`user_id`,`status`),
+  KEY `idx_status_lane_available_at` (`status`,`lane`,`available_at`),
+  CONSTRAINT `generation_jobs_ibfk_1` FOREIGN KEY (`artwork_id`) REFERENCES `artworks` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='作品生成任务表';
+
+CREATE TABLE `result_cache` (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '缓存ID',
+  `source_hash` varchar(32) NOT NULL COMMENT '原图内容MD5',
+  `style_id` bigint NOT NULL COMMENT '风格ID',
+  `style_version` varchar(32) NOT NULL COMMENT '风格版本（提示词和参考图的摘要）',
+  `result_image_url` text NOT NULL COMMENT '结果图URL',
+  `artwork_id` bigint DEFAULT NULL COMMENT '生成该结果的作品ID',
+  `hit_count` int NOT NULL DEFAULT '0' COMMENT '命中次数',
+  `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否删除：0-否，1-是',
+  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_source_style_version` (`source_hash`,`style_id`,`style_version`),
+  KEY `idx_created_at` (`created_at`),
+  CONSTRAINT `result_cache_ibfk_1` FOREIGN KEY (`style_id`) REFERENCES `styles` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='生成结果缓存表';
+
+CREATE TABLE `artwork_timings` (
+  `id` int NOT NULL AUTO_INCREMENT COMMENT '记录ID',
+  `artwork_id` bigint NOT NULL COMMENT '作品ID',
+  `style_id` bigint NOT NULL COMMENT '风格ID',
+  `upstream` varchar(50) DEFAULT NULL COMMENT '返回结果的AI上游',
+  `status` varchar(20) DEFAULT NULL COMMENT '记录时的作品状态，cached表示复用了缓存结果',
+  `attempts` int NOT NULL DEFAULT '0' COMMENT '生成任务执行次数',
+  `source_upload_ms` int DEFAULT NULL COMMENT '原图上传耗时（毫秒）',
+  `queue_wait_ms` int DEFAULT NULL COMMENT '从入队到首次被领取的耗时（毫秒）',
+  `upstream_connect_ms` int DEFAULT NULL COMMENT 'AI上游返回响应头的耗时（毫秒）',
+  `first_token_ms` int DEFAULT NULL COMMENT 'AI上游返回首行数据的耗时（毫秒）',
+  `stream_ms` int DEFAULT NULL COMMENT '首行数据到流结束的耗时（毫秒）',
+  `result_download_ms` int DEFAULT NULL COMMENT '结果图下载耗时（毫秒），流式转存时只含响应头和文件头',
+  `watermark_ms` int DEFAULT NULL COMMENT '添加水印耗时（毫秒）',
+  `result_upload_ms` int DEFAULT NULL COMMENT '结果图上传耗时（毫秒），流式转存时包含剩余的下载',
+  `total_ms` int DEFAULT NULL COMMENT '从创建作品到结束的总耗时（毫秒）',
+  `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否删除：0-否，1-是',
+  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_artwork_id` (`artwork_id`),
+  KEY `idx_timing_created_at` (`created_at`),
+  CONSTRAINT `artwork_timings_ibfk_1` FOREIGN KEY (`artwork_id`) REFERENCES `artworks` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='作品生成分阶段耗时表';
+
 
 
 /*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;